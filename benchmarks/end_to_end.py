@@ -0,0 +1,357 @@
+"""End-to-end client overhead: front-end paths against the mock server.
+
+Drives the real request paths headlessly against benchmarks/mock_ollama.py,
+run in a child process so only client work is measured:
+
+  req        chat-llama-req.py make_request (stdlib one-shot transport)
+  streamlit  chat-llama-streamlit.py send_request (bare mode, per-thread
+             session state, pooled requests client)
+  tk         chat-llama-gui.py _process_request + _poll_events (shared
+             StreamWorker, FrameRenderer on a stand-in Text widget)
+
+For 1, 8 and 64 concurrent streams it reports client CPU per token, time
+to the first rendered token, and aggregate token throughput.
+
+    python benchmarks/end_to_end.py [--paths req,streamlit,tk]
+        [--streams 1,8,64] [--requests 4] [--tokens 256] [--rate 0] [--ttft 0]
+"""
+
+import argparse
+import heapq
+import itertools
+import logging
+import math
+import os
+import queue
+import runpy
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import mock_ollama
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS = ROOT / "src" / "scripts"
+MODEL = "llama3.2"
+PROMPT = "Explain what a connection pool is in a few paragraphs."
+
+
+class Result:
+    """One request as the front-end saw it"""
+
+    __slots__ = ("started", "first", "tokens", "ok")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first = None
+        self.tokens = 0
+        self.ok = False
+
+    def rendered(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+
+
+class State(dict):
+    """Per-stream attribute bag, like st.session_state"""
+
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+
+def run_threads(streams: int, requests: int, one_request):
+    """`streams` threads each issuing `requests` sequential requests"""
+    results = []
+    lock = threading.Lock()
+
+    def worker(index):
+        state = State()
+        for _ in range(requests):
+            result = one_request(index, state)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# --- req: make_request ---------------------------------------------------
+
+
+def req_path():
+    module = runpy.run_path(str(SCRIPTS / "chat-llama-req.py"), run_name="bench")
+    current = threading.local()
+
+    class TimedTextStream(module["TextStream"]):
+        def __iter__(self):
+            for text in super().__iter__():
+                current.result.rendered()
+                yield text
+            current.result.tokens = (self.final or {}).get("eval_count", 0)
+
+    # run_path returns a copy of the script's globals; patch the live ones
+    make_request = module["make_request"]
+    make_request.__globals__["TextStream"] = TimedTextStream
+
+    def one_request(index, state):
+        current.result = result = Result()
+        text = make_request(PROMPT, MODEL)
+        result.ok = text is not None
+        return result
+
+    return lambda streams, requests: run_threads(streams, requests, one_request)
+
+
+# --- streamlit: send_request ---------------------------------------------
+
+
+class _StreamlitProxy:
+    """The real streamlit module, minus its process-wide bare-mode state
+
+    Each thread gets its own session_state, like separate browser
+    sessions, and placeholders report when they first draw text.
+    """
+
+    def __init__(self, st):
+        self._st = st
+        self._local = threading.local()
+
+    @property
+    def session_state(self):
+        return self._local.state
+
+    def bind(self, state, result):
+        self._local.state = state
+        self._local.result = result
+
+    def empty(self):
+        placeholder = self._st.empty()
+        result = self._local.result
+        markdown = placeholder.markdown
+
+        def timed_markdown(body, *args, **kwargs):
+            if body.strip("▌"):
+                result.rendered()
+            return markdown(body, *args, **kwargs)
+
+        placeholder.markdown = timed_markdown
+        return placeholder
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
+
+
+def streamlit_path():
+    module = runpy.run_path(str(SCRIPTS / "chat-llama-streamlit.py"), run_name="bench")
+    # Bare mode warns on every element call from a non-main thread
+    logging.getLogger(
+        "streamlit.runtime.scriptrunner_utils.script_run_context"
+    ).addFilter(lambda record: "missing ScriptRunContext" not in record.msg)
+    from chat_llama.session import Session
+
+    proxy = _StreamlitProxy(module["st"])
+    send_request = module["send_request"]
+    send_request.__globals__["st"] = proxy
+
+    def one_request(index, state):
+        if "session" not in state:
+            state.update(session=Session(MODEL), history=[], caller=str(index))
+        result = Result()
+        proxy.bind(state, result)
+        send_request(MODEL, PROMPT)
+        result.ok = bool(state.history) and state.history[-1]["response"] != ""
+        result.tokens = state.session.last_stats.get("eval_count", 0)
+        return result
+
+    return lambda streams, requests: run_threads(streams, requests, one_request)
+
+
+# --- tk: _process_request ------------------------------------------------
+
+
+class _HeadlessRoot:
+    """Just enough of Tk's event loop to run the GUI's after() callbacks"""
+
+    def __init__(self):
+        self._timers = []
+        self._seq = itertools.count()
+
+    def after(self, ms, callback, *args):
+        due = time.perf_counter() + ms / 1000
+        heapq.heappush(self._timers, (due, next(self._seq), callback, args))
+
+    def run(self, until):
+        while not until() and self._timers:
+            due, _, callback, args = heapq.heappop(self._timers)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            callback(*args)
+
+
+class _Text:
+    """Stand-in for tk.Text: holds the text, reports the first insert"""
+
+    def __init__(self, text=""):
+        self.parts = [text]
+        self.on_insert = None
+
+    def get(self, start, end):
+        return "".join(self.parts)
+
+    def insert(self, index, text):
+        if self.on_insert is not None:
+            self.on_insert()
+        self.parts.append(text)
+
+    def delete(self, start, end):
+        self.parts = []
+
+    def yview(self):
+        return (0.0, 1.0)
+
+    def see(self, index):
+        pass
+
+
+class _Var:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class _Button:
+    def state(self, flags):
+        pass
+
+
+def tk_path():
+    module = runpy.run_path(str(SCRIPTS / "chat-llama-gui.py"), run_name="bench")
+    from chat_llama.history import ConversationRecorder, get_history
+    from chat_llama.render import FrameRenderer
+    from chat_llama.session import Session
+
+    gui_class = module["OllamaGUI"]
+
+    def run(streams, requests):
+        root = _HeadlessRoot()
+        results = []
+        pending = [streams]
+
+        def start(gui, remaining):
+            result = Result()
+            results.append(result)
+            gui.response_text.delete(1.0, "end")
+            gui.response_text.on_insert = result.rendered
+            gui.renderer.reset()
+
+            def completed(status_message):
+                result.ok = status_message.startswith("Request completed")
+                result.tokens = gui.session.last_stats.get("eval_count", 0)
+                if remaining > 1:
+                    start(gui, remaining - 1)
+                else:
+                    pending[0] -= 1
+
+            gui._request_completed = completed
+            gui._process_request()
+
+        for _ in range(streams):
+            # Build the GUI object without a display: same state as __init__
+            gui = gui_class.__new__(gui_class)
+            gui.root = root
+            gui.events = queue.Queue()
+            gui.request_id = None
+            gui.input_text = _Text(PROMPT)
+            gui.model_var = _Var(MODEL)
+            gui.status_var = _Var()
+            gui.send_button = _Button()
+            gui.response_text = _Text()
+            gui.renderer = FrameRenderer(gui.response_text, module["FRAME_INTERVAL_MS"])
+            gui.session = Session(MODEL)
+            gui.history = ConversationRecorder(get_history())
+            start(gui, requests)
+        root.run(until=lambda: pending[0] == 0)
+        return results
+
+    return run
+
+
+PATHS = {"req": req_path, "streamlit": streamlit_path, "tk": tk_path}
+
+
+def report(path, streams, results, cpu, wall, ttft_floor):
+    ok = [r for r in results if r.ok]
+    tokens = sum(r.tokens for r in ok)
+    firsts = sorted((r.first - r.started) * 1000 for r in ok if r.first)
+    p50 = statistics.median(firsts) if firsts else float("nan")
+    p95 = firsts[math.ceil(len(firsts) * 0.95) - 1] if firsts else float("nan")
+    print(
+        f"{path:10} {streams:4d} {len(ok):5d}/{len(results):<5d}"
+        f" {cpu / max(tokens, 1) * 1e6:9.1f} {p50 - ttft_floor:9.1f}"
+        f" {p95 - ttft_floor:9.1f} {tokens / wall:11.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--streams", default="1,8,64")
+    parser.add_argument("--requests", type=int, default=4, help="per stream")
+    parser.add_argument("--tokens", type=int, default=256, help="per response")
+    parser.add_argument("--rate", type=float, default=0.0, help="tokens/s per stream")
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--ttft", type=float, default=0.0, help="server-side seconds")
+    opts = parser.parse_args()
+
+    config = mock_ollama.MockConfig(
+        tokens=opts.tokens,
+        token_rate=opts.rate,
+        chunk_tokens=opts.chunk_tokens,
+        ttft=opts.ttft,
+    )
+    process, url = mock_ollama.spawn(config)
+    home = tempfile.TemporaryDirectory()
+    # chat_llama reads these at import time, so set them first
+    os.environ.update(OLLAMA_HOST=url, HOME=home.name)
+    # The mock has no GPU to protect: measure the clients, not the scheduler
+    os.environ.setdefault("CHAT_LLAMA_MAX_IN_FLIGHT", "1024")
+    os.environ.pop("CHAT_LLAMA_CACHE", None)
+    sys.path.insert(0, str(ROOT / "src"))
+
+    print(f"mock server {url}: {opts.tokens} tokens/response, ttft {opts.ttft}s")
+    print("TTFT columns are client-side: the mock's configured ttft is subtracted")
+    print(
+        f"{'path':10} {'strm':>4} {'ok/total':>11} {'cpu us/tok':>9}"
+        f" {'ttft p50':>9} {'ttft p95':>9} {'tokens/s':>11}"
+    )
+    try:
+        for path in opts.paths.split(","):
+            run = PATHS[path]()
+            run(1, 1)  # warm-up: imports, first connection, model "load"
+            for streams in (int(s) for s in opts.streams.split(",")):
+                cpu, wall = time.process_time(), time.perf_counter()
+                results = run(streams, opts.requests)
+                cpu = time.process_time() - cpu
+                wall = time.perf_counter() - wall
+                report(path, streams, results, cpu, wall, opts.ttft * 1000)
+    finally:
+        process.terminate()
+        process.wait()
+        home.cleanup()
+
+
+if __name__ == "__main__":
+    main()
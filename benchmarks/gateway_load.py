@@ -0,0 +1,203 @@
+"""Load test for `chat-llama serve` against the mock server.
+
+Starts benchmarks/mock_ollama.py and the gateway in child processes, then
+runs waves of concurrent streaming /v1/chat/completions requests. In each
+wave every client asks one of `--prompts` distinct questions (temperature
+0, so identical ones coalesce onto one upstream generation). For each
+prompt count it reports request throughput, client-side time to first
+token, and how many generations the mock actually ran for the requests
+sent; with --prompts equal to --clients nothing can coalesce.
+
+    python benchmarks/gateway_load.py [--clients 64] [--prompts 1,8,64]
+        [--waves 4] [--tokens 128] [--rate 200] [--in-flight 4]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+import mock_ollama
+
+ROOT = Path(__file__).resolve().parents[1]
+MODEL = "llama3.2"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_gateway(ollama_url: str, home: str, in_flight: int):
+    port = free_port()
+    env = {
+        **os.environ,
+        "OLLAMA_HOST": ollama_url,
+        "HOME": home,
+        "PYTHONPATH": str(ROOT / "src"),
+        "CHAT_LLAMA_MAX_IN_FLIGHT": str(in_flight),
+        # Waiting clients queue rather than fail: this measures throughput
+        "CHAT_LLAMA_MAX_QUEUE": "100000",
+        "CHAT_LLAMA_METRICS_LOG": "0",
+    }
+    env.pop("CHAT_LLAMA_CACHE", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "chat_llama.cli", "serve", f"--port={port}"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(session, url: str, process):
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError("gateway exited during startup")
+        try:
+            async with session.get(f"{url}/gateway/stats") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientConnectionError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError("gateway did not start")
+
+
+async def get_json(session, url: str) -> dict:
+    async with session.get(url) as response:
+        return await response.json()
+
+
+async def one(session, url: str, prompt: str) -> dict:
+    body = {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0,
+        "stream": True,
+    }
+    started = time.perf_counter()
+    first = None
+    tokens = 0
+    async with session.post(f"{url}/v1/chat/completions", json=body) as response:
+        if response.status != 200:
+            return {"ok": False, "status": response.status}
+        async for line in response.content:
+            if not line.startswith(b"data: "):
+                continue
+            data = line[6:].strip()
+            if data == b"[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                return {"ok": False, "status": event["error"]["code"]}
+            choices = event.get("choices") or [{}]
+            if choices[0].get("delta", {}).get("content"):
+                tokens += 1
+                if first is None:
+                    first = time.perf_counter() - started
+    return {
+        "ok": True,
+        "ttft": first,
+        "total": time.perf_counter() - started,
+        "tokens": tokens,
+    }
+
+
+async def run(opts, mock_url: str, url: str, process):
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await wait_ready(session, url, process)
+        await one(session, url, "warm-up")  # model "load", first connection
+        print(
+            f"{'prompts':>7} {'clients':>7} {'ok/total':>11} {'req/s':>8}"
+            f" {'ttft p50':>9} {'ttft p95':>9} {'upstream':>8} {'coalesced':>9}"
+        )
+        for prompts in (int(p) for p in opts.prompts.split(",")):
+            before = await get_json(session, f"{mock_url}/mock/stats")
+            gateway_before = await get_json(session, f"{url}/gateway/stats")
+            results = []
+            wall = time.perf_counter()
+            for wave in range(opts.waves):
+                # Fresh prompts per wave, so the response cache never answers
+                results += await asyncio.gather(
+                    *(
+                        one(
+                            session,
+                            url,
+                            f"question {c % prompts} of wave {wave}/{prompts}",
+                        )
+                        for c in range(opts.clients)
+                    )
+                )
+            wall = time.perf_counter() - wall
+            after = await get_json(session, f"{mock_url}/mock/stats")
+            gateway_after = await get_json(session, f"{url}/gateway/stats")
+            report(
+                prompts,
+                opts.clients,
+                results,
+                wall,
+                after.get("requests", 0) - before.get("requests", 0),
+                gateway_after["coalesced"] - gateway_before["coalesced"],
+            )
+
+
+def report(prompts, clients, results, wall, upstream, coalesced):
+    ok = [r for r in results if r["ok"]]
+    firsts = sorted(r["ttft"] * 1000 for r in ok if r["ttft"] is not None)
+    p50 = statistics.median(firsts) if firsts else float("nan")
+    p95 = firsts[math.ceil(len(firsts) * 0.95) - 1] if firsts else float("nan")
+    print(
+        f"{prompts:7d} {clients:7d} {len(ok):5d}/{len(results):<5d}"
+        f" {len(results) / wall:8.1f} {p50:9.1f} {p95:9.1f}"
+        f" {upstream:8d} {coalesced:9d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=64, help="concurrent streams")
+    parser.add_argument("--prompts", default="1,8,64", help="distinct prompts")
+    parser.add_argument("--waves", type=int, default=4, help="rounds of requests")
+    parser.add_argument("--tokens", type=int, default=128, help="per response")
+    parser.add_argument("--rate", type=float, default=200.0, help="tokens/s per stream")
+    parser.add_argument("--ttft", type=float, default=0.0, help="server-side seconds")
+    parser.add_argument(
+        "--in-flight", type=int, default=4, help="CHAT_LLAMA_MAX_IN_FLIGHT"
+    )
+    opts = parser.parse_args()
+
+    config = mock_ollama.MockConfig(
+        tokens=opts.tokens, token_rate=opts.rate, ttft=opts.ttft
+    )
+    mock, mock_url = mock_ollama.spawn(config)
+    home = tempfile.TemporaryDirectory()
+    gateway, url = spawn_gateway(mock_url, home.name, opts.in_flight)
+    print(
+        f"mock server {mock_url}: {opts.tokens} tokens at {opts.rate} tokens/s;"
+        f" gateway {url} with {opts.in_flight} upstream streams in flight"
+    )
+    print("ttft is client-side, in ms; upstream counts the mock's generations")
+    try:
+        asyncio.run(run(opts, mock_url, url, gateway))
+    finally:
+        for process in (gateway, mock):
+            process.terminate()
+            process.wait()
+        home.cleanup()
+
+
+if __name__ == "__main__":
+    main()
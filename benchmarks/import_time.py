@@ -0,0 +1,142 @@
+"""Cold-start cost of one-shot chat-llama prompts, as a shell loop sees it.
+
+Starts a stub server that answers instantly, then times fresh interpreters
+running `python -m chat_llama ask ...`, so the numbers are client start-up
+only. Also lists the slowest imports on that path and any heavy modules
+(requests, aiohttp, tkinter, streamlit) that crept onto it.
+
+    python benchmarks/import_time.py [--runs 20] [--budget-ms 60]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+HEAVY = ("requests", "urllib3", "aiohttp", "tkinter", "streamlit")
+
+
+class _Stub(BaseHTTPRequestHandler):
+    def _reply(self, body: bytes, content_type="application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(json.dumps({"models": [{"name": "llama3.2:latest"}]}).encode())
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/api/generate":
+            self._reply(b"{}")
+            return
+        lines = [{"response": "ok", "done": False}, {"response": "", "done": True}]
+        body = b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+        self._reply(body, "application/x-ndjson")
+
+    def log_message(self, *args):
+        pass
+
+
+def timed_runs(argv, env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(argv, env=env, check=True, stdout=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def import_profile(argv, env):
+    """(name, cumulative us) for every module the command imports"""
+    result = subprocess.run(
+        [argv[0], "-X", "importtime", *argv[1:]],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.append((name, int(cumulative)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="exit non-zero if the median ask overhead exceeds this",
+    )
+    opts = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    home = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "OLLAMA_HOST": f"http://127.0.0.1:{server.server_port}",
+        # Keep the stub's model list out of the real registry cache
+        "HOME": home.name,
+    }
+    env.pop("CHAT_LLAMA_CACHE", None)
+
+    ask = [sys.executable, "-m", "chat_llama", "ask", "-m", "llama3.2", "hi"]
+    runs = [
+        ("python -c pass", [sys.executable, "-c", "pass"]),
+        ("chat-llama ask -m MODEL", ask),
+        ("chat-llama ask (default model)", ask[:4] + ["hi"]),
+        ("import pooled client", [sys.executable, "-c", "import chat_llama.client"]),
+    ]
+    # Prime the registry cache and the OS page cache before timing
+    for _, argv in runs:
+        subprocess.run(argv, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    baseline = None
+    medians = {}
+    for name, argv in runs:
+        samples = timed_runs(argv, env, opts.runs)
+        median = statistics.median(samples)
+        baseline = median if baseline is None else baseline
+        medians[name] = median
+        print(
+            f"{name:32} {median:7.1f} ms median  "
+            f"{sorted(samples)[int(len(samples) * 0.9) - 1]:7.1f} ms p90  "
+            f"(+{median - baseline:.1f} ms over bare python)"
+        )
+
+    modules = import_profile(ask, env)
+    # importtime indents nested imports by two spaces per level
+    top = [(n.strip(), us) for n, us in modules if not n.startswith("  ")]
+    print("\nslowest top-level imports on the ask path:")
+    for name, us in sorted(top, key=lambda m: -m[1])[:8]:
+        print(f"  {name:28} {us / 1000:6.1f} ms")
+    loaded = sorted({n.strip() for n, _ in modules if n.strip().split(".")[0] in HEAVY})
+    print(f"heavy modules on the ask path: {', '.join(loaded) or 'none'}")
+
+    server.shutdown()
+    home.cleanup()
+    overhead = medians["chat-llama ask -m MODEL"] - baseline
+    if loaded or (opts.budget_ms is not None and overhead > opts.budget_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""Stand-in Ollama server for benchmarking the clients without a model.
+
+Serves /api/generate and /api/chat as realistic NDJSON streams (chunked,
+one line per token by default, Ollama's final-chunk stats and context),
+plus /api/tags, /api/ps, /api/show, /api/embed and load-only generate
+calls. Token rate, write size, time to first token and failures are
+configurable. Embeddings are hashed bags of words: texts sharing most of
+their words get nearby vectors, which is enough to exercise a vector
+index.
+
+    python benchmarks/mock_ollama.py --port 11435 --rate 50 --ttft 0.2
+    OLLAMA_HOST=http://127.0.0.1:11435 chat-llama "hello"
+
+Other benchmarks import MockConfig/MockOllama, or spawn() it in its own
+process so its CPU time stays out of the client's measurements.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+WORDS = (
+    ["The", " model", " answered", " with", " a", " short", " list", ":", "\n"]
+    + [" -", " one", " two", " three", ",", " and", " more", ".", "\n\n"]
+    + ["```", "python", "\n", "print", "(", "'hi'", ")", "\n", "```", " é", " 🙂"]
+)
+EMBED_DIM = 256
+# A Go time.Duration string, which is how Ollama parses a string keep_alive
+_DURATION = re.compile(r"[-+]?((\d+(\.\d*)?|\.\d+)(ns|us|µs|ms|s|m|h))+|[-+]?0")
+
+
+@dataclass
+class MockConfig:
+    tokens: int = 128  # per response; a request's num_predict option wins
+    token_rate: float = 0.0  # tokens/s per stream, 0 = as fast as possible
+    chunk_tokens: int = 1  # token lines per write; Ollama flushes every token
+    ttft: float = 0.0  # seconds of simulated prompt evaluation
+    load_time: float = 0.0  # paid once per model, on its first request
+    error_rate: float = 0.0  # fraction of requests answered with HTTP 500
+    drop_rate: float = 0.0  # fraction of streams cut off mid-response
+    models: list = field(default_factory=lambda: ["llama3.2:latest", "llama3.1:8b"])
+    seed: Optional[int] = None
+
+
+def _model_key(name: str) -> str:
+    return name if ":" in name else f"{name}:latest"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockOllama"
+
+    def setup(self):
+        super().setup()
+        # Like Ollama (Go sets TCP_NODELAY): without it, Nagle holds each
+        # small token write until the client's delayed ACK, ~40 ms later
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        mock = self.server
+        if self.path == "/api/tags":
+            self._json({"models": [_tag(name) for name in mock.config.models]})
+        elif self.path == "/api/ps":
+            self._json({"models": [_tag(name) for name in sorted(mock.loaded)]})
+        elif self.path == "/api/version":
+            self._json({"version": "0.0.0-mock"})
+        elif self.path == "/mock/stats":
+            self._json(mock.stats())
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json({"error": "invalid JSON"}, 400)
+            return
+        if self.path == "/api/show":
+            self._json({"model_info": {"llama.context_length": 131072}})
+        elif self.path in ("/api/generate", "/api/chat"):
+            self._generate(body, chat=self.path == "/api/chat")
+        elif self.path == "/api/embed":
+            self.server.count("embeds")
+            texts = body.get("input", "")
+            texts = [texts] if isinstance(texts, str) else texts
+            self._json(
+                {
+                    "model": body.get("model", ""),
+                    "embeddings": [_embedding(text) for text in texts],
+                    "prompt_eval_count": sum(len(t.split()) for t in texts),
+                }
+            )
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _generate(self, body: dict, chat: bool):
+        mock = self.server
+        config = mock.config
+        model = body.get("model", "")
+        keep_alive = body.get("keep_alive")
+        if isinstance(keep_alive, str) and not _DURATION.fullmatch(keep_alive):
+            # Ollama answers a unitless string such as "-1" the same way
+            self._json({"error": f'time: missing unit in duration "{keep_alive}"'}, 400)
+            return
+        load_ns = mock.load(model)
+        if not chat and "prompt" not in body:
+            self._json({**_final(model, chat, load_ns=load_ns), "done_reason": "load"})
+            return
+        mock.count("requests")
+        if mock.roll(config.error_rate):
+            mock.count("errors")
+            self._json({"error": "mock failure"}, 500)
+            return
+
+        tokens = (body.get("options") or {}).get("num_predict") or config.tokens
+        prompt_tokens = _prompt_tokens(body, chat)
+        if not body.get("stream", True):
+            time.sleep(
+                config.ttft + (tokens / config.token_rate if config.token_rate else 0)
+            )
+            words = [mock.word() for _ in range(tokens)]
+            final = _final(model, chat, prompt_tokens, tokens, load_ns, body, config)
+            final.update(_text(chat, "".join(words)))
+            self._json(final)
+            return
+
+        try:
+            self._stream(body, model, chat, tokens, prompt_tokens, load_ns)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up (a Stop button): stop generating, as Ollama does
+            mock.count("aborted")
+            self.close_connection = True
+
+    def _stream(self, body, model, chat, tokens, prompt_tokens, load_ns):
+        mock = self.server
+        config = mock.config
+        drop_at = mock.rng_int(tokens) if mock.roll(config.drop_rate) else None
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        started = time.perf_counter()
+        first = started + config.ttft
+        batch = []
+        for i in range(tokens):
+            if i == drop_at:
+                # Abandon the response mid-stream, as a crashed server would
+                mock.count("drops")
+                self.close_connection = True
+                return
+            line = {"model": model, "created_at": _now(), **_text(chat, mock.word())}
+            line["done"] = False
+            batch.append(json.dumps(line).encode() + b"\n")
+            if len(batch) < config.chunk_tokens and i + 1 < tokens:
+                continue
+            due = first + (i + 1) / config.token_rate if config.token_rate else first
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._chunk(b"".join(batch))
+            batch = []
+        final = _final(model, chat, prompt_tokens, tokens, load_ns, body, config)
+        final["eval_duration"] = int((time.perf_counter() - first) * 1e9)
+        final["total_duration"] = int((time.perf_counter() - started) * 1e9) + load_ns
+        self._chunk(json.dumps(final).encode() + b"\n")
+        self.wfile.write(b"0\r\n\r\n")
+        mock.count("completed")
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _tag(name: str) -> dict:
+    return {
+        "name": name,
+        "model": name,
+        "size": 2_000_000_000,
+        "details": {"parameter_size": "3.2B", "quantization_level": "Q4_K_M"},
+    }
+
+
+def _embedding(text: str) -> list:
+    vector = [0.0] * EMBED_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        vector[int.from_bytes(digest, "little") % EMBED_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _text(chat: bool, text: str) -> dict:
+    if chat:
+        return {"message": {"role": "assistant", "content": text}}
+    return {"response": text}
+
+
+def _prompt_tokens(body: dict, chat: bool) -> int:
+    if chat:
+        text = " ".join(m.get("content", "") for m in body.get("messages", []))
+    else:
+        # With a context, Ollama only evaluates the new prompt
+        text = " ".join([body.get("system") or "", body.get("prompt", "")])
+    return max(1, len(text.split()))
+
+
+def _final(model, chat, prompt_tokens=0, tokens=0, load_ns=0, body=None, config=None):
+    final = {
+        "model": model,
+        "created_at": _now(),
+        **_text(chat, ""),
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": load_ns,
+        "load_duration": load_ns,
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int((config.ttft if config else 0) * 1e9),
+        "eval_count": tokens,
+        "eval_duration": 0,
+    }
+    if body is not None and not chat:
+        context = list(body.get("context") or [])
+        final["context"] = context + list(range(prompt_tokens + tokens))
+    return final
+
+
+class MockOllama(ThreadingHTTPServer):
+    """In-process mock server; call start() to serve on a daemon thread"""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, config: Optional[MockConfig] = None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self.loaded = set()
+        self._counts = {
+            "requests": 0,
+            "completed": 0,
+            "errors": 0,
+            "drops": 0,
+            "aborted": 0,
+            "embeds": 0,
+        }
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllama":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self, model: str) -> int:
+        """Simulate loading `model`; returns the load time in ns"""
+        key = _model_key(model)
+        with self._lock:
+            cold = key not in self.loaded
+            self.loaded.add(key)
+        if cold and self.config.load_time:
+            time.sleep(self.config.load_time)
+            return int(self.config.load_time * 1e9)
+        return 0
+
+    def roll(self, rate: float) -> bool:
+        if not rate:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def rng_int(self, n: int) -> int:
+        with self._lock:
+            return self._rng.randrange(max(1, n))
+
+    def word(self) -> str:
+        return WORDS[self._rng.randrange(len(WORDS))]
+
+    def count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "loaded": sorted(self.loaded)}
+
+
+def config_args(config: MockConfig) -> list:
+    """Command-line flags that reproduce `config` in a spawned server"""
+    return [
+        f"--tokens={config.tokens}",
+        f"--rate={config.token_rate}",
+        f"--chunk-tokens={config.chunk_tokens}",
+        f"--ttft={config.ttft}",
+        f"--load-time={config.load_time}",
+        f"--error-rate={config.error_rate}",
+        f"--drop-rate={config.drop_rate}",
+        *([f"--seed={config.seed}"] if config.seed is not None else []),
+    ]
+
+
+def spawn(config: Optional[MockConfig] = None):
+    """Run the mock in a child process; returns (process, base_url)"""
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--port=0", *config_args(config or MockConfig())],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError("mock server failed to start")
+    return process, line.split()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens", type=int, default=MockConfig.tokens)
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="tokens/s per stream (0: unthrottled)"
+    )
+    parser.add_argument(
+        "--chunk-tokens", type=int, default=1, help="token lines per network write"
+    )
+    parser.add_argument(
+        "--ttft", type=float, default=0.0, help="seconds to first token"
+    )
+    parser.add_argument("--load-time", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    opts = parser.parse_args()
+
+    config = MockConfig(
+        tokens=opts.tokens,
+        token_rate=opts.rate,
+        chunk_tokens=max(1, opts.chunk_tokens),
+        ttft=opts.ttft,
+        load_time=opts.load_time,
+        error_rate=opts.error_rate,
+        drop_rate=opts.drop_rate,
+        seed=opts.seed,
+    )
+    server = MockOllama(config, opts.host, opts.port)
+    print(f"listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
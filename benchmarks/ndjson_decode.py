@@ -0,0 +1,120 @@
+"""Client-side CPU per streamed token: iter_lines + json.loads vs NDJSONDecoder.
+
+Builds a synthetic Ollama /api/generate stream, cuts it into socket-sized
+pieces, and times how much CPU each decoding strategy spends per token.
+
+    python benchmarks/ndjson_decode.py [--tokens 20000] [--chunk 0]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from chat_llama import ndjson  # noqa: E402
+
+
+def synthetic_stream(tokens: int) -> bytes:
+    words = ["the", " model", " said", " hello", ",", " world", "\n", " and", " é"]
+    lines = [
+        json.dumps(
+            {
+                "model": "llama3.2",
+                "created_at": "2024-10-01T12:00:00.000000Z",
+                "response": random.choice(words),
+                "done": False,
+            }
+        )
+        for _ in range(tokens)
+    ]
+    lines.append(json.dumps({"model": "llama3.2", "done": True, "eval_count": tokens}))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def pieces(data: bytes, size: int):
+    if size == 0:
+        # Ollama flushes after every token, so reads usually hold one line
+        return data.splitlines(keepends=True)
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class _Raw:
+    """Stands in for urllib3's response: stream() hands out the same pieces"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, amt=None, decode_content=True):
+        return iter(self.chunks)
+
+
+def baseline(data: bytes, size: int) -> int:
+    # The original per-script loop: requests' iter_lines + json.loads per line
+    response = requests.Response()
+    response.raw = _Raw(pieces(data, size))
+    count = 0
+    for line in response.iter_lines():
+        if line:
+            json.loads(line).get("response", "")
+            count += 1
+    return count
+
+
+def decoder(data: bytes, size: int, loads) -> int:
+    ndjson.loads, saved = loads, ndjson.loads
+    try:
+        count = 0
+        for chunk in ndjson.decode(pieces(data, size)):
+            chunk.get("response", "")
+            count += 1
+        return count
+    finally:
+        ndjson.loads = saved
+
+
+def measure(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        count = fn(*args)
+        best = min(best, time.process_time() - started)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument(
+        "--chunk", type=int, default=0, help="bytes per read (0: one line per read)"
+    )
+    opts = parser.parse_args()
+
+    data = synthetic_stream(opts.tokens)
+    runs = [("iter_lines + json.loads", baseline, (data, opts.chunk))]
+    runs.append(
+        ("NDJSONDecoder (json)", decoder, (data, opts.chunk, ndjson.stdlib_loads))
+    )
+    if ndjson.BACKEND == "orjson":
+        runs.append(
+            ("NDJSONDecoder (orjson)", decoder, (data, opts.chunk, ndjson.orjson.loads))
+        )
+
+    reference = None
+    for name, fn, args in runs:
+        seconds, count = measure(fn, *args)
+        per_token = seconds / count * 1e6
+        reference = reference or per_token
+        print(
+            f"{name:26} {per_token:6.2f} us/token  "
+            f"({reference / per_token:4.1f}x, {count} lines)"
+        )
+
+
+if __name__ == "__main__":
+    main()
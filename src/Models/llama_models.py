@@ -1,17 +1,238 @@
 import enum
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from chat_llama.config import DEFAULT_BASE_URL
+
+if TYPE_CHECKING:
+    from chat_llama.client import OllamaClient
+
+DEFAULT_REGISTRY_PATH = Path.home() / ".cache" / "chat_llama" / "models.json"
+DEFAULT_REGISTRY_TTL = float(os.environ.get("CHAT_LLAMA_MODELS_TTL", 3600))
 
 
 class Models(enum.Enum):
+    LLAMA3_2 = "llama3.2"
     LLAMA3_1_8B = "llama3.1:8b"
     LLAMA3_1_70B = "llama3.1:70b"
     LLAMA3_1_405B = "llama3.1:405b"
-    LLAMA3_2 = "llama3.2"
 
+    l32 = LLAMA3_2
     l318 = LLAMA3_1_8B
     l3170 = LLAMA3_1_70B
     l31405 = LLAMA3_1_405B
-    l32 = LLAMA3_2
 
-    llamas = (l32, l318, l3170, l31405)
+    @classmethod
+    def default(cls):
+        return cls.LLAMA3_2
+
+    @classmethod
+    def numbered(cls) -> list:
+        """Names in a fixed order for picking a model by index
+
+        The installed list follows the server's /api/tags order and
+        includes embedding models, so it can't back stable indices.
+        """
+        return [model.value for model in cls]
+
+
+@dataclass
+class ModelInfo:
+    """What the server reports about one installed model"""
+
+    name: str
+    size: int = 0
+    parameter_size: str = ""
+    quantization: str = ""
+    context_length: Optional[int] = None
+    installed: bool = True
+
+
+class ModelRegistry:
+    """Installed models from the server, cached on disk
+
+    models() never waits on the network: it serves the disk cache (or the
+    built-in Models list on first run) and refreshes in the background
+    once the cache is older than the TTL. The refresh runs on a daemon
+    thread, so a process that exits mid-refresh doesn't wait for it. The
+    HTTP client is only created for a refresh, so reading the cache stays
+    cheap for one-shot commands.
+    """
+
+    def __init__(
+        self,
+        client: Optional["OllamaClient"] = None,
+        path=DEFAULT_REGISTRY_PATH,
+        ttl: float = DEFAULT_REGISTRY_TTL,
+    ):
+        self._client = client
+        self.base_url = client.base_url if client else DEFAULT_BASE_URL
+        self.path = Path(path)
+        self.ttl = ttl
+        self._models = None
+        self._fetched = 0.0
+        self._refreshing: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def client(self) -> "OllamaClient":
+        if self._client is None:
+            from chat_llama.client import get_client
+
+            self._client = get_client()
+        return self._client
+
+    def _load(self):
+        try:
+            cached = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        # A cache written for another server says nothing about this one
+        if cached.get("base_url") == self.base_url:
+            self._models = [ModelInfo(**m) for m in cached["models"]]
+            self._fetched = cached["fetched"]
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "base_url": self.base_url,
+                    "fetched": self._fetched,
+                    "models": [asdict(m) for m in self._models],
+                }
+            ),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+
+    def _context_length(self, name: str, backend=None) -> Optional[int]:
+        info = self.client.post("/api/show", {"model": name}, backend=backend).json()
+        for key, value in info.get("model_info", {}).items():
+            if key.endswith(".context_length"):
+                return value
+        return None
+
+    def _tags(self) -> list:
+        """(backend, tag) for each model installed on any backend"""
+        import requests
+
+        tags = {}
+        error = None
+        answered = False
+        for backend in self.client.backends.backends:
+            try:
+                found = self.client.get("/api/tags", backend=backend).json()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            answered = True
+            for tag in found.get("models", []):
+                tags.setdefault(tag["name"], (backend, tag))
+        if not answered:
+            raise error
+        return list(tags.values())
+
+    def refresh(self) -> list:
+        """Query /api/tags (and /api/show per model) on every backend"""
+        import requests
+
+        models = []
+        for backend, tag in self._tags():
+            details = tag.get("details", {})
+            try:
+                context_length = self._context_length(tag["name"], backend)
+            except requests.exceptions.RequestException:
+                context_length = None
+            models.append(
+                ModelInfo(
+                    name=tag["name"],
+                    size=tag.get("size", 0),
+                    parameter_size=details.get("parameter_size", ""),
+                    quantization=details.get("quantization_level", ""),
+                    context_length=context_length,
+                )
+            )
+        with self._lock:
+            self._models = models
+            self._fetched = time.time()
+            self._save()
+        return models
+
+    def _refresh_quietly(self):
+        import requests
+
+        try:
+            self.refresh()
+        except (requests.exceptions.RequestException, OSError):
+            pass
+
+    def _refresh_into(self, future: Future):
+        try:
+            self._refresh_quietly()
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    def refresh_async(self) -> Future:
+        with self._lock:
+            if self._refreshing is None or self._refreshing.done():
+                # Not an executor: interpreter exit joins executor threads
+                self._refreshing = Future()
+                threading.Thread(
+                    target=self._refresh_into,
+                    args=(self._refreshing,),
+                    name="chat-llama-models",
+                    daemon=True,
+                ).start()
+            return self._refreshing
+
+    def models(self, refresh: bool = True) -> list:
+        """Installed models; refresh=False never starts a background refresh"""
+        stale = self._models is None or time.time() - self._fetched > self.ttl
+        if refresh and stale:
+            self.refresh_async()
+        if self._models:
+            return self._models
+        return [ModelInfo(model.value, installed=False) for model in Models]
+
+    def names(self, refresh: bool = True) -> list:
+        return [m.name for m in self.models(refresh)]
+
+    def info(self, name: str, refresh: bool = True) -> Optional[ModelInfo]:
+        candidates = (name, name if ":" in name else f"{name}:latest")
+        for m in self.models(refresh):
+            if m.name in candidates:
+                return m
+        return None
+
+    def default(self, refresh: bool = True) -> str:
+        """The default model, or the first listed one if it isn't installed"""
+        info = self.info(Models.default().value, refresh)
+        if info is not None:
+            return info.name
+        names = self.names(refresh)
+        return names[0] if names else Models.default().value
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
 
-    use = llamas[0]
+def get_registry() -> ModelRegistry:
+    """Return the process-wide model registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -0,0 +1 @@
+"""Shared client code for the chat_llama front-ends."""
@@ -0,0 +1,5 @@
+import sys
+
+from chat_llama.cli import main
+
+sys.exit(main())
@@ -0,0 +1,377 @@
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiohttp
+
+from chat_llama.backends import BackendPool, get_backends
+from chat_llama.cache import ResponseCache, default_cache, default_semantic_cache
+from chat_llama.config import (
+    DEFAULT_BASE_URL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_OPTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_READ_TIMEOUT,
+)
+from chat_llama.ndjson import NDJSONDecoder, loads
+from chat_llama.scheduler import INTERACTIVE, QueueFullError
+
+# Errors worth retrying on another backend while nothing has been delivered
+_FAILOVER_ERRORS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    aiohttp.ClientResponseError,
+    asyncio.TimeoutError,
+    QueueFullError,
+)
+
+
+def _fails_over(error: Exception) -> bool:
+    if isinstance(error, aiohttp.ClientResponseError):
+        # A 4xx (unknown model, bad request) would fail the same anywhere
+        return error.status >= 500
+    return True
+
+
+def _connect_timing() -> aiohttp.TraceConfig:
+    """Store new-connection time on the RequestMetrics passed as trace ctx"""
+
+    async def on_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_end(session, context, params):
+        metrics = context.trace_request_ctx
+        if metrics is not None:
+            metrics.connect_s = time.perf_counter() - context.connect_started
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(on_start)
+    trace.on_connection_create_end.append(on_end)
+    return trace
+
+
+class AsyncOllamaClient:
+    """aiohttp client for streaming Ollama responses inside an event loop"""
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        limit: int = DEFAULT_POOL_MAXSIZE,
+        options: Optional[dict] = None,
+        cache: Optional[ResponseCache] = None,
+        priority: int = INTERACTIVE,
+        backends: Optional[BackendPool] = None,
+        semantic_cache=None,
+    ):
+        # Routed across the pool like OllamaClient's streams
+        if backends is None:
+            backends = (
+                get_backends()
+                if base_url == DEFAULT_BASE_URL
+                else BackendPool([base_url])
+            )
+        self.backends = backends
+        self.base_url = backends.primary.base_url
+        self.options = DEFAULT_OPTIONS if options is None else options
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        # Streams wait for a slot on their backend's scheduler at this priority
+        self.priority = priority
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.limit = limit
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # The session binds to the running loop, so it is created lazily.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=self.timeout,
+                trace_configs=[_connect_timing()],
+            )
+        return self._session
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def payload(self, fields: dict) -> dict:
+        """Request body with the client's default options merged in"""
+        if self.options or fields.get("options"):
+            fields["options"] = {**self.options, **(fields.get("options") or {})}
+        return fields
+
+    def stream(
+        self,
+        path: str,
+        payload: dict,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+    ):
+        """POST a streaming request and yield each decoded NDJSON object
+
+        Both caches apply as in OllamaClient.stream, and `cache=False`
+        skips them. Uncached requests hold a scheduler slot. `metrics` (a
+        RequestMetrics) gets the queue wait, connect time and time to
+        first byte.
+        """
+        payload["stream"] = True
+        args = (path, payload, metrics, priority, caller)
+        if not cache:
+            return self._routed(*args)
+
+        def fetch():
+            if self.cache is not None:
+                return self.cache.astream(path, payload, lambda: self._routed(*args))
+            return self._routed(*args)
+
+        if self.semantic_cache is not None and path == "/api/generate":
+            return self.semantic_cache.astream(payload, self._embed, fetch, metrics)
+        return fetch()
+
+    async def _embed(self, body: dict) -> dict:
+        return {"embeddings": await self.embed(body["model"], body["input"])}
+
+    async def _routed(self, path, payload, metrics, priority, caller):
+        priority = self.priority if priority is None else priority
+        model = payload.get("model", "")
+        tried = []
+        while True:
+            backend = self.backends.choose(model, tried)
+            if metrics is not None:
+                metrics.attempt(backend.base_url)
+            delivered = False
+            try:
+                async with backend.scheduler.aslot(priority, caller, metrics):
+                    chunks = self._stream(backend.url(path), payload, metrics)
+                    try:
+                        async for chunk in chunks:
+                            delivered = True
+                            yield chunk
+                    finally:
+                        # Close the response before the slot goes to the next
+                        await chunks.aclose()
+                return
+            except _FAILOVER_ERRORS as e:
+                down = not isinstance(e, QueueFullError)
+                if (
+                    delivered
+                    or not _fails_over(e)
+                    or not self.backends.failed(backend, tried, down)
+                ):
+                    raise
+
+    async def _stream(self, url: str, payload: dict, metrics):
+        async with self.session.post(
+            url, json=payload, trace_request_ctx=metrics
+        ) as response:
+            response.raise_for_status()
+            if metrics is not None:
+                metrics.mark_headers(metrics.connect_s)
+            decoder = NDJSONDecoder()
+            try:
+                async for data in response.content.iter_any():
+                    for chunk in decoder.feed(data):
+                        yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                # Drop the connection instead of draining it for the pool:
+                # Ollama only stops generating once the socket closes
+                response.close()
+                raise
+            for chunk in decoder.close():
+                yield chunk
+
+    async def embed(
+        self,
+        model: str,
+        texts: list,
+        metrics=None,
+        priority=None,
+        caller="",
+        **fields,
+    ) -> list:
+        """POST /api/embed through the backend pool; one vector per text
+
+        Holds a scheduler slot and fails over like stream() does.
+        """
+        payload = {"model": model, "input": texts, **fields}
+        priority = self.priority if priority is None else priority
+        tried = []
+        while True:
+            backend = self.backends.choose(model, tried)
+            if metrics is not None:
+                metrics.attempt(backend.base_url)
+            try:
+                async with backend.scheduler.aslot(priority, caller, metrics):
+                    async with self.session.post(
+                        backend.url("/api/embed"),
+                        json=payload,
+                        trace_request_ctx=metrics,
+                    ) as response:
+                        response.raise_for_status()
+                        if metrics is not None:
+                            metrics.mark_headers(metrics.connect_s)
+                        return loads(await response.read())["embeddings"]
+            except _FAILOVER_ERRORS as e:
+                down = not isinstance(e, QueueFullError)
+                if not _fails_over(e) or not self.backends.failed(backend, tried, down):
+                    raise
+
+    def stream_generate(
+        self,
+        model: str,
+        prompt: str,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+        **fields,
+    ):
+        payload = self.payload({"model": model, "prompt": prompt, **fields})
+        return self.stream("/api/generate", payload, metrics, priority, caller, cache)
+
+    def stream_chat(
+        self,
+        model: str,
+        messages: list,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+        **fields,
+    ):
+        payload = self.payload({"model": model, "messages": messages, **fields})
+        return self.stream("/api/chat", payload, metrics, priority, caller, cache)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+@dataclass
+class StreamEvent:
+    """One message from the worker to a front-end's queue"""
+
+    request_id: int
+    kind: str  # "chunk", "done", "error" or "cancelled"
+    text: str = ""
+    data: dict = field(default_factory=dict)
+
+
+class StreamWorker:
+    """Single background event loop that runs every streaming request
+
+    Front-ends call submit() from their own thread and read StreamEvents
+    from the queue they passed in, so no thread is created per request.
+    """
+
+    def __init__(self, client: Optional[AsyncOllamaClient] = None, max_concurrent=4):
+        self.client = client or AsyncOllamaClient(
+            cache=default_cache(), semantic_cache=default_semantic_cache()
+        )
+        self.max_concurrent = max_concurrent
+        self.loop = asyncio.new_event_loop()
+        self._ids = itertools.count(1)
+        self._tasks = {}
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="chat-llama-stream-worker", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._limit = asyncio.Semaphore(self.max_concurrent)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    def submit(
+        self, out: queue.Queue, model: str, prompt: str, metrics=None, **fields
+    ) -> int:
+        """Queue a /api/generate stream; returns the request id used in events
+
+        A RequestMetrics passed as `metrics` is timed here, as chunks
+        arrive, and finished before the last event; recording it is left
+        to the caller, which may still mark rendering.
+        """
+        request_id = next(self._ids)
+        coro = self._generate(request_id, out, model, prompt, metrics, fields)
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self._tasks[request_id] = future
+        future.add_done_callback(lambda _: self._tasks.pop(request_id, None))
+        return request_id
+
+    def cancel(self, request_id: int):
+        future = self._tasks.get(request_id)
+        if future is not None:
+            future.cancel()
+
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def _generate(self, request_id, out, model, prompt, metrics, fields):
+        try:
+            async with self._limit:
+                chunks = self.client.stream_generate(model, prompt, metrics, **fields)
+                async for chunk in chunks:
+                    if chunk.get("done"):
+                        if metrics is not None:
+                            metrics.finish(chunk)
+                        out.put(StreamEvent(request_id, "done", data=chunk))
+                        continue
+                    text = chunk.get("response", "")
+                    if metrics is not None and text:
+                        metrics.mark_token()
+                    out.put(StreamEvent(request_id, "chunk", text))
+        except asyncio.CancelledError:
+            if metrics is not None:
+                metrics.finish(outcome="cancelled")
+            out.put(StreamEvent(request_id, "cancelled"))
+            raise
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            ValueError,
+            QueueFullError,
+        ) as e:
+            if metrics is not None:
+                metrics.finish(outcome="error", error=str(e))
+            out.put(StreamEvent(request_id, "error", f"Request failed: {e}"))
+        except Exception as e:
+            # Anything else (a cache's sqlite3.Error, a bare OSError, ...)
+            # must still end the request, or the front-end waits forever
+            if metrics is not None:
+                metrics.finish(outcome="error", error=repr(e))
+            out.put(StreamEvent(request_id, "error", f"Request failed: {e!r}"))
+
+    def shutdown(self):
+        for future in list(self._tasks.values()):
+            future.cancel()
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+_worker: Optional[StreamWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> StreamWorker:
+    """Return the process-wide stream worker, starting it on first use"""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = StreamWorker()
+    return _worker
@@ -0,0 +1,169 @@
+"""Spread requests over several Ollama hosts
+
+CHAT_LLAMA_BACKENDS lists the hosts (comma-separated; default OLLAMA_HOST).
+With more than one, a background thread probes each every
+CHAT_LLAMA_PROBE_INTERVAL seconds for health (GET /api/ps) and the models
+it has installed (GET /api/tags) and loaded (/api/ps). choose() routes a
+request to the least-busy healthy host that already has its model loaded,
+falling back to hosts that have it installed, then to any healthy host,
+so a request only pays for a cold load when no host has the model warm.
+
+Busy-ness is the process's own outstanding requests per host: those in
+flight plus those queued on that host's Scheduler. The pooled clients
+fail a stream over to another host when its backend errors before any
+chunk was delivered; after that the error surfaces as usual.
+"""
+
+import json
+import threading
+import time
+import urllib.request
+from typing import Iterable, Optional
+
+from chat_llama.config import (
+    BACKENDS,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_PROBE_INTERVAL,
+    model_key,
+    normalize_url,
+)
+from chat_llama.scheduler import Scheduler, get_scheduler
+
+
+class Backend:
+    """One Ollama host and what the last probe saw there"""
+
+    def __init__(self, base_url: str):
+        self.base_url = normalize_url(base_url)
+        self.scheduler: Scheduler = get_scheduler(self.base_url)
+        self.healthy = True
+        self.loaded = set()
+        # None until probed: unknown, so not a reason to skip the host
+        self.installed: Optional[set] = None
+        self.failures = 0
+        self.checked = 0.0
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @property
+    def outstanding(self) -> int:
+        return self.scheduler.in_flight + self.scheduler.queued
+
+    def snapshot(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "loaded": sorted(self.loaded),
+            "installed": None if self.installed is None else sorted(self.installed),
+            "failures": self.failures,
+        }
+
+
+def _get_json(url: str, timeout: float) -> dict:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+class BackendPool:
+    """Model-aware, least-outstanding routing over a set of hosts"""
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        probe_interval: float = DEFAULT_PROBE_INTERVAL,
+        probe_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    ):
+        self.backends = [
+            Backend(url) for url in dict.fromkeys(map(normalize_url, urls))
+        ]
+        if not self.backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._prober: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def choose(self, model: str = "", exclude: Iterable[Backend] = ()) -> Backend:
+        """The host to send a request for `model` to, skipping `exclude`"""
+        if len(self.backends) == 1:
+            return self.backends[0]
+        self._start_probing()
+        candidates = [b for b in self.backends if b not in exclude]
+        # With every host marked down, trying one beats failing outright
+        candidates = [b for b in candidates if b.healthy] or candidates
+        if not candidates:
+            raise ConnectionError("no backend left to try")
+        key = model_key(model) if model else ""
+        warm = [b for b in candidates if key in b.loaded]
+        able = [b for b in candidates if b.installed is None or key in b.installed]
+        return min(warm or able or candidates, key=lambda b: b.outstanding)
+
+    def failed(self, backend: Backend, tried: list, down: bool = True) -> bool:
+        """Note a failed attempt; True if another host is left to try
+
+        `down` marks the host unhealthy until its next successful probe;
+        a host that only turned the request away (queue full) stays up.
+        """
+        if down:
+            backend.failures += 1
+            backend.healthy = False
+        tried.append(backend)
+        return any(b not in tried for b in self.backends)
+
+    def probe(self, backend: Backend):
+        """Refresh one host's health and model lists"""
+        try:
+            running = _get_json(backend.url("/api/ps"), self.probe_timeout)
+            tags = _get_json(backend.url("/api/tags"), self.probe_timeout)
+        except (OSError, ValueError):
+            backend.healthy = False
+            return
+        backend.loaded = {model_key(m["name"]) for m in running.get("models", [])}
+        backend.installed = {model_key(m["name"]) for m in tags.get("models", [])}
+        backend.healthy = True
+        backend.checked = time.monotonic()
+
+    def probe_all(self):
+        for backend in self.backends:
+            self.probe(backend)
+
+    def _start_probing(self):
+        if self._prober is not None:
+            return
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(
+                    target=self._probe_forever, name="chat-llama-probe", daemon=True
+                )
+                self._prober.start()
+
+    def _probe_forever(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.probe_interval)
+
+    def snapshot(self) -> list:
+        return [b.snapshot() for b in self.backends]
+
+
+_backends: Optional[BackendPool] = None
+_backends_lock = threading.Lock()
+
+
+def get_backends() -> BackendPool:
+    """Return the process-wide pool of CHAT_LLAMA_BACKENDS"""
+    global _backends
+    if _backends is None:
+        with _backends_lock:
+            if _backends is None:
+                _backends = BackendPool(BACKENDS)
+    return _backends
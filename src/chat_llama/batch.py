@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional, TextIO
+
+import aiohttp
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.cache import default_cache
+from chat_llama.metrics import RequestMetrics, get_metrics
+from chat_llama.residency import ResidencyManager, get_residency, model_key
+from chat_llama.scheduler import BATCH, QueueFullError
+
+# Seconds to back off when the backend's queue is full; batch work waits
+# its turn instead of failing the way interactive requests do
+BUSY_RETRY_S = 1.0
+
+
+@dataclass
+class BatchStats:
+    """Aggregate counters for one batch run"""
+
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    eval_tokens: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def prompts_per_second(self) -> float:
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.eval_tokens / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.completed} completed, {self.failed} failed, "
+            f"{self.skipped} skipped in {self.elapsed:.2f}s "
+            f"({self.prompts_per_second:.2f} prompts/s, "
+            f"{self.tokens_per_second:.1f} tokens/s)"
+        )
+
+
+class InvalidRecord(dict):
+    """Stands in for an input line that is not a JSON object"""
+
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+
+def read_records(lines: Iterable[str]):
+    """Yield (id, record) pairs from JSONL, numbering records without an id
+
+    A malformed line yields an InvalidRecord under its line's index, so one
+    bad line becomes one error result instead of ending the run.
+    """
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield str(index), InvalidRecord(f"line {index + 1}: invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield str(index), InvalidRecord(f"line {index + 1}: not a JSON object")
+            continue
+        yield str(record.get("id", index)), record
+
+
+def finished_ids(output_path: str) -> set:
+    """Ids already written successfully to a previous run's output file"""
+    done = set()
+    try:
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a partial last line.
+                    continue
+                if "error" not in result:
+                    done.add(str(result["id"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def trim_partial_line(output_path: str):
+    """Cut a killed run's partial last line, so appending starts a new one"""
+    try:
+        f = open(output_path, "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        f.truncate(end)
+
+
+async def _run_one(client, record_id, record, default_model, residency=None):
+    model = record.get("model") or default_model
+    fields = {"options": record["options"]} if record.get("options") else {}
+    if residency is not None:
+        fields["keep_alive"] = residency.keep_alive(model)
+    started = time.perf_counter()
+    while True:
+        parts = []
+        final = {}
+        metrics = RequestMetrics(model, "/api/generate")
+        try:
+            chunks = client.stream_generate(model, record["prompt"], metrics, **fields)
+            async for chunk in chunks:
+                if chunk.get("done"):
+                    final = chunk
+                else:
+                    metrics.mark_token()
+                    parts.append(chunk.get("response", ""))
+        except QueueFullError:
+            # Rejected before anything was sent, so retrying is safe
+            get_metrics().record(metrics)
+            await asyncio.sleep(BUSY_RETRY_S)
+            continue
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            metrics.finish(outcome="error", error=str(e))
+            get_metrics().record(metrics)
+            return {"id": record_id, "model": model, "error": str(e)}
+        break
+    metrics.finish(final)
+    get_metrics().record(metrics)
+    return {
+        "id": record_id,
+        "model": model,
+        "response": "".join(parts),
+        "eval_count": final.get("eval_count", 0),
+        "prompt_eval_count": final.get("prompt_eval_count", 0),
+        "total_duration": final.get("total_duration", 0),
+        "elapsed": round(time.perf_counter() - started, 4),
+    }
+
+
+async def run_batch(
+    records: Iterable,
+    out: TextIO,
+    default_model: str,
+    concurrency: int = 4,
+    skip: Optional[set] = None,
+    client: Optional[AsyncOllamaClient] = None,
+    residency: Optional[ResidencyManager] = None,
+) -> BatchStats:
+    """Run records with at most `concurrency` requests in flight
+
+    Each result is written to `out` as one JSON line as soon as it finishes.
+    With a residency manager, records are grouped by model and in-flight
+    work drains before switching models, so a cold load never evicts a
+    model that still has requests running.
+    """
+    client = client or AsyncOllamaClient(
+        limit=concurrency, cache=default_cache(), priority=BATCH
+    )
+    skip = skip or set()
+    stats = BatchStats()
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def worker(record_id, record):
+        try:
+            result = await _run_one(client, record_id, record, default_model, residency)
+        finally:
+            slots.release()
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        if "error" in result:
+            stats.failed += 1
+        else:
+            stats.completed += 1
+            stats.eval_tokens += result["eval_count"]
+
+    loop = asyncio.get_running_loop()
+    current_model = None
+    if residency is not None:
+        records = residency.order(records, default_model)
+
+    started = time.perf_counter()
+    try:
+        for record_id, record in records:
+            if record_id in skip:
+                stats.skipped += 1
+                continue
+            if isinstance(record, InvalidRecord):
+                out.write(json.dumps({"id": record_id, "error": record.error}) + "\n")
+                out.flush()
+                stats.failed += 1
+                continue
+            model = model_key(record.get("model") or default_model)
+            if residency is not None and model != current_model:
+                if pending:
+                    await asyncio.gather(*pending)
+                if not residency.is_hot(model):
+                    await loop.run_in_executor(None, residency.warm, model)
+                current_model = model
+            # Only admit a new record once a slot is free, so large inputs
+            # are never fully loaded into memory.
+            await slots.acquire()
+            task = asyncio.create_task(worker(record_id, record))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        # On failure, stop the records still running before the client
+        # goes: a late one would otherwise open a fresh session
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        stats.elapsed = time.perf_counter() - started
+        await client.close()
+    return stats
+
+
+def batch_main(
+    input_path: str,
+    output_path: Optional[str],
+    default_model: str,
+    concurrency: int = 4,
+    resume: bool = False,
+) -> BatchStats:
+    """Run a JSONL batch from a file (or "-" for stdin) into a JSONL file"""
+    skip = set()
+    if resume and output_path:
+        skip = finished_ids(output_path)
+        trim_partial_line(output_path)
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    out = (
+        open(output_path, "a" if resume else "w", encoding="utf-8")
+        if output_path
+        else sys.stdout
+    )
+    try:
+        stats = asyncio.run(
+            run_batch(
+                read_records(source),
+                out,
+                default_model,
+                concurrency,
+                skip,
+                residency=get_residency(),
+            )
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(stats.summary(), file=sys.stderr)
+    return stats
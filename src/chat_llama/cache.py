@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "chat_llama" / "responses.sqlite3"
+DEFAULT_TTL = float(os.environ.get("CHAT_LLAMA_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get("CHAT_LLAMA_CACHE_MAX_MB", 256)) * 1024 * 1024
+
+# Fields that change how a response is delivered, not what it contains
+_UNKEYED_FIELDS = ("stream", "keep_alive")
+
+
+class LRUCache:
+    """Small thread-safe in-memory LRU"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Persistent key/value store with TTL and a total size budget"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            if total - freed <= self.max_bytes:
+                break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """Memory LRU in front of a SQLiteStore, holding recorded NDJSON streams
+
+    Only deterministic requests (temperature 0 or a fixed seed) are cached.
+    Hits are replayed chunk by chunk so callers can't tell them apart from
+    a live stream.
+    """
+
+    def __init__(self, store: Optional[SQLiteStore] = None, memory_size: int = 256):
+        self.memory = LRUCache(memory_size)
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_cacheable(payload: dict) -> bool:
+        options = payload.get("options") or {}
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    @staticmethod
+    def key(path: str, payload: dict) -> str:
+        keyed = {k: v for k, v in payload.items() if k not in _UNKEYED_FIELDS}
+        blob = json.dumps([path, keyed], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[list]:
+        chunks = self.memory.get(key)
+        if chunks is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                chunks = json.loads(value)
+                self.memory.put(key, chunks)
+        if chunks is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return chunks
+
+    def put(self, key: str, chunks: list):
+        self.memory.put(key, chunks)
+        if self.store is not None:
+            self.store.put(key, json.dumps(chunks, separators=(",", ":")).encode())
+
+    def stream(self, path: str, payload: dict, fetch):
+        """Replay a recorded response, or record `fetch()`'s chunks as they pass"""
+        if not self.is_cacheable(payload):
+            yield from fetch()
+            return
+        key = self.key(path, payload)
+        recorded = self.get(key)
+        if recorded is not None:
+            yield from recorded
+            return
+        recorded = []
+        chunks = fetch()
+        try:
+            for chunk in chunks:
+                recorded.append(chunk)
+                yield chunk
+        finally:
+            # Pass a close() straight through, so the connection drops now
+            chunks.close()
+        if recorded and recorded[-1].get("done"):
+            self.put(key, recorded)
+
+    async def astream(self, path: str, payload: dict, fetch):
+        """stream() for the asyncio client: `fetch()` is an async iterator
+
+        The lookup and the write run in a worker thread, so SQLite never
+        blocks the event loop.
+        """
+        import asyncio
+
+        if not self.is_cacheable(payload):
+            async for chunk in fetch():
+                yield chunk
+            return
+        key = self.key(path, payload)
+        recorded = await asyncio.to_thread(self.get, key)
+        if recorded is not None:
+            for chunk in recorded:
+                yield chunk
+            return
+        recorded = []
+        chunks = fetch()
+        try:
+            async for chunk in chunks:
+                recorded.append(chunk)
+                yield chunk
+        finally:
+            await chunks.aclose()
+        if recorded and recorded[-1].get("done"):
+            await asyncio.to_thread(self.put, key, recorded)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory": len(self.memory)}
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def default_cache() -> Optional[ResponseCache]:
+    """Shared cache if CHAT_LLAMA_CACHE is set ("1" or a database path)"""
+    global _cache
+    setting = os.environ.get("CHAT_LLAMA_CACHE", "")
+    if setting in ("", "0"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = DEFAULT_CACHE_PATH if setting == "1" else setting
+            _cache = ResponseCache(SQLiteStore(path))
+    return _cache
+
+
+_semantic = None
+
+
+def default_semantic_cache():
+    """Shared SemanticCache if CHAT_LLAMA_SEMANTIC_CACHE is set
+
+    "1" persists it in the default directory, any other value in that
+    directory, and "memory" keeps it for this process only. numpy is
+    only imported when it is on.
+    """
+    global _semantic
+    setting = os.environ.get("CHAT_LLAMA_SEMANTIC_CACHE", "")
+    if setting in ("", "0"):
+        return None
+    with _cache_lock:
+        if _semantic is None:
+            from chat_llama.semantic_cache import DEFAULT_SEMANTIC_DIR, SemanticCache
+
+            path = {"1": DEFAULT_SEMANTIC_DIR, "memory": None}.get(setting, setting)
+            _semantic = SemanticCache(path)
+    return _semantic
@@ -0,0 +1,326 @@
+"""chat-llama: one-shot prompts, a REPL, batch runs and the GUIs
+
+    chat-llama "why is the sky blue?"        # same as: chat-llama ask ...
+    echo "why?" | chat-llama ask -m llama3.1:8b
+    chat-llama repl
+    chat-llama batch prompts.jsonl -o results.jsonl
+    chat-llama embed corpus.jsonl -o vectors.npy
+    chat-llama fanout -m llama3.2 -m llama3.1:8b --race "why?"
+    chat-llama gui fancy
+    chat-llama metrics -o /var/lib/node_exporter/chat_llama.prom
+    chat-llama serve --port 8000                # OpenAI-compatible gateway
+
+Each subcommand imports what it needs when it runs. A one-shot prompt to
+a single host never loads requests, aiohttp, tkinter or streamlit, so the
+command stays cheap to call from shell loops (see
+benchmarks/import_time.py).
+"""
+
+import argparse
+import os
+import sys
+
+COMMANDS = ("ask", "repl", "batch", "embed", "fanout", "gui", "metrics", "serve")
+
+GUI_SCRIPTS = {
+    "basic": "chat-llama-gui.py",
+    "extended": "chat-llama-gui-extended.py",
+    "fancy": "chat-llama-fancy-gui.py",
+    "web": "chat-llama-streamlit.py",
+}
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts")
+
+
+def resolve_model(value=None, refresh: bool = True) -> str:
+    """A model name, an index into Models.numbered(), or the default
+
+    With refresh=False only the on-disk model cache is read (falling back
+    to Models.default()), so no HTTP client or refresh thread is started.
+    """
+    value = value or os.environ.get("CHAT_LLAMA_MODEL")
+    if value and not value.isdigit():
+        return value
+    from Models.llama_models import Models, get_registry
+
+    numbered = Models.numbered()
+    if value and int(value) < len(numbered):
+        return numbered[int(value)]
+    return get_registry().default(refresh)
+
+
+def _needs_pooled_client() -> bool:
+    """Whether a one-shot prompt must go through OllamaClient, not lite
+
+    With one host and no semantic cache the pooled client would route to
+    that host and admit the lone request at once, so lite's cheaper
+    transport does the same job; several CHAT_LLAMA_BACKENDS (routing and
+    failover) or CHAT_LLAMA_SEMANTIC_CACHE need the real client.
+    """
+    from chat_llama.config import BACKENDS
+
+    semantic = os.environ.get("CHAT_LLAMA_SEMANTIC_CACHE", "")
+    return len(BACKENDS) > 1 or semantic not in ("", "0")
+
+
+def ask(opts) -> int:
+    from chat_llama.config import keep_alive
+    from chat_llama.metrics import RequestMetrics
+    from chat_llama.streaming import TextStream
+
+    prompt = " ".join(opts.prompt) if opts.prompt else sys.stdin.read()
+    if not prompt.strip():
+        print("chat-llama: empty prompt", file=sys.stderr)
+        return 2
+    # A one-shot prompt must not pay for (or wait on) a registry refresh
+    model = resolve_model(opts.model, refresh=False)
+    fields = {"keep_alive": keep_alive(model)}
+    if opts.system:
+        fields["system"] = opts.system
+    metrics = RequestMetrics(model, "/api/generate")
+    if _needs_pooled_client():
+        from chat_llama.client import get_client
+
+        chunks = get_client().stream_generate(model, prompt, metrics, **fields)
+    else:
+        from chat_llama import lite
+        from chat_llama.cache import default_cache
+
+        chunks = lite.stream_generate(
+            model, prompt, cache=default_cache(), metrics=metrics, **fields
+        )
+    stream = TextStream(chunks, metrics)
+    try:
+        stream.write_to(sys.stdout)
+    except OSError as e:
+        print(f"Request failed: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        # write_to has closed the connection, which stops the generation
+        print("\nchat-llama: cancelled", file=sys.stderr)
+        return 130
+    print()
+    return 0
+
+
+def repl(opts) -> int:
+    from chat_llama.repl import repl
+
+    repl(resolve_model(opts.model))
+    return 0
+
+
+def batch(opts) -> int:
+    from chat_llama.batch import batch_main
+
+    batch_main(
+        opts.input,
+        opts.output,
+        resolve_model(opts.model),
+        opts.concurrency,
+        opts.resume,
+    )
+    return 0
+
+
+def embed(opts) -> int:
+    from chat_llama.embed import embed_main
+
+    try:
+        embed_main(
+            opts.input,
+            opts.output,
+            opts.model,
+            opts.batch_size,
+            opts.concurrency,
+            opts.resume,
+            opts.field,
+        )
+    except KeyboardInterrupt:
+        print("chat-llama: interrupted; rerun with --resume", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(
+            f"chat-llama: embed failed: {str(e) or type(e).__name__}", file=sys.stderr
+        )
+        return 1
+    return 0
+
+
+def fanout(opts) -> int:
+    from chat_llama.fanout import fanout_main
+
+    prompt = " ".join(opts.prompt) if opts.prompt else sys.stdin.read()
+    if not prompt.strip():
+        print("chat-llama: empty prompt", file=sys.stderr)
+        return 2
+    models = [resolve_model(m) for arg in opts.model for m in arg.split(",")]
+    try:
+        fanout_main(models, prompt, opts.race)
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+def gui(opts) -> int:
+    script = os.path.join(SCRIPTS_DIR, GUI_SCRIPTS[opts.frontend])
+    if not os.path.exists(script):
+        print(
+            f"chat-llama: {GUI_SCRIPTS[opts.frontend]} not found; the GUIs run "
+            "from a source checkout (pip install -e .)",
+            file=sys.stderr,
+        )
+        return 1
+    if opts.frontend == "web":
+        import subprocess
+
+        return subprocess.call([sys.executable, "-m", "streamlit", "run", script])
+    import runpy
+
+    runpy.run_path(script, run_name="__main__")
+    return 0
+
+
+def metrics(opts) -> int:
+    from chat_llama.metrics import MetricsLog, MetricsSummary, default_log
+
+    log = MetricsLog(opts.log) if opts.log else default_log()
+    if log is None:
+        print("chat-llama: CHAT_LLAMA_METRICS_LOG=0, nothing logged", file=sys.stderr)
+        return 1
+    text = MetricsSummary(log.read()).prometheus()
+    if not opts.output:
+        sys.stdout.write(text)
+        return 0
+    # Scrapers (e.g. node_exporter's textfile collector) must never see a
+    # half-written file
+    partial = f"{opts.output}.{os.getpid()}.tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(partial, opts.output)
+    return 0
+
+
+def serve(opts) -> int:
+    from chat_llama.gateway import serve
+
+    serve(opts.host, opts.port)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="chat-llama", description="Chat with local Ollama models."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    model_help = "model name, or 0-3 for llama3.2, llama3.1:8b, :70b, :405b"
+
+    p = commands.add_parser(
+        "ask",
+        help="stream the answer to one prompt",
+        description="Stream the answer to one prompt. On a single host it "
+        "skips requests and aiohttp; with several CHAT_LLAMA_BACKENDS or "
+        "CHAT_LLAMA_SEMANTIC_CACHE set it goes through the pooled client "
+        "for routing, failover and the semantic cache.",
+    )
+    p.add_argument("prompt", nargs="*", help="prompt text (default: read stdin)")
+    p.add_argument("-m", "--model", help=model_help)
+    p.add_argument("-s", "--system", help="system prompt")
+    p.set_defaults(run=ask)
+
+    p = commands.add_parser("repl", help="interactive chat that keeps context")
+    p.add_argument("-m", "--model", help=model_help)
+    p.set_defaults(run=repl)
+
+    p = commands.add_parser(
+        "batch", help="run JSONL prompt records concurrently, writing JSONL results"
+    )
+    p.add_argument(
+        "input",
+        help='JSONL file of {"id", "model", "prompt", "options"} records, or - for stdin',
+    )
+    p.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    p.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="requests in flight"
+    )
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        help="append to --output, skipping ids it already holds",
+    )
+    p.add_argument("-m", "--model", help="model for records that don't name one")
+    p.set_defaults(run=batch)
+
+    p = commands.add_parser(
+        "embed", help="embed text lines or JSONL records into a .npy file"
+    )
+    p.add_argument(
+        "input",
+        help='text file (one record per line), JSONL of {"id", "text"}, or - for stdin',
+    )
+    p.add_argument("-o", "--output", required=True, help=".npy file to write")
+    p.add_argument(
+        "-m", "--model", help="embedding model (default: CHAT_LLAMA_EMBED_MODEL)"
+    )
+    p.add_argument("-b", "--batch-size", type=int, default=64, help="texts per request")
+    p.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="requests in flight"
+    )
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run into the same --output",
+    )
+    p.add_argument("--field", default="text", help="JSONL field holding the text")
+    p.set_defaults(run=embed)
+
+    p = commands.add_parser(
+        "fanout", help="send one prompt to several models, one JSONL result each"
+    )
+    p.add_argument("prompt", nargs="*", help="prompt text (default: read stdin)")
+    p.add_argument(
+        "-m",
+        "--model",
+        action="append",
+        required=True,
+        help="model to include; repeat or comma-separate",
+    )
+    p.add_argument(
+        "--race",
+        action="store_true",
+        help="cancel the other models once one has answered",
+    )
+    p.set_defaults(run=fanout)
+
+    p = commands.add_parser("gui", help="start a graphical front-end")
+    p.add_argument("frontend", nargs="?", choices=sorted(GUI_SCRIPTS), default="fancy")
+    p.set_defaults(run=gui)
+
+    p = commands.add_parser(
+        "metrics", help="per-model request metrics in Prometheus text format"
+    )
+    p.add_argument("--log", help="metrics log to read (default: the active log)")
+    p.add_argument("-o", "--output", help="write to this file atomically")
+    p.set_defaults(run=metrics)
+
+    p = commands.add_parser(
+        "serve", help="OpenAI-compatible HTTP gateway in front of Ollama"
+    )
+    p.add_argument("--host", help="address to bind (default: CHAT_LLAMA_GATEWAY_HOST)")
+    p.add_argument(
+        "--port", type=int, help="port to bind (default: CHAT_LLAMA_GATEWAY_PORT)"
+    )
+    p.set_defaults(run=serve)
+    return parser
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # A bare prompt is the common case in scripts: chat-llama "..."
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv.insert(0, "ask")
+    opts = build_parser().parse_args(argv)
+    return opts.run(opts)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
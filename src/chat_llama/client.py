@@ -0,0 +1,375 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+
+from chat_llama.backends import BackendPool, get_backends
+from chat_llama.cache import ResponseCache, default_cache, default_semantic_cache
+from chat_llama.config import (
+    DEFAULT_BASE_URL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_OPTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_READ_TIMEOUT,
+)
+from chat_llama.ndjson import decode
+from chat_llama.scheduler import INTERACTIVE, QueueFullError
+
+# Errors worth retrying on another backend while nothing has been delivered
+_FAILOVER_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.HTTPError,
+    QueueFullError,
+)
+
+
+def _fails_over(error: Exception) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError):
+        # A 4xx (unknown model, bad request) would fail the same anywhere
+        return error.response is not None and error.response.status_code >= 500
+    return True
+
+
+class ConnectionStats:
+    """Counts TCP connects and how many requests each connection served"""
+
+    MAX_TRACKED = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._serial = 0
+        self.requests = 0
+        self.connects = 0
+        self.per_connection = OrderedDict()
+
+    def checked_out(self, conn):
+        # urllib3 closes dropped keep-alive connections in place, so a missing
+        # socket means this request will pay for a fresh TCP connect.
+        with self._lock:
+            self.requests += 1
+            if getattr(conn, "sock", None) is None or not hasattr(
+                conn, "_chat_llama_serial"
+            ):
+                self._serial += 1
+                self.connects += 1
+                conn._chat_llama_serial = self._serial
+                self.per_connection[self._serial] = 0
+                while len(self.per_connection) > self.MAX_TRACKED:
+                    self.per_connection.popitem(last=False)
+            serial = conn._chat_llama_serial
+            self.per_connection[serial] = self.per_connection.get(serial, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connects": self.connects,
+                "reused": self.requests - self.connects,
+                "per_connection": dict(self.per_connection),
+            }
+
+
+# Seconds the calling thread's last request spent on a TCP connect, or
+# None if it reused a pooled connection. requests sends on the calling
+# thread, so a thread-local is enough to hand this to stream().
+_last_connect = threading.local()
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _last_connect.seconds = time.perf_counter() - started
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _CountingPoolMixin:
+    conn_stats: Optional[ConnectionStats] = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if self.conn_stats is not None:
+            self.conn_stats.checked_out(conn)
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _CountingPoolManager(PoolManager):
+    def __init__(self, *args, conn_stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conn_stats = conn_stats
+        self.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.conn_stats = self.conn_stats
+        return pool
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools report connection reuse to a ConnectionStats"""
+
+    def __init__(self, conn_stats: ConnectionStats, **kwargs):
+        self.conn_stats = conn_stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _CountingPoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            conn_stats=self.conn_stats,
+            **pool_kwargs,
+        )
+
+
+class OllamaClient:
+    """Keep-alive HTTP client shared by every front-end"""
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        pool_connections: int = 4,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        pool_block: bool = False,
+        options: Optional[dict] = None,
+        cache: Optional[ResponseCache] = None,
+        priority: int = INTERACTIVE,
+        backends: Optional[BackendPool] = None,
+        semantic_cache=None,
+    ):
+        # Streams are routed across the pool (CHAT_LLAMA_BACKENDS unless a
+        # base_url is given); other calls go to its first host
+        if backends is None:
+            backends = (
+                get_backends()
+                if base_url == DEFAULT_BASE_URL
+                else BackendPool([base_url])
+            )
+        self.backends = backends
+        self.base_url = backends.primary.base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.options = DEFAULT_OPTIONS if options is None else options
+        self.cache = cache
+        # A SemanticCache in front of /api/generate (needs numpy, so untyped)
+        self.semantic_cache = semantic_cache
+        # Streams wait for a slot on their backend's scheduler at this priority
+        self.priority = priority
+        self.conn_stats = ConnectionStats()
+        self.session = requests.Session()
+        adapter = PooledAdapter(
+            self.conn_stats,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def post(
+        self, path: str, payload: dict, stream: bool = False, timeout=None, backend=None
+    ):
+        url = backend.url(path) if backend is not None else self.url(path)
+        response = self.session.post(
+            url, json=payload, stream=stream, timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response
+
+    def get(self, path: str, timeout=None, backend=None):
+        url = backend.url(path) if backend is not None else self.url(path)
+        response = self.session.get(url, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response
+
+    def payload(self, fields: dict) -> dict:
+        """Request body with the client's default options merged in"""
+        if self.options or fields.get("options"):
+            fields["options"] = {**self.options, **(fields.get("options") or {})}
+        return fields
+
+    def generate(self, model: str, prompt: str, stream: bool = True, **fields):
+        """POST /api/generate; returns the (streaming) response"""
+        payload = self.payload({"model": model, "prompt": prompt, **fields})
+        payload["stream"] = stream
+        return self.post("/api/generate", payload, stream=stream)
+
+    def chat(self, model: str, messages: list, stream: bool = True, **fields):
+        """POST /api/chat; returns the (streaming) response"""
+        payload = self.payload({"model": model, "messages": messages, **fields})
+        payload["stream"] = stream
+        return self.post("/api/chat", payload, stream=stream)
+
+    def embed(self, model: str, texts: list, **fields) -> list:
+        """POST /api/embed through the backend pool; one vector per text"""
+        payload = {"model": model, "input": texts, **fields}
+        return self._embed(payload)["embeddings"]
+
+    def stream(
+        self,
+        path: str,
+        payload: dict,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+    ):
+        """POST a streaming request and yield each decoded NDJSON object
+
+        Deterministic requests are served from, and recorded into, the
+        response cache when one is configured, and generate prompts close
+        to an earlier one get its answer from the semantic cache;
+        `cache=False` skips both. Others hold a scheduler slot (at
+        `priority`, default the client's, queued fairly among `caller`s)
+        until the stream ends. `metrics` (a RequestMetrics) gets the queue
+        wait, connect time and time to first byte.
+        """
+        payload["stream"] = True
+        args = (path, payload, metrics, priority, caller)
+        if not cache:
+            return self._stream(*args)
+
+        def fetch():
+            if self.cache is not None:
+                return self.cache.stream(path, payload, lambda: self._stream(*args))
+            return self._stream(*args)
+
+        if self.semantic_cache is not None and path == "/api/generate":
+            return self.semantic_cache.stream(payload, self._embed, fetch, metrics)
+        return fetch()
+
+    def _embed(self, body: dict) -> dict:
+        # Routed, scheduled and failed over like a stream
+        tried = []
+        while True:
+            backend = self.backends.choose(body.get("model", ""), tried)
+            try:
+                with backend.scheduler.slot(self.priority):
+                    return self.post("/api/embed", body, backend=backend).json()
+            except _FAILOVER_ERRORS as e:
+                down = not isinstance(e, QueueFullError)
+                if not _fails_over(e) or not self.backends.failed(backend, tried, down):
+                    raise
+
+    def _stream(self, path, payload, metrics, priority, caller):
+        priority = self.priority if priority is None else priority
+        model = payload.get("model", "")
+        tried = []
+        while True:
+            backend = self.backends.choose(model, tried)
+            if metrics is not None:
+                metrics.attempt(backend.base_url)
+            delivered = False
+            try:
+                with backend.scheduler.slot(priority, caller, metrics):
+                    _last_connect.seconds = None
+                    with self.post(path, payload, True, backend=backend) as response:
+                        if metrics is not None:
+                            metrics.mark_headers(_last_connect.seconds)
+                        # Raw transfer chunks go straight into the NDJSON decoder
+                        for chunk in decode(response.iter_content(chunk_size=None)):
+                            delivered = True
+                            yield chunk
+                return
+            except _FAILOVER_ERRORS as e:
+                down = not isinstance(e, QueueFullError)
+                if (
+                    delivered
+                    or not _fails_over(e)
+                    or not self.backends.failed(backend, tried, down)
+                ):
+                    raise
+
+    def stream_generate(
+        self,
+        model: str,
+        prompt: str,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+        **fields,
+    ):
+        payload = self.payload({"model": model, "prompt": prompt, **fields})
+        return self.stream("/api/generate", payload, metrics, priority, caller, cache)
+
+    def stream_chat(
+        self,
+        model: str,
+        messages: list,
+        metrics=None,
+        priority=None,
+        caller="",
+        cache: bool = True,
+        **fields,
+    ):
+        payload = self.payload({"model": model, "messages": messages, **fields})
+        return self.stream("/api/chat", payload, metrics, priority, caller, cache)
+
+    def connection_stats(self) -> dict:
+        return self.conn_stats.snapshot()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient(
+                    cache=default_cache(), semantic_cache=default_semantic_cache()
+                )
+    return _client
+
+
+def set_client(client: OllamaClient):
+    """Replace the process-wide client, e.g. to point at another host"""
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,101 @@
+"""Settings read from the environment, kept free of heavy imports"""
+
+import json
+import os
+from typing import Union
+from urllib.parse import urlsplit
+
+
+def normalize_url(host: str) -> str:
+    """Base URL for an OLLAMA_HOST-style value such as 127.0.0.1:11434
+
+    Like Ollama itself, a bare host gets http:// and port 11434.
+    """
+    host = host.strip().rstrip("/")
+    if "://" not in host:
+        host = f"http://{host}"
+        url = urlsplit(host)
+        if url.port is None:
+            host = url._replace(netloc=f"{url.netloc}:11434").geturl()
+    return host
+
+
+DEFAULT_BASE_URL = normalize_url(
+    os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+)
+# Hosts the pooled clients spread streams over (see backends.py)
+BACKENDS = [
+    normalize_url(url)
+    for url in os.environ.get("CHAT_LLAMA_BACKENDS", DEFAULT_BASE_URL).split(",")
+    if url.strip()
+]
+DEFAULT_PROBE_INTERVAL = float(os.environ.get("CHAT_LLAMA_PROBE_INTERVAL", 10))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("CHAT_LLAMA_CONNECT_TIMEOUT", 3.05))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("CHAT_LLAMA_READ_TIMEOUT", 300))
+DEFAULT_POOL_MAXSIZE = int(os.environ.get("CHAT_LLAMA_POOL_MAXSIZE", 16))
+# Per-backend admission control (see scheduler.py)
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("CHAT_LLAMA_MAX_IN_FLIGHT", 4))
+DEFAULT_MAX_QUEUE = int(os.environ.get("CHAT_LLAMA_MAX_QUEUE", 32))
+# Sampling options merged into every request, e.g. '{"temperature": 0}'
+DEFAULT_OPTIONS = json.loads(os.environ.get("CHAT_LLAMA_OPTIONS", "{}"))
+# Ollama's context window when options don't set num_ctx (see context.py)
+DEFAULT_NUM_CTX = int(
+    DEFAULT_OPTIONS.get("num_ctx", os.environ.get("CHAT_LLAMA_NUM_CTX", 2048))
+)
+# Compact a conversation once its history fills this much of the window
+COMPACT_AT = float(os.environ.get("CHAT_LLAMA_COMPACT_AT", 0.75))
+# Lines a Tk response widget holds; the rest wait in a spill file
+SCROLLBACK_LINES = int(os.environ.get("CHAT_LLAMA_SCROLLBACK_LINES", 2000))
+# Model behind /api/embed for the semantic cache and the document index
+EMBED_MODEL = os.environ.get("CHAT_LLAMA_EMBED_MODEL", "nomic-embed-text")
+# Folder the extended GUI indexes for retrieval (see documents.py)
+DOCS_DIR = os.environ.get("CHAT_LLAMA_DOCS", "")
+DOCS_TOP_K = int(os.environ.get("CHAT_LLAMA_DOCS_TOP_K", 4))
+# Where `chat-llama serve` listens (see gateway.py)
+GATEWAY_HOST = os.environ.get("CHAT_LLAMA_GATEWAY_HOST", "127.0.0.1")
+GATEWAY_PORT = int(os.environ.get("CHAT_LLAMA_GATEWAY_PORT", 8000))
+
+
+def keep_alive_value(value: Union[str, int]) -> Union[str, int]:
+    """A keep_alive Ollama accepts
+
+    Ollama reads a string as a Go duration ("30m", "2h"), so a unitless
+    one such as "-1" or "300" gets a 400; those are sent as integer
+    seconds instead.
+    """
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return value
+
+
+DEFAULT_KEEP_ALIVE = keep_alive_value(
+    os.environ.get("CHAT_LLAMA_KEEP_ALIVE_DEFAULT", "30m")
+)
+
+# Big models take minutes to load, so keep them resident much longer.
+# A negative number tells Ollama never to unload. Override with
+# CHAT_LLAMA_KEEP_ALIVE, e.g. '{"llama3.2": "1h"}'.
+KEEP_ALIVE_POLICIES = {
+    name: keep_alive_value(value)
+    for name, value in {
+        "llama3.1:70b": "2h",
+        "llama3.1:405b": -1,
+        **json.loads(os.environ.get("CHAT_LLAMA_KEEP_ALIVE", "{}")),
+    }.items()
+}
+
+
+def model_key(name: str) -> str:
+    """Ollama reports untagged models as name:latest"""
+    return name if ":" in name else f"{name}:latest"
+
+
+def keep_alive(model: str) -> Union[str, int]:
+    """keep_alive for `model` under the configured policies"""
+    for name, value in KEEP_ALIVE_POLICIES.items():
+        if model_key(name) == model_key(model):
+            return value
+    return DEFAULT_KEEP_ALIVE
@@ -0,0 +1,112 @@
+"""Keep prompts inside the model's context window
+
+Ollama evaluates at most num_ctx tokens: a longer prompt is cut from the
+front without an error, and every token of it costs prefill time. There
+is no tokenizer on the client, so estimate_tokens() approximates BPE
+counts from words and punctuation, erring a little high. TokenCounter
+caches that per paragraph, so re-counting a prompt after each keystroke
+only re-estimates the paragraph that changed.
+
+Session.compact() uses the same estimates to keep multi-turn history
+bounded; the history itself is measured exactly, as the length of the
+context array Ollama returns.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from chat_llama.config import DEFAULT_NUM_CTX
+
+# Tokens kept free for the answer, at most a quarter of the window
+RESPONSE_RESERVE = 512
+
+_WORDS = re.compile(r"\w+")
+_SYMBOLS = re.compile(r"[^\w\s]")
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in at most 150 words. Keep names, "
+    "numbers, decisions and open questions; skip pleasantries.\n\n"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count: short words are one token, long ones more"""
+    words = sum(1 + len(word) // 8 for word in _WORDS.findall(text))
+    return words + len(_SYMBOLS.findall(text))
+
+
+class TokenCounter:
+    """estimate_tokens() over whole texts, cached per paragraph"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+
+    def _paragraph(self, text: str) -> int:
+        tokens = self._cache.get(text)
+        if tokens is None:
+            tokens = self._cache[text] = estimate_tokens(text)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(text)
+        return tokens
+
+    def count(self, text: str) -> int:
+        return sum(self._paragraph(p) for p in text.split("\n\n"))
+
+
+def context_window(model: str) -> int:
+    """Tokens Ollama will evaluate for `model`: num_ctx, capped by the model"""
+    from Models.llama_models import get_registry
+
+    info = get_registry().info(model)
+    if info is not None and info.context_length:
+        return min(DEFAULT_NUM_CTX, info.context_length)
+    return DEFAULT_NUM_CTX
+
+
+class ContextBudget:
+    """Estimated tokens per part of the next request against the window"""
+
+    def __init__(self, window: int, counter: Optional[TokenCounter] = None):
+        self.window = window
+        self.counter = counter or TokenCounter()
+        self.parts = {}
+
+    def set(self, name: str, text: str) -> int:
+        tokens = self.parts[name] = self.counter.count(text) if text else 0
+        return tokens
+
+    def set_tokens(self, name: str, tokens: int):
+        self.parts[name] = tokens
+
+    @property
+    def reserve(self) -> int:
+        return min(RESPONSE_RESERVE, self.window // 4)
+
+    @property
+    def used(self) -> int:
+        return sum(self.parts.values())
+
+    @property
+    def remaining(self) -> int:
+        return self.window - self.reserve - self.used
+
+    def describe(self) -> str:
+        return f"~{self.used:,} of {self.window:,} tokens · {self.remaining:,} left"
+
+
+def summarizer(model: str, client=None, **fields) -> Callable[[str], str]:
+    """A Session.compact() summarizer that asks `model` (one blocking call)"""
+
+    def summarize(transcript: str) -> str:
+        from chat_llama.client import get_client
+
+        response = (client or get_client()).generate(
+            model, SUMMARY_PROMPT + transcript, stream=False, **fields
+        )
+        return response.json().get("response", "").strip()
+
+    return summarize
@@ -0,0 +1,484 @@
+"""Local document index for retrieval-augmented prompts
+
+DocumentIndex splits the text files under a folder into chunks of about
+CHUNK_CHARS, embeds them with /api/embed and keeps the vectors in a
+memory-mapped float32 matrix; SQLite maps each row (the chunk id) to its
+file and text. update() is incremental: only files whose size or mtime
+changed are re-chunked and re-embedded, and the rows of changed or
+deleted files are reused for new chunks.
+
+Small indexes are searched exhaustively. Past IVF_MIN_CHUNKS the rows
+are also clustered around sqrt(n) k-means centroids (an inverted file),
+and a query scores only the rows of its NPROBE nearest clusters, which
+keeps a search over a few hundred thousand chunks to a few milliseconds.
+The centroids are retrained whenever the index has doubled since.
+
+Needs numpy (pip install chat-llama[docs]).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from chat_llama.config import DOCS_TOP_K, EMBED_MODEL
+
+DEFAULT_INDEX_DIR = Path.home() / ".cache" / "chat_llama" / "documents"
+CHUNK_CHARS = 1500
+EMBED_BATCH = 32
+MAX_FILE_BYTES = 1024 * 1024
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv"}
+# Passages scoring below this cosine similarity are not worth the tokens
+MIN_SCORE = float(os.environ.get("CHAT_LLAMA_DOCS_MIN_SCORE", 0.45))
+IVF_MIN_CHUNKS = 8192
+NPROBE = 8
+INITIAL_ROWS = 4096
+PUBLISH_EVERY = 100
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS files ("
+    " id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE,"
+    " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    " id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, text TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chunks_file ON chunks (file_id)",
+)
+
+
+@dataclass
+class Passage:
+    """A retrieved chunk: its file (relative to the indexed folder) and text"""
+
+    path: str
+    text: str
+    score: float
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> list:
+    """Pack paragraphs into chunks of at most `size` characters"""
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        while len(paragraph) > size:
+            cut = paragraph.rfind("\n", 0, size)
+            cut = cut if cut > size // 2 else size
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        if paragraph:
+            pieces.append(paragraph)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 2 + len(piece) > size:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _read_text(path: Path) -> Optional[str]:
+    """The file's text, or None for binary or non-UTF-8 files"""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if b"\0" in data[:8192]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _kmeans(sample: np.ndarray, k: int, iterations: int = 10) -> np.ndarray:
+    """Spherical k-means centroids of unit-length rows"""
+    rng = np.random.default_rng(0)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assigned = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assigned, kind="stable")
+        counts = np.bincount(assigned, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = _unit(sums)
+        # Reseed empty clusters with random rows
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+    return centroids
+
+
+class DocumentIndex:
+    """Embedded chunks of the text files under `root`"""
+
+    def __init__(self, root, path=None, client=None, embed_model: str = EMBED_MODEL):
+        self.root = Path(root).expanduser().resolve()
+        if path is None:
+            digest = hashlib.sha1(str(self.root).encode()).hexdigest()[:16]
+            path = DEFAULT_INDEX_DIR / digest
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.client = client
+        self.embed_model = embed_model
+        # (done, total) files of the running update
+        self.progress = (0, 0)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path / "index.sqlite3", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        # Searches read through their own connection, alongside the writes
+        self._reader = sqlite3.connect(
+            self.path / "index.sqlite3", check_same_thread=False
+        )
+        # Updates run one at a time; searches don't wait behind them
+        self._updater = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chat-llama-docs-index"
+        )
+        self._searcher = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chat-llama-docs-search"
+        )
+        self.matrix: Optional[np.ndarray] = None
+        # Cluster of each row: -1 for a free row, 0 for every row before
+        # the centroids are trained
+        self.lists: Optional[np.ndarray] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.count = 0
+        self._free = []
+        # Rows freed since the last _publish(): the published snapshot may
+        # still score them, so they are reused only once it is replaced
+        self._freed = []
+        # What search() reads: swapped whole after each update
+        self._snapshot = None
+        self._load()
+
+    # --- storage ---------------------------------------------------------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def _load(self):
+        dim = self._meta("dim")
+        if dim is None:
+            return
+        if self._meta("embed_model") != self.embed_model:
+            # Vectors from another model don't compare: index from scratch
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM files")
+            self._db.execute("DELETE FROM meta")
+            self._db.commit()
+            return
+        rows = int(self._meta("rows"))
+        self.matrix = self._open("vectors.f32", np.float32, (rows, int(dim)), "r+")
+        self.lists = self._open("lists.i32", np.int32, (rows,), "r+")
+        ids = np.fromiter(
+            (i for (i,) in self._db.execute("SELECT id FROM chunks")), dtype=np.int64
+        )
+        self.count = int(ids.max()) + 1 if len(ids) else 0
+        # Rows without a chunk (e.g. written before a crash) are free
+        live = np.zeros(rows, dtype=bool)
+        live[ids] = True
+        self.lists[~live] = -1
+        self._free = np.flatnonzero(~live[: self.count]).tolist()
+        centroids = self.path / "centroids.npy"
+        if centroids.exists():
+            self.centroids = np.load(centroids)
+        self._publish()
+
+    def _open(self, name: str, dtype, shape: tuple, mode: str) -> np.memmap:
+        return np.memmap(self.path / name, dtype=dtype, mode=mode, shape=shape)
+
+    def _create(self, dim: int):
+        """Start the matrix, once the first embedding shows its width"""
+        self._set_meta("dim", dim)
+        self._set_meta("embed_model", self.embed_model)
+        self._set_meta("rows", INITIAL_ROWS)
+        self._db.commit()
+        self.matrix = self._open("vectors.f32", np.float32, (INITIAL_ROWS, dim), "w+")
+        self.lists = self._open("lists.i32", np.int32, (INITIAL_ROWS,), "w+")
+        self.lists[:] = -1
+        self.centroids = None
+        (self.path / "centroids.npy").unlink(missing_ok=True)
+        self.count = 0
+        self._free = []
+        self._freed = []
+
+    def _grow(self):
+        rows, dim = self.matrix.shape
+        rows *= 2
+        for name, itemsize in (("vectors.f32", 4 * dim), ("lists.i32", 4)):
+            with open(self.path / name, "r+b") as f:
+                f.truncate(rows * itemsize)
+        # Searches may still hold the old, smaller maps; they stay valid
+        self.matrix = self._open("vectors.f32", np.float32, (rows, dim), "r+")
+        lists = self._open("lists.i32", np.int32, (rows,), "r+")
+        lists[len(self.lists) :] = -1
+        self.lists = lists
+        self._set_meta("rows", rows)
+
+    def _publish(self):
+        """Hand search() a consistent view of the rows written so far
+
+        The snapshot gets its own copy of `lists`; the rows it marks live
+        keep their vectors until a later _publish(), because freed rows
+        only become reusable here.
+        """
+        lists = np.array(self.lists[: self.count])
+        order = bounds = None
+        if self.centroids is not None:
+            # Row ids grouped by cluster; free rows (-1) sort before cluster 0
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1))
+        with self._lock:
+            self._snapshot = (self.matrix, lists, self.centroids, order, bounds)
+        self._free.extend(self._freed)
+        self._freed = []
+
+    # --- indexing --------------------------------------------------------
+
+    def _embed(self, texts: list) -> np.ndarray:
+        from chat_llama.client import get_client
+
+        client = self.client or get_client()
+        return _unit(client.embed(self.embed_model, texts))
+
+    def _files(self) -> dict:
+        """Relative path -> (size, mtime_ns) of each candidate file under root"""
+        found = {}
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                full = os.path.join(directory, name)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                if 0 < stat.st_size <= MAX_FILE_BYTES:
+                    relative = os.path.relpath(full, self.root)
+                    found[relative] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def update(self) -> dict:
+        """Bring the index in line with the folder; returns what changed"""
+        found = self._files()
+        known = {
+            path: (file_id, size, mtime)
+            for file_id, path, size, mtime in self._db.execute(
+                "SELECT id, path, size, mtime_ns FROM files"
+            )
+        }
+        changed = [
+            path
+            for path, stat in found.items()
+            if path not in known or known[path][1:] != stat
+        ]
+        removed = [path for path in known if path not in found]
+        for path in removed:
+            self._forget(known[path][0])
+        self._db.commit()
+        self.progress = (0, len(changed))
+        chunks = 0
+        stored = bool(removed)
+        try:
+            for done, path in enumerate(changed, 1):
+                # Embed before touching the index: if the server fails, the
+                # file keeps its old rows and stat, so the next update retries it
+                texts, vectors = self._embed_file(path)
+                if path in known:
+                    self._forget(known[path][0])
+                chunks += self._add_file(path, found[path], texts, vectors)
+                self._db.commit()
+                stored = True
+                self.progress = (done, len(changed))
+                if done % PUBLISH_EVERY == 0 and self.matrix is not None:
+                    # Let searches see a long first indexing run as it goes
+                    self._publish()
+        finally:
+            # Files stored before a failure are searchable all the same
+            if stored and self.matrix is not None:
+                self._train()
+                self.matrix.flush()
+                self.lists.flush()
+                self._publish()
+        return {"changed": len(changed), "removed": len(removed), "chunks": chunks}
+
+    def update_async(self) -> Future:
+        return self._updater.submit(self.update)
+
+    def _forget(self, file_id: int):
+        ids = [
+            i
+            for (i,) in self._db.execute(
+                "SELECT id FROM chunks WHERE file_id = ?", (file_id,)
+            )
+        ]
+        self._db.execute("DELETE FROM chunks WHERE file_id = ?", (file_id,))
+        self._db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        if ids:
+            self.lists[ids] = -1
+            self._freed.extend(ids)
+
+    def _embed_file(self, path: str) -> tuple:
+        """(chunks, vectors) of one file, leaving the index untouched"""
+        text = _read_text(self.root / path)
+        # Unreadable files get no chunks but are still recorded, so they
+        # are not retried until they change
+        texts = chunk_text(text) if text else []
+        vectors = [
+            self._embed(texts[start : start + EMBED_BATCH])
+            for start in range(0, len(texts), EMBED_BATCH)
+        ]
+        return texts, np.concatenate(vectors) if vectors else None
+
+    def _add_file(self, path: str, stat: tuple, texts: list, vectors) -> int:
+        file_id = self._db.execute(
+            "INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)", (path, *stat)
+        ).lastrowid
+        if not texts:
+            return 0
+        if self.matrix is None:
+            self._create(vectors.shape[1])
+        for chunk, vector in zip(texts, vectors):
+            row = self._row()
+            self.matrix[row] = vector
+            self.lists[row] = self._cluster(vector)
+            self._db.execute(
+                "INSERT INTO chunks (id, file_id, text) VALUES (?, ?, ?)",
+                (row, file_id, chunk),
+            )
+        return len(texts)
+
+    def _row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self.count == len(self.matrix):
+            self._grow()
+        self.count += 1
+        return self.count - 1
+
+    def _cluster(self, vector: np.ndarray) -> int:
+        if self.centroids is None:
+            return 0
+        return int(np.argmax(self.centroids @ vector))
+
+    def _train(self):
+        """Cluster the rows once there are enough, and again as they double"""
+        live = np.flatnonzero(self.lists[: self.count] >= 0)
+        trained = int(self._meta("trained") or 0)
+        if len(live) < IVF_MIN_CHUNKS or (trained and len(live) < 2 * trained):
+            return
+        k = int(np.sqrt(len(live)))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), 40 * k), replace=False))
+        self.centroids = _kmeans(np.asarray(self.matrix[sample]), k)
+        for start in range(0, len(live), 16384):
+            rows = live[start : start + 16384]
+            scores = np.asarray(self.matrix[rows]) @ self.centroids.T
+            self.lists[rows] = np.argmax(scores, axis=1)
+        np.save(self.path / "centroids.npy", self.centroids)
+        self._set_meta("trained", len(live))
+        self._db.commit()
+
+    # --- retrieval -------------------------------------------------------
+
+    def nearest(self, vector: np.ndarray, k: int = DOCS_TOP_K) -> list:
+        """(row, score) of the `k` rows most similar to a unit `vector`"""
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        matrix, lists, centroids, order, bounds = snapshot
+        if centroids is None:
+            rows = np.flatnonzero(lists >= 0)
+        else:
+            probes = min(NPROBE, len(centroids))
+            nearest = np.argpartition(centroids @ vector, -probes)[-probes:]
+            rows = np.sort(
+                np.concatenate([order[bounds[c] : bounds[c + 1]] for c in nearest])
+            )
+        if not len(rows):
+            return []
+        scores = matrix[rows] @ vector
+        k = min(k, len(rows))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def search(self, query: str, k: int = DOCS_TOP_K, min_score=MIN_SCORE) -> list:
+        """The passages most similar to `query`, best first"""
+        if self._snapshot is None or not query.strip():
+            return []
+        hits = [
+            (row, score)
+            for row, score in self.nearest(self._embed([query])[0], k)
+            if score >= min_score
+        ]
+        passages = []
+        for row, score in hits:
+            found = self._reader.execute(
+                "SELECT f.path, c.text FROM chunks c"
+                " JOIN files f ON f.id = c.file_id WHERE c.id = ?",
+                (row,),
+            ).fetchone()
+            if found is not None:
+                passages.append(Passage(found[0], found[1], score))
+        return passages
+
+    def search_async(self, query: str, k: int = DOCS_TOP_K) -> Future:
+        return self._searcher.submit(self.search, query, k)
+
+    def close(self):
+        self._updater.shutdown(wait=True)
+        self._searcher.shutdown(wait=True)
+        self._reader.close()
+        self._db.close()
+
+
+def with_passages(prompt: str, passages: list) -> str:
+    """`prompt` preceded by the retrieved passages it may draw on"""
+    if not passages:
+        return prompt
+    excerpts = "\n\n".join(
+        f"[{i}] {p.path}\n{p.text}" for i, p in enumerate(passages, 1)
+    )
+    return (
+        "Use these excerpts from local documents if they help answer:\n\n"
+        f"{excerpts}\n\n---\n\n{prompt}"
+    )
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root) -> DocumentIndex:
+    """The process-wide index of the folder `root`"""
+    key = str(Path(root).expanduser().resolve())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = DocumentIndex(key)
+        return _indexes[key]
@@ -0,0 +1,323 @@
+"""Bulk embeddings: stream text records through /api/embed into a .npy file
+
+Records are read lazily and cut into fixed-size batches; at most
+`concurrency` batches are in flight at once (each holding a batch-priority
+scheduler slot on the pooled async client), so memory stays bounded by
+the batches in flight whatever the size of the corpus.
+
+Each batch's vectors are written straight to their rows of the output
+with pwrite(), in whatever order batches finish; the .npy header is
+rewritten with the final row count at the end, after which the file
+opens with np.load(path, mmap_mode="r"). A `<output>.progress` sidecar
+lists the finished batches, so an interrupted run resumes with --resume
+and embeds only what is missing. Row i of the output is the i-th record,
+and an `.ids.jsonl` file beside it (vectors.ids.jsonl for vectors.npy)
+holds the records' ids in the same order.
+
+Writing needs no numpy: vectors go out as raw float32.
+"""
+
+import ast
+import asyncio
+import json
+import os
+import sys
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+import aiohttp
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.batch import BUSY_RETRY_S
+from chat_llama.config import EMBED_MODEL
+from chat_llama.metrics import RequestMetrics, get_metrics
+from chat_llama.scheduler import BATCH, QueueFullError
+
+DEFAULT_BATCH_SIZE = 64
+PROGRESS_INTERVAL_S = 5.0
+# Room for any (rows, dim) shape; .npy pads the header to a multiple of 64
+HEADER_BYTES = 128
+_MAGIC = b"\x93NUMPY\x01\x00"
+_DESCR = "<f4" if sys.byteorder == "little" else ">f4"
+
+
+@dataclass
+class EmbedStats:
+    """Counters for one embedding run"""
+
+    vectors: int = 0
+    skipped: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self.vectors / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.vectors} vectors in {self.batches} batches, "
+            f"{self.skipped} already done, in {self.elapsed:.2f}s "
+            f"({self.vectors_per_second:.1f} vectors/s)"
+        )
+
+
+def read_texts(lines: Iterable[str], field: str = "text"):
+    """Yield (id, text): JSON object lines by `field`, other lines verbatim"""
+    for index, line in enumerate(lines):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            yield record.get("id", index), str(record.get(field, ""))
+        else:
+            yield index, line
+
+
+def _header(rows: int, dim: int) -> bytes:
+    header = {"descr": _DESCR, "fortran_order": False, "shape": (rows, dim)}
+    text = repr(header).encode("latin1")
+    padding = HEADER_BYTES - len(_MAGIC) - 2 - len(text) - 1
+    return (
+        _MAGIC
+        + (HEADER_BYTES - len(_MAGIC) - 2).to_bytes(2, "little")
+        + text
+        + b" " * padding
+        + b"\n"
+    )
+
+
+class NpyWriter:
+    """Float32 rows written in any order into a .npy file, shaped on close"""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.dim: Optional[int] = None
+        exists = resume and os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | (0 if exists else os.O_TRUNC))
+        if exists:
+            with open(path, "rb") as f:
+                head = f.read(HEADER_BYTES)
+            if head[: len(_MAGIC)] == _MAGIC:
+                header = ast.literal_eval(head[len(_MAGIC) + 2 :].decode("latin1"))
+                self.dim = header["shape"][1]
+
+    def write(self, row: int, vectors: list):
+        if self.dim is None:
+            self.dim = len(vectors[0])
+            os.pwrite(self.fd, _header(0, self.dim), 0)
+        data = array("f")
+        for vector in vectors:
+            if len(vector) != self.dim:
+                raise ValueError(f"got a {len(vector)}-d vector, expected {self.dim}")
+            data.extend(vector)
+        os.pwrite(self.fd, data.tobytes(), HEADER_BYTES + row * self.dim * 4)
+
+    def close(self, rows: Optional[int] = None):
+        """Finish the file with `rows` rows (None: leave it resumable)"""
+        if rows is not None and self.dim is not None:
+            os.pwrite(self.fd, _header(rows, self.dim), 0)
+            os.ftruncate(self.fd, HEADER_BYTES + rows * self.dim * 4)
+        os.close(self.fd)
+
+
+class Progress:
+    """The `<output>.progress` sidecar: run settings, then finished batches"""
+
+    def __init__(self, path: str, settings: dict, resume: bool = False):
+        self.path = path
+        self.done = set()
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            if lines and json.loads(lines[0]) != settings:
+                raise ValueError(
+                    f"{path} was written with {lines[0]}; resume with the same"
+                    " model and batch size"
+                )
+            for line in lines[1:]:
+                if line.isdigit():
+                    self.done.add(int(line))
+            self.file = open(path, "a", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+            self.file.write(json.dumps(settings) + "\n")
+            self.file.flush()
+
+    def finished(self, batch: int):
+        self.file.write(f"{batch}\n")
+        self.file.flush()
+
+    def close(self, complete: bool):
+        self.file.close()
+        if complete:
+            os.remove(self.path)
+
+
+async def _embed_batch(client, model, texts, caller, fields) -> list:
+    while True:
+        metrics = RequestMetrics(model, "/api/embed")
+        try:
+            vectors = await client.embed(model, texts, metrics, caller=caller, **fields)
+        except QueueFullError:
+            # Rejected before anything was sent, so retrying is safe
+            get_metrics().record(metrics)
+            await asyncio.sleep(BUSY_RETRY_S)
+            continue
+        except Exception as e:
+            metrics.finish(outcome="error", error=str(e))
+            get_metrics().record(metrics)
+            raise
+        metrics.finish(outcome="ok")
+        get_metrics().record(metrics)
+        return vectors
+
+
+async def embed_corpus(
+    records: Iterable,
+    writer: NpyWriter,
+    model: str = EMBED_MODEL,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = 4,
+    done: Optional[set] = None,
+    client: Optional[AsyncOllamaClient] = None,
+    progress: Optional[Progress] = None,
+    ids=None,
+    report: Optional[Callable[[EmbedStats], None]] = None,
+    **fields,
+) -> tuple:
+    """Embed (id, text) records into `writer`; returns (stats, rows)
+
+    Batch k holds records [k * batch_size, (k + 1) * batch_size); batches
+    in `done` are skipped. `ids`, if given, receives each record's id as
+    a JSON line in row order.
+    """
+    owned = client is None
+    client = client or AsyncOllamaClient(limit=concurrency, priority=BATCH)
+    done = done or set()
+    stats = EmbedStats()
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    failure = []
+    started = time.perf_counter()
+    reported = started
+
+    async def worker(index, texts):
+        try:
+            vectors = await _embed_batch(client, model, texts, "embed", fields)
+            writer.write(index * batch_size, vectors)
+            if progress is not None:
+                progress.finished(index)
+            stats.vectors += len(vectors)
+            stats.batches += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            failure.append(e)
+        finally:
+            slots.release()
+
+    rows = 0
+    batch = []
+    index = 0
+    try:
+        for record_id, text in records:
+            if ids is not None:
+                ids.write(json.dumps(record_id) + "\n")
+            rows += 1
+            batch.append(text)
+            if len(batch) < batch_size:
+                continue
+            if index in done:
+                stats.skipped += len(batch)
+            else:
+                # Only read on once a batch slot is free, so the corpus
+                # streams through rather than piling up in memory
+                await slots.acquire()
+                if failure:
+                    break
+                task = asyncio.create_task(worker(index, batch))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            batch = []
+            index += 1
+            now = time.perf_counter()
+            if report is not None and now - reported >= PROGRESS_INTERVAL_S:
+                reported = now
+                stats.elapsed = now - started
+                report(stats)
+        else:
+            if batch and index not in done:
+                await slots.acquire()
+                await worker(index, batch)
+            elif batch:
+                stats.skipped += len(batch)
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        # On failure, stop the batches still running before the client
+        # goes: a late one would otherwise open a fresh session
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        stats.elapsed = time.perf_counter() - started
+        if owned:
+            await client.close()
+    if failure:
+        raise failure[0]
+    return stats, rows
+
+
+def embed_main(
+    input_path: str,
+    output_path: str,
+    model: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = 4,
+    resume: bool = False,
+    field: str = "text",
+) -> EmbedStats:
+    """Embed a text or JSONL file (or "-" for stdin) into a .npy file
+
+    Raises ValueError for an input without records rather than leave an
+    output that isn't a valid .npy.
+    """
+    model = model or EMBED_MODEL
+    settings = {"model": model, "batch_size": batch_size}
+    progress = Progress(f"{output_path}.progress", settings, resume)
+    resume = resume and bool(progress.done)
+    writer = NpyWriter(output_path, resume)
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    stem = output_path[:-4] if output_path.endswith(".npy") else output_path
+    ids_path = f"{stem}.ids.jsonl"
+    ids = open(ids_path, "w", encoding="utf-8")
+    rows = None
+    try:
+        stats, rows = asyncio.run(
+            embed_corpus(
+                read_texts(source, field),
+                writer,
+                model,
+                batch_size,
+                concurrency,
+                progress.done,
+                progress=progress,
+                ids=ids,
+                report=lambda s: print(s.summary(), file=sys.stderr),
+            )
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        ids.close()
+        writer.close(rows)
+        progress.close(complete=rows is not None)
+    if writer.dim is None:
+        # No vector was ever written, so there is no dimension to shape by
+        os.remove(output_path)
+        os.remove(ids_path)
+        raise ValueError(f"{input_path}: no records to embed")
+    print(stats.summary(), file=sys.stderr)
+    return stats
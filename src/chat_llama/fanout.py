@@ -0,0 +1,159 @@
+"""Send one prompt to several models at once
+
+fan_out() streams every model's answer concurrently and yields a result
+per model as each one finishes; with race=True the first complete answer
+wins and the others are cancelled (their connections dropped, so the
+server stops generating). The fancy GUI's Compare menu uses FanOut, the
+same thing on the shared StreamWorker, to stream each model into its own
+pane.
+
+Fan-out requests are one-shot: no conversation context and no response
+cache, so repeated comparisons measure the models rather than the cache.
+"""
+
+import asyncio
+import json
+import queue
+import sys
+from typing import Optional, TextIO
+
+import aiohttp
+
+from chat_llama.async_client import AsyncOllamaClient, StreamEvent, get_worker
+from chat_llama.config import keep_alive
+from chat_llama.metrics import RequestMetrics, get_metrics
+from chat_llama.scheduler import QueueFullError
+
+# Per-model timing carried into each result, from RequestMetrics.to_dict()
+RESULT_FIELDS = (
+    "outcome",
+    "error",
+    "ttfb_s",
+    "ttft_s",
+    "total_s",
+    "tokens",
+    "tokens_per_s",
+    "load_s",
+    "eval_count",
+)
+
+
+def result(model: str, text: str, metrics: RequestMetrics) -> dict:
+    record = metrics.to_dict()
+    return {
+        "model": model,
+        "response": text,
+        **{k: record[k] for k in RESULT_FIELDS if k in record},
+    }
+
+
+async def _one(client: AsyncOllamaClient, model: str, prompt: str, fields: dict):
+    metrics = RequestMetrics(model, "/api/generate")
+    parts = []
+    try:
+        chunks = client.stream_generate(model, prompt, metrics, cache=False, **fields)
+        async for chunk in chunks:
+            if chunk.get("done"):
+                metrics.finish(chunk)
+            elif chunk.get("response"):
+                metrics.mark_token()
+                parts.append(chunk["response"])
+    except asyncio.CancelledError:
+        # Lost the race: report what arrived instead of propagating
+        metrics.finish(outcome="cancelled")
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, QueueFullError) as e:
+        metrics.finish(outcome="error", error=str(e))
+    get_metrics().record(metrics)
+    return result(model, "".join(parts), metrics)
+
+
+async def fan_out(
+    models: list,
+    prompt: str,
+    race: bool = False,
+    client: Optional[AsyncOllamaClient] = None,
+    **fields,
+):
+    """Yield each model's result as it finishes, fastest first"""
+    own_client = client is None
+    client = client or AsyncOllamaClient()
+    tasks = [
+        asyncio.ensure_future(
+            _one(client, model, prompt, {"keep_alive": keep_alive(model), **fields})
+        )
+        for model in models
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            record = await finished
+            if race and record["outcome"] == "ok":
+                race = False
+                for task in tasks:
+                    task.cancel()
+            yield record
+    finally:
+        # Let the cancelled streams drop their connections before the
+        # client (and its session) goes
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_client:
+            await client.close()
+
+
+def fanout_main(models: list, prompt: str, race: bool = False, out: TextIO = None):
+    """Write one JSONL result per model to `out` (stdout) as each finishes"""
+    out = out or sys.stdout
+
+    async def run():
+        async for record in fan_out(models, prompt, race):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+    asyncio.run(run())
+
+
+class FanOut:
+    """One prompt's requests to several models on the StreamWorker
+
+    Front-ends pass every event from `out` to handle(), which returns the
+    model it belongs to (None for other requests' events). In race mode
+    the first completed answer cancels the rest.
+    """
+
+    def __init__(self, out: queue.Queue, models: list, prompt: str, race=False):
+        self.worker = get_worker()
+        self.race = race
+        self.winner: Optional[str] = None
+        self.metrics = {m: RequestMetrics(m, "/api/generate") for m in models}
+        self.models = {}
+        for model in models:
+            request_id = self.worker.submit(
+                out,
+                model,
+                prompt,
+                metrics=self.metrics[model],
+                cache=False,
+                keep_alive=keep_alive(model),
+            )
+            self.models[request_id] = model
+        self.pending = set(self.models)
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending
+
+    def handle(self, event: StreamEvent) -> Optional[str]:
+        model = self.models.get(event.request_id)
+        if model is None or event.kind == "chunk":
+            return model
+        self.pending.discard(event.request_id)
+        get_metrics().record(self.metrics[model])
+        if event.kind == "done" and self.race and self.winner is None:
+            self.winner = model
+            self.cancel()
+        return model
+
+    def cancel(self):
+        for request_id in self.pending:
+            self.worker.cancel(request_id)
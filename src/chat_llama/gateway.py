@@ -0,0 +1,490 @@
+"""OpenAI-compatible gateway: `chat-llama serve`
+
+Tools written against the OpenAI API can point their base URL at
+http://HOST:PORT/v1 and get local models through the same request path
+as the rest of chat_llama: the pooled AsyncOllamaClient, the response
+caches, the backend pool and the per-backend scheduler (each client
+address is a scheduler caller, so one busy tool can't starve the rest).
+
+    POST /v1/chat/completions   -> /api/chat
+    POST /v1/completions        -> /api/generate
+    GET  /v1/models             -> /api/tags
+    GET  /metrics               -> Prometheus text, as `chat-llama metrics`
+    GET  /gateway/stats         -> request and coalescing counters
+
+Identical deterministic requests (same model, prompt and options, with
+temperature 0 or a seed; the ResponseCache's rule and key) that arrive
+while one is already streaming join it: a Flight records the upstream
+chunks and replays them to each request from the start, so N waiting
+clients cost one generation. The upstream stream is cancelled only when
+every request following it has gone. Send `Cache-Control: no-cache` to
+skip the caches and coalescing.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.cache import ResponseCache, default_cache, default_semantic_cache
+from chat_llama.config import GATEWAY_HOST, GATEWAY_PORT, keep_alive
+from chat_llama.metrics import RequestMetrics, get_metrics
+from chat_llama.scheduler import QueueFullError
+
+# OpenAI request fields passed through as Ollama options
+_OPTION_FIELDS = {
+    "temperature": "temperature",
+    "top_p": "top_p",
+    "seed": "seed",
+    "max_tokens": "num_predict",
+    "max_completion_tokens": "num_predict",
+    "presence_penalty": "presence_penalty",
+    "frequency_penalty": "frequency_penalty",
+}
+_DONE_EVENT = b"data: [DONE]\n\n"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _text(chunk: dict) -> str:
+    """The new text in a /api/generate or /api/chat chunk"""
+    return chunk.get("response") or (chunk.get("message") or {}).get("content") or ""
+
+
+def _event(value) -> bytes:
+    return f"data: {_dumps(value)}\n\n".encode("utf-8")
+
+
+class Flight:
+    """One upstream stream, replayed to every request that follows it"""
+
+    def __init__(self, chunks, metrics: RequestMetrics):
+        self.chunks = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.followers = 0
+        self.abandoned = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(chunks, metrics))
+
+    def _wake(self):
+        # Wakes everyone waiting on the old event; later waits use the new one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, chunks, metrics: RequestMetrics):
+        try:
+            async for chunk in chunks:
+                if chunk.get("done"):
+                    metrics.finish(chunk)
+                elif _text(chunk):
+                    metrics.mark_token()
+                self.chunks.append(chunk)
+                self._wake()
+        except asyncio.CancelledError:
+            metrics.finish(outcome="cancelled")
+            raise
+        except Exception as e:
+            # Kept for every follower to raise, not just the first
+            metrics.finish(outcome="error", error=str(e))
+            self.error = e
+        finally:
+            await chunks.aclose()
+            get_metrics().record(metrics)
+            self.done = True
+            self._wake()
+
+    async def follow(self):
+        """Yield the chunks so far as one list, then each new batch"""
+        self.followers += 1
+        sent = 0
+        try:
+            while True:
+                if sent < len(self.chunks):
+                    batch = self.chunks[sent:]
+                    sent += len(batch)
+                    yield batch
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.followers -= 1
+            if not self.followers and not self.done:
+                # Nobody is listening: drop the connection so Ollama stops
+                self.abandoned = True
+                self.task.cancel()
+
+
+class Completion:
+    """OpenAI response objects for one request, built from Ollama chunks"""
+
+    def __init__(self, model: str, chat: bool, include_usage: bool = False):
+        self.model = model
+        self.chat = chat
+        self.include_usage = include_usage
+        self.id = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex[:24]}"
+        self.created = int(time.time())
+        self._started = False
+
+    @staticmethod
+    def finish_reason(chunk: dict) -> str:
+        return "length" if chunk.get("done_reason") == "length" else "stop"
+
+    @staticmethod
+    def usage(chunk: dict) -> dict:
+        prompt = chunk.get("prompt_eval_count", 0)
+        completion = chunk.get("eval_count", 0)
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+        }
+
+    def _object(self, stream: bool) -> str:
+        if not self.chat:
+            return "text_completion"
+        return "chat.completion.chunk" if stream else "chat.completion"
+
+    def _envelope(self, choices: list, stream: bool) -> dict:
+        return {
+            "id": self.id,
+            "object": self._object(stream),
+            "created": self.created,
+            "model": self.model,
+            "choices": choices,
+        }
+
+    def _delta(self, text: str, finish_reason=None) -> dict:
+        if not self.chat:
+            choice = {"index": 0, "text": text, "logprobs": None}
+        else:
+            delta = {"content": text} if text or finish_reason is None else {}
+            if not self._started:
+                delta["role"] = "assistant"
+            choice = {"index": 0, "delta": delta}
+        self._started = True
+        return self._envelope([{**choice, "finish_reason": finish_reason}], True)
+
+    def events(self, chunks: list) -> bytes:
+        """Server-sent events for a batch of chunks"""
+        out = []
+        for chunk in chunks:
+            text = _text(chunk)
+            if text:
+                out.append(_event(self._delta(text)))
+            if chunk.get("done"):
+                out.append(_event(self._delta("", self.finish_reason(chunk))))
+                if self.include_usage:
+                    usage = self._envelope([], True)
+                    usage["usage"] = self.usage(chunk)
+                    out.append(_event(usage))
+        return b"".join(out)
+
+    def response(self, chunks: list) -> dict:
+        """The whole (non-streamed) response"""
+        text = "".join(_text(chunk) for chunk in chunks)
+        final = chunks[-1] if chunks and chunks[-1].get("done") else {}
+        if self.chat:
+            choice = {"message": {"role": "assistant", "content": text}}
+        else:
+            choice = {"text": text, "logprobs": None}
+        choice = {"index": 0, **choice, "finish_reason": self.finish_reason(final)}
+        body = self._envelope([choice], False)
+        body["usage"] = self.usage(final)
+        return body
+
+
+def _error_body(status: int, message: str, kind: str) -> dict:
+    return {"error": {"message": message, "type": kind, "code": status}}
+
+
+def _error(status: int, message: str, kind: str = "invalid_request_error", **headers):
+    body = _error_body(status, message, kind)
+    return web.json_response(body, status=status, headers=headers or None, dumps=_dumps)
+
+
+def _classify(e: BaseException) -> tuple:
+    """(status, message, type) for a failed upstream request"""
+    if isinstance(e, QueueFullError):
+        return 429, str(e), "rate_limit_error"
+    if isinstance(e, aiohttp.ClientResponseError) and e.status < 500:
+        return e.status, f"Ollama: {e.message}", "invalid_request_error"
+    if isinstance(e, asyncio.TimeoutError):
+        return 504, "Ollama timed out", "server_error"
+    return 502, f"Ollama request failed: {e}", "server_error"
+
+
+def _upstream_error(e: BaseException) -> web.Response:
+    status, message, kind = _classify(e)
+    headers = {"Retry-After": "1"} if status == 429 else {}
+    return _error(status, message, kind, **headers)
+
+
+def _invalid_message(message) -> Optional[str]:
+    """Why `message` is not an OpenAI chat message, or None if it is one"""
+    if not isinstance(message, dict):
+        return "each message must be an object"
+    content = message.get("content")
+    if content is None or isinstance(content, str):
+        return None
+    if not isinstance(content, list):
+        return "message content must be a string or a list of parts"
+    for part in content:
+        if not isinstance(part, dict):
+            return "each content part must be an object"
+        if part.get("type") == "text" and not isinstance(part.get("text"), str):
+            return "a text part needs a string text"
+        if part.get("type") == "image_url" and not isinstance(
+            part.get("image_url"), dict
+        ):
+            return "an image_url part needs an image_url object"
+    return None
+
+
+def _message(message: dict) -> dict:
+    """An OpenAI chat message as an Ollama one (text and data: URL images)"""
+    content = message.get("content") or ""
+    out = {"role": message.get("role", "user")}
+    if isinstance(content, list):
+        images = [
+            part["image_url"]["url"].partition(",")[2]
+            for part in content
+            if part.get("type") == "image_url"
+            and str(part.get("image_url", {}).get("url", "")).startswith("data:")
+        ]
+        if images:
+            out["images"] = images
+        content = "".join(p.get("text", "") for p in content if p.get("type") == "text")
+    out["content"] = content
+    return out
+
+
+def _fields(body: dict) -> dict:
+    """Ollama request fields for the OpenAI sampling and format settings"""
+    options = {
+        name: body[field]
+        for field, name in _OPTION_FIELDS.items()
+        if body.get(field) is not None
+    }
+    stop = body.get("stop")
+    if stop:
+        options["stop"] = [stop] if isinstance(stop, str) else list(stop)
+    fields = {"keep_alive": keep_alive(body["model"])}
+    if options:
+        fields["options"] = options
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_object":
+        fields["format"] = "json"
+    elif response_format.get("type") == "json_schema":
+        fields["format"] = response_format.get("json_schema", {}).get("schema", {})
+    return fields
+
+
+class Gateway:
+    """The OpenAI-style routes over one shared AsyncOllamaClient"""
+
+    def __init__(self, client: Optional[AsyncOllamaClient] = None):
+        self.client = client or AsyncOllamaClient(
+            cache=default_cache(), semantic_cache=default_semantic_cache()
+        )
+        self.flights = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def routes(self) -> list:
+        return [
+            web.post("/v1/chat/completions", self.chat_completions),
+            web.post("/v1/completions", self.completions),
+            web.get("/v1/models", self.models),
+            web.get("/metrics", self.metrics),
+            web.get("/gateway/stats", self.stats),
+        ]
+
+    def open(self, path: str, payload: dict, caller: str, cache: bool) -> Flight:
+        """Join the stream already running for this request, or start one"""
+        self.requests += 1
+        key = None
+        if cache and ResponseCache.is_cacheable(payload):
+            key = ResponseCache.key(path, payload)
+            flight = self.flights.get(key)
+            if flight is not None and not flight.abandoned:
+                self.coalesced += 1
+                return flight
+        metrics = RequestMetrics(payload["model"], path)
+        chunks = self.client.stream(path, payload, metrics, caller=caller, cache=cache)
+        flight = Flight(chunks, metrics)
+        if key is not None:
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._landed(key, flight))
+        return flight
+
+    def _landed(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await self._body(request)
+        if isinstance(body, web.Response):
+            return body
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return _error(400, "messages must be a non-empty list")
+        for message in messages:
+            problem = _invalid_message(message)
+            if problem is not None:
+                return _error(400, problem)
+        payload = self.client.payload(
+            {
+                "model": body["model"],
+                "messages": [_message(m) for m in messages],
+                **_fields(body),
+            }
+        )
+        return await self._respond(request, body, "/api/chat", payload)
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        body = await self._body(request)
+        if isinstance(body, web.Response):
+            return body
+        prompt = body.get("prompt")
+        if isinstance(prompt, list) and len(prompt) == 1:
+            prompt = prompt[0]
+        if not isinstance(prompt, str):
+            return _error(400, "prompt must be a string (one prompt per request)")
+        fields = _fields(body)
+        if body.get("suffix"):
+            fields["suffix"] = body["suffix"]
+        payload = self.client.payload(
+            {"model": body["model"], "prompt": prompt, **fields}
+        )
+        return await self._respond(request, body, "/api/generate", payload)
+
+    async def _body(self, request: web.Request):
+        """The decoded request body, or an error response"""
+        try:
+            body = await request.json()
+        except ValueError:
+            return _error(400, "request body must be JSON")
+        if not isinstance(body, dict) or not body.get("model"):
+            return _error(400, "model is required")
+        if (body.get("n") or 1) != 1:
+            return _error(400, "n > 1 is not supported")
+        return body
+
+    async def _respond(self, request, body, path, payload) -> web.StreamResponse:
+        cache = "no-cache" not in request.headers.get("Cache-Control", "")
+        flight = self.open(path, payload, request.remote or "", cache)
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        completion = Completion(body["model"], path == "/api/chat", include_usage)
+        batches = flight.follow()
+        try:
+            if not body.get("stream"):
+                chunks = []
+                try:
+                    async for batch in batches:
+                        chunks.extend(batch)
+                except Exception as e:
+                    return _upstream_error(e)
+                return web.json_response(completion.response(chunks), dumps=_dumps)
+            # Wait for the first chunk so upstream failures get a real status
+            try:
+                first = await batches.__anext__()
+            except StopAsyncIteration:
+                first = []
+            except Exception as e:
+                return _upstream_error(e)
+            response = web.StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                }
+            )
+            await response.prepare(request)
+            try:
+                await self._events(response, completion, first, batches)
+            except ConnectionResetError:
+                pass  # the client left; closing `batches` lets the flight go
+            return response
+        finally:
+            await batches.aclose()
+
+    async def _events(self, response, completion, first, batches):
+        await response.write(completion.events(first))
+        while True:
+            try:
+                batch = await batches.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                # Headers are gone: report in-band and end without [DONE]
+                await response.write(_event(_error_body(*_classify(e))))
+                return
+            await response.write(completion.events(batch))
+        await response.write(_DONE_EVENT)
+        await response.write_eof()
+
+    async def models(self, request: web.Request) -> web.Response:
+        try:
+            async with self.client.session.get(self.client.url("/api/tags")) as r:
+                r.raise_for_status()
+                tags = await r.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return _upstream_error(e)
+        data = [
+            {"id": m["name"], "object": "model", "created": 0, "owned_by": "ollama"}
+            for m in tags.get("models", [])
+        ]
+        return web.json_response({"object": "list", "data": data}, dumps=_dumps)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        text = get_metrics().prometheus()
+        return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.flights),
+            }
+        )
+
+    async def close(self):
+        for flight in list(self.flights.values()):
+            flight.task.cancel()
+        await self.client.close()
+
+
+def build_app(gateway: Optional[Gateway] = None) -> web.Application:
+    # The client's session is created lazily, on the server's loop
+    gateway = gateway or Gateway()
+    app = web.Application()
+    app.add_routes(gateway.routes())
+
+    async def close(app):
+        await gateway.close()
+
+    app.on_cleanup.append(close)
+    return app
+
+
+def serve(host: Optional[str] = None, port: Optional[int] = None):
+    """Run the gateway until interrupted"""
+    host = host or GATEWAY_HOST
+    port = port or GATEWAY_PORT
+    web.run_app(
+        build_app(),
+        host=host,
+        port=port,
+        print=lambda _: print(f"chat-llama gateway on http://{host}:{port}/v1"),
+    )
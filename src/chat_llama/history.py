@@ -0,0 +1,326 @@
+"""Conversation history on SQLite, searchable with FTS5
+
+Writes never block the caller: start(), add_message(), append() and
+finish() queue work for one writer thread and return handles whose ids
+fill in once written. Streamed text is batched twice: ConversationRecorder
+buffers tokens and appends every FLUSH_INTERVAL_S, and the writer holds
+appends back for up to that long so the streams of a busy process share
+one commit, one UPDATE per message. Anything else commits promptly.
+
+Reads are paged: conversations() returns titles a page at a time, newest
+first, with keyset pagination (so page 500 costs what page 1 does), and
+message bodies are only read by messages() when a conversation is
+opened. A finished message is added to the full-text index once, rather
+than on every append.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_HISTORY_PATH = Path.home() / ".cache" / "chat_llama" / "history.sqlite3"
+FLUSH_INTERVAL_S = 0.25
+PAGE_SIZE = 100
+TITLE_CHARS = 80
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS conversations ("
+    " id INTEGER PRIMARY KEY, title TEXT NOT NULL, model TEXT NOT NULL,"
+    " created REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS conversations_updated"
+    " ON conversations (updated, id)",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL,"
+    " role TEXT NOT NULL, content TEXT NOT NULL, model TEXT NOT NULL,"
+    " created REAL NOT NULL, done INTEGER NOT NULL DEFAULT 0)",
+    "CREATE INDEX IF NOT EXISTS messages_conversation"
+    " ON messages (conversation_id, id)",
+)
+# External-content index: the text lives once, in messages
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts"
+    " USING fts5(content, content='messages', content_rowid='id')"
+)
+
+
+class Handle:
+    """A conversation or message queued for writing; `id` is set once written"""
+
+    __slots__ = ("id",)
+
+    def __init__(self):
+        self.id: Optional[int] = None
+
+
+def _match(query: str) -> str:
+    """FTS5 query for the words typed so far, the last one as a prefix"""
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    return " ".join(words) + "*" if words else ""
+
+
+class ConversationStore:
+    """Conversations and their messages, written in the background"""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, flush_interval=FLUSH_INTERVAL_S):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        try:
+            self._db.execute(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            self.fts = False
+        self._db.commit()
+        self._ops = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_forever, name="chat-llama-history", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # WAL commits skip the fsync; a crash loses at most the last batch
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    # --- writes (queued) -------------------------------------------------
+
+    def start(self, model: str, title: str) -> Handle:
+        """Begin a conversation, titled by (the start of) its first prompt"""
+        handle = Handle()
+        title = " ".join(title.split())[:TITLE_CHARS] or "(empty prompt)"
+        self._ops.put(("start", handle, (model, title, time.time())))
+        return handle
+
+    def add_message(
+        self, conversation: Handle, role: str, model: str, content: str = ""
+    ) -> Handle:
+        """Add a message; complete it with finish() (after any append()s)"""
+        handle = Handle()
+        self._ops.put(("message", handle, (conversation, role, model, content)))
+        return handle
+
+    def append(self, message: Handle, text: str):
+        self._ops.put(("append", message, text))
+
+    def finish(self, message: Handle):
+        """Mark the message complete and index it for search"""
+        self._ops.put(("finish", message, None))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is committed"""
+        done = threading.Event()
+        self._ops.put(("flush", None, done))
+        return done.wait(timeout)
+
+    def close(self):
+        self._ops.put(("close", None, None))
+        self._writer.join()
+        with self._lock:
+            self._db.close()
+
+    def _batch(self) -> list:
+        ops = [self._ops.get()]
+        deadline = time.monotonic() + self.flush_interval
+        # Token appends wait to share a commit; anything else goes out now
+        while ops[-1][0] == "append":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                ops.append(self._ops.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return ops
+
+    def _write_forever(self):
+        db = self._connect()
+        while True:
+            ops = self._batch()
+            try:
+                with db:
+                    self._apply(db, ops)
+            except sqlite3.Error:
+                # History is best effort; a failed batch must not stop the chat
+                pass
+            for kind, _, done in ops:
+                if kind == "flush":
+                    done.set()
+                elif kind == "close":
+                    db.close()
+                    return
+
+    def _apply(self, db: sqlite3.Connection, ops: list):
+        appended = {}
+        for kind, handle, args in ops:
+            if kind == "append":
+                appended.setdefault(handle, []).append(args)
+                continue
+            # Write buffered text before anything that depends on it
+            self._write_appends(db, appended)
+            appended = {}
+            now = time.time()
+            if kind == "start":
+                model, title, created = args
+                handle.id = db.execute(
+                    "INSERT INTO conversations (title, model, created, updated)"
+                    " VALUES (?, ?, ?, ?)",
+                    (title, model, created, created),
+                ).lastrowid
+            elif kind == "message":
+                conversation, role, model, content = args
+                handle.id = db.execute(
+                    "INSERT INTO messages"
+                    " (conversation_id, role, content, model, created)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (conversation.id, role, content, model, now),
+                ).lastrowid
+                db.execute(
+                    "UPDATE conversations SET updated = ? WHERE id = ?",
+                    (now, conversation.id),
+                )
+            elif kind == "finish":
+                db.execute("UPDATE messages SET done = 1 WHERE id = ?", (handle.id,))
+                if self.fts:
+                    db.execute(
+                        "INSERT INTO messages_fts (rowid, content)"
+                        " SELECT id, content FROM messages WHERE id = ?",
+                        (handle.id,),
+                    )
+        self._write_appends(db, appended)
+
+    def _write_appends(self, db: sqlite3.Connection, appended: dict):
+        for handle, parts in appended.items():
+            db.execute(
+                "UPDATE messages SET content = content || ? WHERE id = ?",
+                ("".join(parts), handle.id),
+            )
+
+    # --- reads (paged) ---------------------------------------------------
+
+    def conversations(
+        self, query: str = "", before: Optional[tuple] = None, limit: int = PAGE_SIZE
+    ) -> list:
+        """A page of conversations, newest first, optionally matching `query`
+
+        Rows are (id, title, model, updated); pass the last row's
+        (updated, id) as `before` for the next page.
+        """
+        where, params = [], []
+        if query.strip():
+            if self.fts:
+                where.append(
+                    "id IN (SELECT m.conversation_id FROM messages_fts"
+                    " JOIN messages m ON m.id = messages_fts.rowid"
+                    " WHERE messages_fts MATCH ?)"
+                )
+                params.append(_match(query))
+            else:
+                where.append(
+                    "id IN (SELECT conversation_id FROM messages"
+                    " WHERE content LIKE ? ESCAPE '\\')"
+                )
+                escaped = query.strip().replace("\\", "\\\\")
+                escaped = escaped.replace("%", "\\%").replace("_", "\\_")
+                params.append(f"%{escaped}%")
+        if before is not None:
+            where.append("(updated, id) < (?, ?)")
+            params.extend(before)
+        sql = "SELECT id, title, model, updated FROM conversations"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated DESC, id DESC LIMIT ?"
+        with self._lock:
+            return self._db.execute(sql, (*params, limit)).fetchall()
+
+    def messages(
+        self, conversation_id: int, after: int = 0, limit: int = PAGE_SIZE
+    ) -> list:
+        """A page of one conversation's messages: (id, role, model, content)"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, role, model, content FROM messages"
+                " WHERE conversation_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (conversation_id, after, limit),
+            ).fetchall()
+
+
+class ConversationRecorder:
+    """A front-end's current conversation: prompts in, streamed replies out
+
+    Streamed text is buffered here and handed to the store at most every
+    FLUSH_INTERVAL_S, so a token costs a list append rather than a queue
+    round trip. Every method is a no-op without a store (history off).
+    """
+
+    def __init__(self, store: Optional[ConversationStore]):
+        self.store = store
+        self.conversation: Optional[Handle] = None
+        self.reply: Optional[Handle] = None
+        self._parts = []
+        self._due = 0.0
+
+    def prompt(self, model: str, text: str):
+        """Record a sent prompt and open the reply that streams into write()"""
+        if self.store is None:
+            return
+        self.finish()
+        if self.conversation is None:
+            self.conversation = self.store.start(model, text)
+        self.store.finish(
+            self.store.add_message(self.conversation, "user", model, text)
+        )
+        self.reply = self.store.add_message(self.conversation, "assistant", model)
+
+    def write(self, text: str):
+        if self.reply is None:
+            return
+        self._parts.append(text)
+        now = time.monotonic()
+        if now >= self._due:
+            self._due = now + FLUSH_INTERVAL_S
+            self._hand_over()
+
+    def _hand_over(self):
+        if self._parts:
+            self.store.append(self.reply, "".join(self._parts))
+            self._parts = []
+
+    def finish(self):
+        """The reply is complete (or stopped): index what arrived"""
+        if self.reply is not None:
+            self._hand_over()
+            self.store.finish(self.reply)
+            self.reply = None
+
+    def new_conversation(self):
+        self.finish()
+        self.conversation = None
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history() -> Optional[ConversationStore]:
+    """The process-wide store named by CHAT_LLAMA_HISTORY ("0" disables it)"""
+    global _store
+    setting = os.environ.get("CHAT_LLAMA_HISTORY", "")
+    if setting == "0":
+        return None
+    with _store_lock:
+        if _store is None:
+            path = setting if setting not in ("", "1") else DEFAULT_HISTORY_PATH
+            _store = ConversationStore(path)
+    return _store
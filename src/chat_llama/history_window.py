@@ -0,0 +1,119 @@
+"""Tk window over the conversation store, shared by the desktop GUIs
+
+Nothing is read until the window opens. The list then loads a page of
+titles at a time, fetching the next page as the user scrolls near the
+end; a conversation's messages are read only when it is selected, a page
+per idle callback, so a huge store or a long conversation never stalls
+the event loop.
+"""
+
+import datetime
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable
+
+from chat_llama.history import PAGE_SIZE, ConversationStore
+
+SEARCH_DELAY_MS = 200
+# Fetch the next page once the view is this far down the loaded rows
+LOAD_MORE_AT = 0.9
+
+
+class HistoryWindow(tk.Toplevel):
+    """Search and browse stored conversations
+
+    `show(messages, first)` receives each page of the selected
+    conversation's (id, role, model, content) rows; `first` marks the
+    start of a newly selected conversation.
+    """
+
+    def __init__(
+        self, master, store: ConversationStore, show: Callable[[list, bool], None]
+    ):
+        super().__init__(master)
+        self.title("History")
+        self.geometry("480x600")
+        self.store = store
+        self.show = show
+        self.last = None
+        self.more = True
+        self._search_job = None
+        self._messages_job = None
+
+        self.query_var = tk.StringVar()
+        search = ttk.Entry(self, textvariable=self.query_var)
+        search.pack(fill=tk.X, padx=5, pady=5)
+        search.bind("<KeyRelease>", self._on_search)
+
+        frame = ttk.Frame(self)
+        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+        self.tree = ttk.Treeview(
+            frame, columns=("model", "updated"), show="tree headings"
+        )
+        self.tree.heading("#0", text="Conversation")
+        self.tree.heading("model", text="Model")
+        self.tree.heading("updated", text="Last message")
+        self.tree.column("#0", width=260)
+        self.tree.column("model", width=90, stretch=False)
+        self.tree.column("updated", width=110, stretch=False)
+        self.scrollbar = ttk.Scrollbar(frame, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        search.focus_set()
+        self.reload()
+
+    def reload(self):
+        """Start over from the newest conversation matching the search"""
+        self.tree.delete(*self.tree.get_children())
+        self.last = None
+        self.more = True
+        self._load_page()
+
+    def _load_page(self):
+        rows = self.store.conversations(self.query_var.get(), self.last)
+        for conversation_id, title, model, updated in rows:
+            when = datetime.datetime.fromtimestamp(updated).strftime("%Y-%m-%d %H:%M")
+            self.tree.insert(
+                "", tk.END, iid=str(conversation_id), text=title, values=(model, when)
+            )
+        if rows:
+            self.last = (rows[-1][3], rows[-1][0])
+        self.more = len(rows) == PAGE_SIZE
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.more and float(last) >= LOAD_MORE_AT:
+            self.after_idle(self._load_more)
+
+    def _load_more(self):
+        # Several scroll events can queue this before the page arrives
+        if self.more and float(self.tree.yview()[1]) >= LOAD_MORE_AT:
+            self._load_page()
+
+    def _on_search(self, event=None):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self._search)
+
+    def _search(self):
+        self._search_job = None
+        self.reload()
+
+    def _on_select(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        if self._messages_job is not None:
+            self.after_cancel(self._messages_job)
+        self._load_messages(int(selection[0]), 0)
+
+    def _load_messages(self, conversation_id: int, after: int):
+        self._messages_job = None
+        rows = self.store.messages(conversation_id, after)
+        self.show(rows, after == 0)
+        if len(rows) == PAGE_SIZE:
+            self._messages_job = self.after_idle(
+                self._load_messages, conversation_id, rows[-1][0]
+            )
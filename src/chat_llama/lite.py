@@ -0,0 +1,104 @@
+"""Single-request transport for the command line
+
+Importing requests costs more than a short prompt's whole round trip
+when the CLI runs in a shell loop, so one-shot prompts go through the
+standard library's http.client instead. Anything long-lived (REPL, GUIs,
+batch) should keep using the pooled OllamaClient.
+"""
+
+import http.client
+import json
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+from chat_llama.config import (
+    DEFAULT_BASE_URL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_OPTIONS,
+    DEFAULT_READ_TIMEOUT,
+    normalize_url,
+)
+from chat_llama.ndjson import decode
+
+READ_SIZE = 64 * 1024
+
+
+class HTTPStatusError(OSError):
+    """The server answered with an error status"""
+
+
+def payload(fields: dict, options: Optional[dict] = None) -> dict:
+    """Request body with the default options merged in, as OllamaClient does"""
+    options = DEFAULT_OPTIONS if options is None else options
+    if options or fields.get("options"):
+        fields["options"] = {**options, **(fields.get("options") or {})}
+    return fields
+
+
+def _connect(base_url: str, connect_timeout: float, read_timeout: float):
+    url = urlsplit(normalize_url(base_url))
+    if url.scheme == "https":
+        conn = http.client.HTTPSConnection(
+            url.hostname, url.port, timeout=connect_timeout
+        )
+    else:
+        conn = http.client.HTTPConnection(
+            url.hostname, url.port, timeout=connect_timeout
+        )
+    started = time.perf_counter()
+    conn.connect()
+    connect_s = time.perf_counter() - started
+    conn.sock.settimeout(read_timeout)
+    return conn, url.path.rstrip("/"), connect_s
+
+
+def _fetch(path, body, base_url, connect_timeout, read_timeout, metrics):
+    conn, prefix, connect_s = _connect(base_url, connect_timeout, read_timeout)
+    try:
+        conn.request(
+            "POST",
+            prefix + path,
+            body=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        response = conn.getresponse()
+        if metrics is not None:
+            metrics.mark_headers(connect_s)
+        if response.status >= 400:
+            detail = response.read().decode("utf-8", "replace").strip()
+            raise HTTPStatusError(f"{response.status} {response.reason}: {detail}")
+        yield from decode(iter(lambda: response.read1(READ_SIZE), b""))
+    except http.client.HTTPException as e:
+        raise ConnectionError(f"{type(e).__name__}: {e}") from e
+    finally:
+        conn.close()
+
+
+def stream(
+    path: str,
+    body: dict,
+    base_url: str = DEFAULT_BASE_URL,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    cache=None,
+    metrics=None,
+):
+    """POST a streaming request on a fresh connection; yields NDJSON objects
+
+    Failures surface as OSError, like requests' own exceptions.
+    """
+    body["stream"] = True
+    args = (path, body, base_url, connect_timeout, read_timeout, metrics)
+    if cache is not None:
+        return cache.stream(path, body, lambda: _fetch(*args))
+    return _fetch(*args)
+
+
+def stream_generate(model: str, prompt: str, cache=None, metrics=None, **fields):
+    return stream(
+        "/api/generate",
+        payload({"model": model, "prompt": prompt, **fields}),
+        cache=cache,
+        metrics=metrics,
+    )
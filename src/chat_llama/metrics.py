@@ -0,0 +1,392 @@
+"""Per-request performance metrics
+
+RequestMetrics joins client-side timings (connect, first byte, first
+token, first render) with the stats Ollama reports on the final chunk.
+Finished requests go to a size-rotated JSONL log, and per-model
+aggregates render in Prometheus' text format (chat-llama metrics).
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from chat_llama.streaming import STAT_FIELDS
+
+DEFAULT_LOG_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "chat_llama", "metrics.jsonl"
+)
+DEFAULT_LOG_MAX_BYTES = (
+    int(os.environ.get("CHAT_LLAMA_METRICS_LOG_MAX_MB", 10)) * 1024 * 1024
+)
+DEFAULT_LOG_BACKUPS = 3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _rate(count, duration_ns) -> Optional[float]:
+    return count / duration_ns * 1e9 if count and duration_ns else None
+
+
+class RequestMetrics:
+    """Timings for one request, in seconds since it started
+
+    connect_s stays None when a pooled connection was reused; queue_s and
+    queue_depth are set when a scheduler admits the request, and cache to
+    "hit", "miss" or "bypass" when the semantic cache saw it. The
+    transport marks headers, the stream consumer marks tokens and calls
+    finish(), and a front-end that draws text calls mark_render().
+    """
+
+    def __init__(self, model: str = "", endpoint: str = ""):
+        self.model = model
+        self.endpoint = endpoint
+        self.backend = ""
+        self.failovers = 0
+        self.cache = ""
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.queue_s: Optional[float] = None
+        self.queue_depth: Optional[int] = None
+        self.connect_s: Optional[float] = None
+        self.ttfb_s: Optional[float] = None
+        self.first_token_s: Optional[float] = None
+        self.first_render_s: Optional[float] = None
+        self.total_s: Optional[float] = None
+        self.tokens = 0
+        self.server = {}
+        self.outcome = "pending"
+        self.error = ""
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def attempt(self, backend: str):
+        """Note the host serving the request; later calls are failovers"""
+        if self.backend:
+            self.failovers += 1
+            self.total_s = None
+            self.outcome = "pending"
+            self.error = ""
+        self.backend = backend
+
+    def mark_headers(self, connect_s: Optional[float] = None):
+        self.connect_s = connect_s
+        self.ttfb_s = self.elapsed()
+
+    def mark_token(self):
+        self.tokens += 1
+        if self.first_token_s is None:
+            self.first_token_s = self.elapsed()
+
+    def mark_render(self):
+        if self.first_render_s is None:
+            self.first_render_s = self.elapsed()
+
+    def finish(self, final: Optional[dict] = None, outcome: str = "", error: str = ""):
+        """Stop the clock; the first call wins"""
+        if self.total_s is not None:
+            return
+        self.total_s = self.elapsed()
+        if final:
+            self.server = {k: final[k] for k in STAT_FIELDS if k in final}
+        self.outcome = outcome or ("ok" if final else "incomplete")
+        self.error = error
+
+    @property
+    def finished(self) -> bool:
+        return self.total_s is not None
+
+    @property
+    def ttft_s(self) -> Optional[float]:
+        """Time to the first token the user could see"""
+        return (
+            self.first_token_s if self.first_render_s is None else self.first_render_s
+        )
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        """Decode rate: the server's figure once known, else measured locally"""
+        rate = _rate(self.server.get("eval_count"), self.server.get("eval_duration"))
+        if rate is not None or self.first_token_s is None or self.tokens < 2:
+            return rate
+        span = (self.total_s or self.elapsed()) - self.first_token_s
+        return (self.tokens - 1) / span if span > 0 else None
+
+    def summary(self) -> str:
+        """Short readout for status bars, e.g. '42.1 tok/s · TTFT 180 ms'"""
+        parts = []
+        if self.tokens_per_s:
+            parts.append(f"{self.tokens_per_s:.1f} tok/s")
+        if self.ttft_s is not None:
+            parts.append(f"TTFT {self.ttft_s * 1000:.0f} ms")
+        if self.cache == "hit":
+            parts.append("cached")
+        return " · ".join(parts)
+
+    def to_dict(self) -> dict:
+        server = self.server
+        load = server.get("load_duration")
+        return {
+            "time": round(self.started_at, 3),
+            "model": self.model,
+            "endpoint": self.endpoint,
+            "backend": self.backend,
+            "failovers": self.failovers,
+            "cache": self.cache,
+            "outcome": self.outcome,
+            "error": self.error,
+            "queue_s": self.queue_s,
+            "queue_depth": self.queue_depth,
+            "connect_s": self.connect_s,
+            "ttfb_s": self.ttfb_s,
+            "first_token_s": self.first_token_s,
+            "first_render_s": self.first_render_s,
+            "ttft_s": self.ttft_s,
+            "total_s": self.total_s,
+            "tokens": self.tokens,
+            "tokens_per_s": self.tokens_per_s,
+            "prompt_tokens_per_s": _rate(
+                server.get("prompt_eval_count"), server.get("prompt_eval_duration")
+            ),
+            "load_s": load / 1e9 if load is not None else None,
+            **server,
+        }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list:
+        out = [
+            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum:.6g}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+
+# name: (record key, buckets, help)
+HISTOGRAMS = {
+    "queue_wait_seconds": ("queue_s", LATENCY_BUCKETS, "Time queued client-side"),
+    "queue_depth": ("queue_depth", DEPTH_BUCKETS, "Requests queued ahead on arrival"),
+    "connect_seconds": ("connect_s", LATENCY_BUCKETS, "TCP connect time"),
+    "ttfb_seconds": ("ttfb_s", LATENCY_BUCKETS, "Time to response headers"),
+    "ttft_seconds": ("ttft_s", LATENCY_BUCKETS, "Time to first visible token"),
+    "request_seconds": ("total_s", LATENCY_BUCKETS, "Whole request"),
+    "load_seconds": ("load_s", LATENCY_BUCKETS, "Server model load time"),
+    "decode_tokens_per_second": ("tokens_per_s", RATE_BUCKETS, "Generation rate"),
+    "prompt_tokens_per_second": (
+        "prompt_tokens_per_s",
+        RATE_BUCKETS,
+        "Prompt evaluation rate",
+    ),
+}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsSummary:
+    """Per-model aggregates of finished requests, in Prometheus text format"""
+
+    def __init__(self, records: Iterable[dict] = ()):
+        self.requests = {}
+        self.prompt_tokens = {}
+        self.generated_tokens = {}
+        self.wasted_tokens = {}
+        self.semantic_cache = {}
+        self.histograms = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record: dict):
+        model = record.get("model") or "unknown"
+        key = (model, record.get("outcome") or "unknown")
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.prompt_tokens[model] = self.prompt_tokens.get(model, 0) + (
+            record.get("prompt_eval_count") or 0
+        )
+        self.generated_tokens[model] = self.generated_tokens.get(model, 0) + (
+            record.get("eval_count") or record.get("tokens") or 0
+        )
+        if record.get("cache"):
+            key = (model, record["cache"])
+            self.semantic_cache[key] = self.semantic_cache.get(key, 0) + 1
+        if record.get("outcome") == "cancelled":
+            self.wasted_tokens[model] = self.wasted_tokens.get(model, 0) + (
+                record.get("tokens") or 0
+            )
+        for name, (field, buckets, _) in HISTOGRAMS.items():
+            value = record.get(field)
+            if value is not None:
+                histogram = self.histograms.get((name, model))
+                if histogram is None:
+                    histogram = self.histograms[(name, model)] = Histogram(buckets)
+                histogram.observe(value)
+
+    def prometheus(self, prefix: str = "chat_llama") -> str:
+        lines = [
+            f"# HELP {prefix}_requests_total Finished requests by outcome",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for (model, outcome), count in sorted(self.requests.items()):
+            lines.append(
+                f'{prefix}_requests_total{{model="{_label(model)}",'
+                f'outcome="{_label(outcome)}"}} {count}'
+            )
+        if self.semantic_cache:
+            lines.append(
+                f"# HELP {prefix}_semantic_cache_requests_total"
+                " Generate requests by semantic cache result"
+            )
+            lines.append(f"# TYPE {prefix}_semantic_cache_requests_total counter")
+            for (model, result), count in sorted(self.semantic_cache.items()):
+                lines.append(
+                    f'{prefix}_semantic_cache_requests_total{{model="{_label(model)}",'
+                    f'result="{_label(result)}"}} {count}'
+                )
+        for name, totals, help_text in (
+            ("prompt_tokens_total", self.prompt_tokens, "Prompt tokens evaluated"),
+            ("generated_tokens_total", self.generated_tokens, "Tokens generated"),
+            (
+                "wasted_tokens_total",
+                self.wasted_tokens,
+                "Tokens generated for requests that were then cancelled",
+            ),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for model, count in sorted(totals.items()):
+                lines.append(f'{prefix}_{name}{{model="{_label(model)}"}} {count}')
+        for name, (_, _, help_text) in HISTOGRAMS.items():
+            models = sorted(m for n, m in self.histograms if n == name)
+            if not models:
+                continue
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for model in models:
+                lines.extend(
+                    self.histograms[(name, model)].lines(
+                        f"{prefix}_{name}", f'model="{_label(model)}"'
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsLog:
+    """Append-only JSONL file rotated by size: metrics.jsonl, .1, .2, ...
+
+    Each record is one append, so several processes (e.g. CLI calls in a
+    shell loop) can share the log.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_LOG_PATH,
+        max_bytes: int = DEFAULT_LOG_MAX_BYTES,
+        backups: int = DEFAULT_LOG_BACKUPS,
+    ):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if size and size + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def read(self):
+        """Every logged record, oldest first"""
+        paths = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        for path in paths + [self.path]:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+
+
+class Metrics:
+    """Process-wide sink: aggregates finished requests and logs them"""
+
+    def __init__(self, log: Optional[MetricsLog] = None):
+        self.log = log
+        self.summary = MetricsSummary()
+        self._lock = threading.Lock()
+
+    def record(self, metrics: RequestMetrics):
+        metrics.finish()
+        record = metrics.to_dict()
+        with self._lock:
+            self.summary.add(record)
+        if self.log is not None:
+            try:
+                self.log.write(record)
+            except OSError:
+                pass
+
+    def prometheus(self) -> str:
+        with self._lock:
+            return self.summary.prometheus()
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def default_log() -> Optional[MetricsLog]:
+    """Log named by CHAT_LLAMA_METRICS_LOG (a path, or "0" to disable)"""
+    setting = os.environ.get("CHAT_LLAMA_METRICS_LOG", "")
+    if setting == "0":
+        return None
+    return MetricsLog(setting if setting not in ("", "1") else DEFAULT_LOG_PATH)
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics sink"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(default_log())
+    return _metrics
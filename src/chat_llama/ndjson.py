@@ -0,0 +1,67 @@
+import json
+from typing import Iterable
+
+_decode = json.JSONDecoder().decode
+
+
+def stdlib_loads(data: bytes):
+    """Standard-library fallback, skipping json.loads' per-call overhead"""
+    return _decode(data.decode("utf-8"))
+
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    BACKEND = "orjson"
+except ImportError:
+    loads = stdlib_loads
+    BACKEND = "json"
+
+
+class NDJSONDecoder:
+    """Incremental NDJSON decoder for raw network chunks
+
+    feed() takes bytes exactly as they come off the socket and returns the
+    objects for every line completed so far. Partial lines stay in one
+    reusable buffer, and all complete lines in a chunk are parsed with a
+    single loads() call instead of one per line.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        buffer = self._buffer
+        if buffer:
+            buffer += data
+            data = bytes(buffer)
+            buffer.clear()
+        end = data.rfind(b"\n")
+        if end < 0:
+            buffer += data
+            return []
+        if end + 1 < len(data):
+            buffer += data[end + 1 :]
+        # A live stream usually delivers exactly one line per read
+        if data.find(b"\n", 0, end) < 0:
+            line = data[:end]
+            return [loads(line)] if line.strip() else []
+        lines = [line for line in data[:end].split(b"\n") if line.strip()]
+        if len(lines) == 1:
+            return [loads(lines[0])]
+        return loads(b"[" + b",".join(lines) + b"]") if lines else []
+
+    def close(self) -> list:
+        """Decode a final line that arrived without a trailing newline"""
+        rest = bytes(self._buffer).strip()
+        self._buffer.clear()
+        return [loads(rest)] if rest else []
+
+
+def decode(byte_chunks: Iterable[bytes]):
+    """Yield decoded objects from an iterable of raw byte chunks"""
+    decoder = NDJSONDecoder()
+    for data in byte_chunks:
+        yield from decoder.feed(data)
+    yield from decoder.close()
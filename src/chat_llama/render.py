@@ -0,0 +1,52 @@
+import time
+import tkinter as tk
+
+
+class FrameRenderer:
+    """Coalesces streamed text into at most one Text widget update per frame
+
+    write() only buffers. flush() does a single insert + see for everything
+    buffered since the last frame and returns the delay until the next one.
+    When the main thread falls behind (frames fire late or drawing eats most
+    of the frame), the interval backs off up to max_frame_ms and then eases
+    back towards frame_ms once things catch up.
+    """
+
+    def __init__(self, widget: tk.Text, frame_ms: int = 16, max_frame_ms: int = 250):
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self.max_frame_ms = max_frame_ms
+        self.interval_ms = frame_ms
+        self._pending = []
+        self._due = None
+        self.drawn = False  # whether the last flush() inserted text
+
+    def write(self, text: str):
+        if text:
+            self._pending.append(text)
+
+    def reset(self):
+        self._pending.clear()
+        self.interval_ms = self.frame_ms
+        self._due = None
+
+    def flush(self) -> int:
+        started = time.perf_counter()
+        late_ms = 0.0 if self._due is None else (started - self._due) * 1000
+        self.drawn = bool(self._pending)
+        if self._pending:
+            # Only follow the output if the user hasn't scrolled up to read
+            follow = self.widget.yview()[1] >= 0.999
+            self.widget.insert(tk.END, "".join(self._pending))
+            self._pending.clear()
+            if follow:
+                self.widget.see(tk.END)
+        draw_ms = (time.perf_counter() - started) * 1000
+
+        if late_ms > self.interval_ms or draw_ms > self.interval_ms / 2:
+            self.interval_ms = min(self.max_frame_ms, self.interval_ms * 2)
+        elif self.interval_ms > self.frame_ms:
+            self.interval_ms = max(self.frame_ms, int(self.interval_ms * 0.8))
+
+        self._due = time.perf_counter() + self.interval_ms / 1000
+        return self.interval_ms
@@ -0,0 +1,72 @@
+import sys
+
+import requests
+
+from chat_llama.context import context_window, summarizer
+from chat_llama.residency import get_residency
+from chat_llama.scheduler import QueueFullError
+from chat_llama.session import Session
+
+
+def repl(model):
+    # Load the model while the user types the first prompt
+    get_residency().warm_async(model)
+    sessions = {"main": Session(model)}
+    name = "main"
+    print(f"using {model} (/reset, /fork NAME, /switch NAME, /fresh PROMPT, /quit)")
+    while True:
+        try:
+            prompt = input(f"{name} >>> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if not prompt:
+            continue
+        command, _, arg = prompt.partition(" ")
+        if command in ("/quit", "/exit"):
+            return
+        if command == "/reset":
+            sessions[name].reset()
+            print("session reset.")
+            continue
+        if command == "/fork" and arg:
+            sessions[arg] = sessions[name].fork()
+            name = arg
+            print(f"forked into {name}.")
+            continue
+        if command == "/switch" and arg in sessions:
+            name = arg
+            continue
+        # /fresh asks again without the response caches
+        cache = not (command == "/fresh" and arg)
+        if not cache:
+            prompt = arg
+
+        session = sessions[name]
+        try:
+            keep_alive = get_residency().keep_alive(session.model)
+            # Long chats fold older turns into a summary to bound prefill
+            summarize = summarizer(session.model, keep_alive=keep_alive)
+            if session.compact(context_window(session.model), summarize=summarize):
+                print(
+                    f"[history compacted to ~{session.history_tokens} tokens]",
+                    file=sys.stderr,
+                )
+            for text in session.stream(prompt, keep_alive=keep_alive, cache=cache):
+                print(text, end="", flush=True)
+            print()
+        except (requests.exceptions.RequestException, QueueFullError) as e:
+            print(f"Request failed: {e}")
+            continue
+        except KeyboardInterrupt:
+            # Ctrl-C stops this answer, not the REPL; the turn is not kept
+            print(" [stopped]")
+            continue
+        # Prefill cost should stay flat across turns when context is reused
+        stats = session.last_stats
+        print(
+            f"[turn {len(session.turns)}: {stats.get('prompt_eval_count', 0)} "
+            f"prompt tokens in {stats.get('prompt_eval_duration', 0) / 1e6:.0f} ms"
+            f" · {session.last_metrics.summary()}]",
+            file=sys.stderr,
+        )
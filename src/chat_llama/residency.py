@@ -0,0 +1,171 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Optional, Union
+
+import requests
+
+from chat_llama.client import OllamaClient, _fails_over, get_client
+from chat_llama.config import (
+    DEFAULT_KEEP_ALIVE,
+    KEEP_ALIVE_POLICIES,
+    keep_alive_value,
+    model_key,
+)
+
+
+class ResidencyManager:
+    """Tracks which models the server has loaded and keeps the right ones warm
+
+    Snapshot lookups (is_hot, status) never block; refreshes and warm-ups
+    run on one background thread when called through the *_async methods.
+    """
+
+    def __init__(
+        self,
+        client: Optional[OllamaClient] = None,
+        policies: Optional[dict] = None,
+        max_age: float = 5.0,
+    ):
+        self.client = client or get_client()
+        self.policies = {
+            model_key(k): keep_alive_value(v)
+            for k, v in {**KEEP_ALIVE_POLICIES, **(policies or {})}.items()
+        }
+        self.max_age = max_age
+        self._running = {}
+        self._checked = None
+        self._warming = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="chat-llama-residency"
+        )
+
+    def keep_alive(self, model: str) -> Union[str, int]:
+        return self.policies.get(model_key(model), DEFAULT_KEEP_ALIVE)
+
+    def refresh(self) -> dict:
+        """Fetch every backend's running-model list (GET /api/ps)
+
+        A model counts as running if any reachable backend has it loaded;
+        raises only when no backend answers.
+        """
+        running = {}
+        error = None
+        answered = False
+        for backend in self.client.backends.backends:
+            try:
+                models = self.client.get("/api/ps", backend=backend).json()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            answered = True
+            loaded = {model_key(m["name"]): m for m in models.get("models", [])}
+            backend.loaded = set(loaded)
+            for key, model in loaded.items():
+                running.setdefault(key, model)
+        if not answered:
+            raise error
+        with self._lock:
+            self._running = running
+            self._checked = time.monotonic()
+        return running
+
+    def running(self) -> dict:
+        """Running models, refreshed if the snapshot is older than max_age"""
+        if self._checked is None or time.monotonic() - self._checked > self.max_age:
+            try:
+                return self.refresh()
+            except requests.exceptions.RequestException:
+                pass
+        return self._running
+
+    def is_hot(self, model: str) -> Optional[bool]:
+        """From the last snapshot; None if the server was never reached"""
+        if self._checked is None:
+            return None
+        return model_key(model) in self._running
+
+    def status(self, model: str) -> str:
+        if model_key(model) in self._warming:
+            return "loading"
+        hot = self.is_hot(model)
+        return "unknown" if hot is None else ("hot" if hot else "cold")
+
+    def warm(self, model: str) -> bool:
+        """Load a model with its keep_alive policy; blocks until it is resident"""
+        key = model_key(model)
+        with self._lock:
+            self._warming.add(key)
+        backends = self.client.backends
+        tried = []
+        try:
+            while True:
+                # Load it where its requests will be routed
+                backend = backends.choose(model, tried)
+                try:
+                    # A generate call without a prompt only loads the model.
+                    # Loading a large model can take minutes, so there is no
+                    # read timeout.
+                    self.client.post(
+                        "/api/generate",
+                        {"model": model, "keep_alive": self.keep_alive(model)},
+                        timeout=(self.client.timeout[0], None),
+                        backend=backend,
+                    )
+                    break
+                except requests.exceptions.RequestException as e:
+                    if not _fails_over(e) or not backends.failed(backend, tried):
+                        return False
+            backend.loaded.add(key)
+            try:
+                self.refresh()
+            except requests.exceptions.RequestException:
+                pass
+            return True
+        finally:
+            with self._lock:
+                self._warming.discard(key)
+
+    def warm_async(self, model: str) -> Future:
+        return self._executor.submit(self.warm, model)
+
+    def refresh_async(self) -> Future:
+        return self._executor.submit(self.running)
+
+    def order(self, records: Iterable, default_model: str, window: int = 256):
+        """Regroup (id, record) pairs by model to avoid reloads
+
+        Looks ahead at most `window` records at a time. Within a window,
+        records for the model that ran last come first, then loaded
+        models, then cold ones, each model's records kept together.
+        """
+        self.running()
+        records = iter(records)
+        last = None
+        while True:
+            block = list(itertools.islice(records, window))
+            if not block:
+                return
+            groups = {}
+            for item in block:
+                model = model_key(item[1].get("model") or default_model)
+                groups.setdefault(model, []).append(item)
+            for model in sorted(groups, key=lambda m: (m != last, not self.is_hot(m))):
+                yield from groups[model]
+                last = model
+
+
+_residency: Optional[ResidencyManager] = None
+_residency_lock = threading.Lock()
+
+
+def get_residency() -> ResidencyManager:
+    """Return the process-wide residency manager"""
+    global _residency
+    if _residency is None:
+        with _residency_lock:
+            if _residency is None:
+                _residency = ResidencyManager()
+    return _residency
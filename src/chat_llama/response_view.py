@@ -0,0 +1,288 @@
+"""Response text widget with bounded scrollback, backed by a spill file
+
+A Tk Text widget gets slow to scroll, type into and redraw once it holds
+a few long answers. ResponseView keeps the whole response in an
+anonymous temporary file and at most SCROLLBACK_LINES of it (plus a page
+of slack) in the widget. Lines that scroll off the top are dropped from
+the widget; scrolling to either edge of what the widget holds pages the
+neighbouring lines back in from the file.
+
+The selection is tracked in response coordinates, so a selection that
+runs past the widget's window still copies in full (<<Copy>> reads it
+from the file), as does <<SelectAll>>. Ctrl+F searches the whole
+response and F3 finds the next match.
+
+FrameRenderer and the GUIs use it like the Text widget it wraps:
+insert(tk.END, text), yview(), see() and clear(). The widget itself is
+read-only: an edit typed into it would shift its lines away from the
+spill file's, so only the view's own inserts and deletes enable it.
+"""
+
+import tkinter as tk
+from array import array
+from contextlib import contextmanager
+from tempfile import TemporaryFile
+from tkinter import simpledialog
+
+from chat_llama.config import SCROLLBACK_LINES
+
+PAGE_LINES = 200
+
+
+class ResponseView:
+    """A window of lines [first, stop) of the response, shown in `widget`"""
+
+    def __init__(self, widget: tk.Text, max_lines: int = SCROLLBACK_LINES):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.spill = TemporaryFile()
+        # Byte offset in the spill file where each line starts
+        self.lines = array("q", [0])
+        self.size = 0
+        self.first = 0
+        self.stop = 1
+        # (line, column) bounds of the selection within the whole response
+        self.selection = None
+        self.query = ""
+        # ScrolledText's bar, which the widget's own scroll reports now bypass
+        self.scrollbar = getattr(widget, "vbar", None)
+        widget.configure(yscrollcommand=self._on_scroll, state="disabled")
+        # A disabled Text doesn't take focus on click, which the keys need
+        widget.bind("<Button-1>", lambda event: widget.focus_set(), add="+")
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>", "<Prior>"):
+            widget.bind(sequence, self._on_wheel, add="+")
+        widget.bind("<Next>", self._on_wheel, add="+")
+        widget.bind("<<Selection>>", self._on_selection, add="+")
+        widget.bind("<<Copy>>", self._on_copy)
+        widget.bind("<<SelectAll>>", self._on_select_all)
+        widget.bind("<Control-f>", self._on_find)
+        widget.bind("<F3>", self._on_find_next)
+
+    # --- the Text calls FrameRenderer and the GUIs make ----------------
+
+    def insert(self, index, text: str):
+        """Append `text` (the view only ever appends, so `index` is tk.END)"""
+        data = text.encode("utf-8")
+        self.spill.seek(self.size)
+        self.spill.write(data)
+        start = len(self.lines)
+        newline = data.find(b"\n")
+        while newline != -1:
+            self.lines.append(self.size + newline + 1)
+            newline = data.find(b"\n", newline + 1)
+        self.size += len(data)
+        if self.stop != start:
+            return  # paged away from the end: it stays in the file for now
+        if self.stop - self.first >= self.max_lines and not self.following:
+            # The reader is scrolled up in a full window: leave it as it is,
+            # less the unfinished last line, which page_down() reads whole
+            self._drop_bottom(1)
+            return
+        with self._writable():
+            self.widget.insert(tk.END, text)
+        self.stop = len(self.lines)
+        if self.stop - self.first > self.max_lines + PAGE_LINES:
+            self._drop_top(self.stop - self.first - self.max_lines)
+
+    def yview(self):
+        if self.stop != len(self.lines):
+            return (0.0, 0.0)  # not showing the end, so nothing to follow
+        return self.widget.yview()
+
+    def see(self, index):
+        self.widget.see(index)
+
+    def clear(self):
+        with self._writable():
+            self.widget.delete(1.0, tk.END)
+        self.spill.seek(0)
+        self.spill.truncate()
+        self.lines = array("q", [0])
+        self.size = 0
+        self.first = 0
+        self.stop = 1
+        self.selection = None
+
+    def close(self):
+        self.spill.close()
+
+    @contextmanager
+    def _writable(self):
+        self.widget.configure(state="normal")
+        try:
+            yield
+        finally:
+            self.widget.configure(state="disabled")
+
+    @property
+    def following(self) -> bool:
+        return self.widget.yview()[1] >= 0.999
+
+    # --- reading the spill file ----------------------------------------
+
+    def read(self, start: int, stop: int) -> str:
+        """Lines [start, stop) of the response"""
+        begin = self.lines[start]
+        end = self.lines[stop] if stop < len(self.lines) else self.size
+        self.spill.flush()
+        self.spill.seek(begin)
+        return self.spill.read(end - begin).decode("utf-8")
+
+    def text(self, start: tuple, end: tuple) -> str:
+        """The response between two (line, column) positions"""
+        chunk = self.read(start[0], end[0] + 1)
+        offset = sum(len(line) + 1 for line in chunk.split("\n")[: end[0] - start[0]])
+        return chunk[start[1] : offset + end[1]]
+
+    @property
+    def end(self) -> tuple:
+        last = len(self.lines) - 1
+        return (last, len(self.read(last, last + 1)))
+
+    # --- paging --------------------------------------------------------
+
+    def _drop_top(self, count: int):
+        with self._writable():
+            self.widget.delete("1.0", f"{count + 1}.0")
+        self.first += count
+        self._restore_selection()
+
+    def _drop_bottom(self, count: int):
+        with self._writable():
+            self.widget.delete(f"{self.stop - self.first - count + 1}.0", tk.END)
+        self.stop -= count
+        self._restore_selection()
+
+    def page_up(self):
+        count = min(PAGE_LINES, self.first)
+        if not count:
+            return
+        top = int(self.widget.index("@0,0").split(".")[0])
+        with self._writable():
+            self.widget.insert("1.0", self.read(self.first - count, self.first))
+        self.first -= count
+        self.widget.yview(f"{top + count}.0")
+        excess = self.stop - self.first - self.max_lines
+        if excess > 0:
+            self._drop_bottom(excess)
+        else:
+            self._restore_selection()
+
+    def page_down(self):
+        count = min(PAGE_LINES, len(self.lines) - self.stop)
+        if not count:
+            return
+        top = int(self.widget.index("@0,0").split(".")[0])
+        with self._writable():
+            self.widget.insert(tk.END, self.read(self.stop, self.stop + count))
+        self.stop += count
+        excess = self.stop - self.first - self.max_lines
+        if excess > 0:
+            self._drop_top(excess)
+            self.widget.yview(f"{max(1, top - excess)}.0")
+        else:
+            self._restore_selection()
+
+    def show(self, line: int):
+        """Reload the window around `line` of the response"""
+        self.first = max(0, line - self.max_lines // 2)
+        self.stop = min(len(self.lines), self.first + self.max_lines)
+        with self._writable():
+            self.widget.delete(1.0, tk.END)
+            self.widget.insert(tk.END, self.read(self.first, self.stop))
+        self._restore_selection()
+
+    def _on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        self.widget.after_idle(self._check_edges)
+
+    def _on_wheel(self, event=None):
+        # At the very top a wheel turn moves nothing, so no scroll report
+        self.widget.after_idle(self._check_edges)
+
+    def _check_edges(self):
+        first, last = self.widget.yview()
+        if first <= 0.0 and self.first > 0:
+            self.page_up()
+        elif last >= 1.0 and self.stop < len(self.lines):
+            self.page_down()
+
+    # --- selection, copy and search ------------------------------------
+
+    def _position(self, index) -> tuple:
+        line, column = map(int, str(self.widget.index(index)).split("."))
+        return (self.first + line - 1, column)
+
+    def _index(self, position: tuple) -> str:
+        line = min(max(position[0], self.first), self.stop) - self.first + 1
+        column = position[1] if self.first <= position[0] < self.stop else 0
+        return f"{line}.{column}"
+
+    def _restore_selection(self):
+        """Re-tag the part of the tracked selection that is in the widget"""
+        self.widget.tag_remove("sel", "1.0", tk.END)
+        if self.selection is not None:
+            start, end = self.selection
+            self.widget.tag_add("sel", self._index(start), self._index(end))
+
+    def _on_selection(self, event=None):
+        ranges = self.widget.tag_ranges("sel")
+        if not ranges:
+            self.selection = None
+            return
+        start, end = self._position(ranges[0]), self._position(ranges[-1])
+        if self.selection is not None:
+            # A selection clipped at the window's edge still runs past it
+            if start == (self.first, 0) and self.selection[0] < start:
+                start = self.selection[0]
+            if end >= self._position("end-1c") and self.selection[1] > end:
+                end = self.selection[1]
+        self.selection = (start, end)
+
+    def _on_copy(self, event=None):
+        if self.selection is None:
+            return None
+        self.widget.clipboard_clear()
+        self.widget.clipboard_append(self.text(*self.selection))
+        return "break"
+
+    def _on_select_all(self, event=None):
+        self.selection = ((0, 0), self.end)
+        self._restore_selection()
+        return "break"
+
+    def _on_find(self, event=None):
+        query = simpledialog.askstring(
+            "Find", "Find in response:", initialvalue=self.query, parent=self.widget
+        )
+        if query:
+            self.query = query
+            self.find(query, (0, 0))
+        return "break"
+
+    def _on_find_next(self, event=None):
+        if self.query:
+            start = self.selection[1] if self.selection else (0, 0)
+            self.find(self.query, start)
+        return "break"
+
+    def find(self, query: str, start: tuple) -> bool:
+        """Select the next case-insensitive match at or after `start`"""
+        needle = query.lower()
+        line, column = start
+        while line < len(self.lines):
+            stop = min(line + PAGE_LINES, len(self.lines))
+            for text in self.read(line, stop).split("\n")[: stop - line]:
+                found = text.lower().find(needle, column)
+                if found != -1:
+                    self.selection = ((line, found), (line, found + len(query)))
+                    if not self.first <= line < self.stop:
+                        self.show(line)
+                    self._restore_selection()
+                    self.widget.see(self._index(self.selection[0]))
+                    return True
+                line += 1
+                column = 0
+        self.widget.bell()
+        return False
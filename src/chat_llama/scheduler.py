@@ -0,0 +1,192 @@
+"""Client-side admission control for Ollama backends
+
+Ollama runs a few requests at once and queues the rest in arrival order,
+so a batch job can put every interactive user behind it. Each backend
+gets a Scheduler that caps the requests in flight and queues the others
+by priority class (interactive before batch), round-robin across callers
+within a class so one caller's burst cannot starve the others. Once
+max_queue requests are waiting, a new one fails fast with QueueFullError
+instead of hanging.
+
+The scheduler coordinates the streams of one process: the sessions of a
+Streamlit server, a batch run, a GUI's stream worker.
+"""
+
+import asyncio
+import contextlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from chat_llama.config import DEFAULT_MAX_IN_FLIGHT, DEFAULT_MAX_QUEUE
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+
+class QueueFullError(ConnectionError):
+    """Too many requests are already waiting for this backend"""
+
+
+class _Ticket:
+    __slots__ = ("priority", "caller", "wake", "granted")
+
+    def __init__(self, priority, caller, wake):
+        self.priority = priority
+        self.caller = caller
+        self.wake = wake
+        self.granted = False
+
+
+class Scheduler:
+    """In-flight limit and priority queue for one backend"""
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        # One queue per priority class: caller -> that caller's tickets,
+        # in the order callers get their next turn
+        self._queues = [OrderedDict() for _ in PRIORITIES]
+        self._queued = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _enqueue(self, priority, caller, wake, metrics) -> _Ticket:
+        ticket = _Ticket(priority, caller, wake)
+        with self._lock:
+            if metrics is not None:
+                metrics.queue_depth = self._queued
+            if self.in_flight < self.max_in_flight and not self._queued:
+                self.in_flight += 1
+                self.admitted += 1
+                ticket.granted = True
+                return ticket
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                error = f"backend busy: {self._queued} requests already queued"
+                if metrics is not None:
+                    metrics.finish(outcome="rejected", error=error)
+                raise QueueFullError(error)
+            self._queues[priority].setdefault(caller, deque()).append(ticket)
+            self._queued += 1
+        return ticket
+
+    def _next(self) -> Optional[_Ticket]:
+        for callers in self._queues:
+            if callers:
+                caller, tickets = next(iter(callers.items()))
+                ticket = tickets.popleft()
+                # This caller's next request goes to the back of the line
+                del callers[caller]
+                if tickets:
+                    callers[caller] = tickets
+                self._queued -= 1
+                return ticket
+        return None
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            ticket = self._next()
+            if ticket is not None:
+                self.in_flight += 1
+                self.admitted += 1
+                ticket.granted = True
+        if ticket is not None:
+            ticket.wake()
+
+    def _abandon(self, ticket: _Ticket):
+        """Leave the queue, or hand on the slot if it was granted meanwhile"""
+        with self._lock:
+            if not ticket.granted:
+                tickets = self._queues[ticket.priority][ticket.caller]
+                tickets.remove(ticket)
+                if not tickets:
+                    del self._queues[ticket.priority][ticket.caller]
+                self._queued -= 1
+                return
+        self._release()
+
+    @contextlib.contextmanager
+    def slot(self, priority: int = INTERACTIVE, caller: str = "", metrics=None):
+        """Hold one in-flight slot, blocking the thread while queued"""
+        started = time.perf_counter()
+        granted = threading.Event()
+        ticket = self._enqueue(priority, caller, granted.set, metrics)
+        if not ticket.granted:
+            try:
+                granted.wait()
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        if metrics is not None:
+            metrics.queue_s = time.perf_counter() - started
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, priority: int = INTERACTIVE, caller: str = "", metrics=None):
+        """Hold one in-flight slot, awaiting while queued"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(
+                lambda: granted.done() or granted.set_result(None)
+            )
+
+        ticket = self._enqueue(priority, caller, wake, metrics)
+        if not ticket.granted:
+            try:
+                await granted
+            except asyncio.CancelledError:
+                self._abandon(ticket)
+                raise
+        if metrics is not None:
+            metrics.queue_s = time.perf_counter() - started
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self._queued,
+                "queued_by_priority": {
+                    name: sum(len(t) for t in self._queues[p].values())
+                    for name, p in PRIORITIES.items()
+                },
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(base_url: str) -> Scheduler:
+    """Return the process-wide scheduler for the backend at `base_url`"""
+    key = base_url.rstrip("/")
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = Scheduler()
+        return scheduler
@@ -0,0 +1,327 @@
+"""Answer repeat questions asked in different words
+
+The exact-match ResponseCache misses "how do I reverse a list in python"
+after "reverse a python list?". SemanticCache embeds each /api/generate
+prompt with the server's /api/embed endpoint and compares it with every
+cached prompt at once: the unit-length vectors sit in one contiguous
+float32 matrix, so a lookup is a single matrix-vector product. A cached
+answer is replayed when the best cosine similarity for the same scope
+(model, system prompt, template, format and options) reaches the
+threshold.
+
+Requests that depend on more than their prompt (a conversation
+`context`, images, raw mode) bypass it, as does any request made with
+cache=False. Answers are stored and replayed without the final chunk's
+`context`: those tokens continue the conversation of the prompt that
+was actually asked, not the one being answered. When the matrix is full
+the least recently used entry is replaced, and entries older than the
+TTL stop matching.
+
+In memory by default; given a directory, the matrix is a memory-mapped
+file there and the answers live in SQLite beside it. Needs numpy
+(pip install chat-llama[semantic]).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from chat_llama.config import EMBED_MODEL
+
+DEFAULT_SEMANTIC_DIR = Path.home() / ".cache" / "chat_llama" / "semantic"
+DEFAULT_THRESHOLD = float(os.environ.get("CHAT_LLAMA_SEMANTIC_THRESHOLD", 0.92))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("CHAT_LLAMA_SEMANTIC_MAX_ENTRIES", 10000))
+DEFAULT_TTL = float(os.environ.get("CHAT_LLAMA_SEMANTIC_TTL", 7 * 24 * 3600))
+
+# Fields besides the prompt that change what the answer should be
+_SCOPE_FIELDS = ("model", "system", "template", "format", "options")
+# Fields that tie the answer to more than the prompt
+_BYPASS_FIELDS = ("context", "images", "raw", "suffix")
+
+
+def _without_context(chunks: list) -> list:
+    if chunks and "context" in chunks[-1]:
+        final = dict(chunks[-1])
+        del final["context"]
+        chunks = [*chunks[:-1], final]
+    return chunks
+
+
+class SemanticCache:
+    """Cosine-similarity lookup of past answers for the same scope"""
+
+    def __init__(
+        self,
+        path=None,
+        embed_model: str = EMBED_MODEL,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(
+                self.path / "answers.sqlite3", check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+        else:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " slot INTEGER PRIMARY KEY, scope INTEGER NOT NULL, prompt TEXT NOT NULL,"
+            " chunks BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._db.commit()
+        # Per-slot state, mirrored from the entries table
+        self.scopes = np.zeros(max_entries, dtype=np.int64)
+        self.created = np.zeros(max_entries, dtype=np.float64)
+        self.accessed = np.zeros(max_entries, dtype=np.float64)
+        self.valid = np.zeros(max_entries, dtype=bool)
+        self.count = 0  # slots [0, count) have been written at least once
+        self.matrix: Optional[np.ndarray] = None
+        self._load()
+
+    # --- storage -------------------------------------------------------
+
+    def _load(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row is None or self.path is None:
+            return
+        dim = int(row[0])
+        vectors = self.path / "vectors.f32"
+        try:
+            intact = vectors.stat().st_size == self.max_entries * dim * 4
+        except FileNotFoundError:
+            intact = False  # deleted, or a crash before the first flush
+        if not intact:
+            # Also resized (CHAT_LLAMA_SEMANTIC_MAX_ENTRIES changed): the
+            # entries no longer match their rows, so start over
+            self._reset(dim)
+            return
+        self.matrix = self._open_matrix(dim, "r+")
+        rows = self._db.execute(
+            "SELECT slot, scope, created, accessed FROM entries WHERE slot < ?",
+            (self.max_entries,),
+        ).fetchall()
+        for slot, scope, created, accessed in rows:
+            self.scopes[slot] = scope
+            self.created[slot] = created
+            self.accessed[slot] = accessed
+            self.valid[slot] = True
+            self.count = max(self.count, slot + 1)
+
+    def _open_matrix(self, dim: int, mode: str) -> np.ndarray:
+        if self.path is None:
+            return np.zeros((self.max_entries, dim), dtype=np.float32)
+        return np.memmap(
+            self.path / "vectors.f32",
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.max_entries, dim),
+        )
+
+    def _reset(self, dim: int):
+        """Start over with `dim`-wide vectors (first use, or a new embed model)"""
+        self._db.execute("DELETE FROM entries")
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(dim),))
+        self._db.commit()
+        self.valid[:] = False
+        self.count = 0
+        self.matrix = self._open_matrix(dim, "w+")
+
+    # --- requests ------------------------------------------------------
+
+    def scope(self, payload: dict) -> Optional[int]:
+        """The cache partition for a generate payload, None to bypass"""
+        if not payload.get("prompt") or any(payload.get(f) for f in _BYPASS_FIELDS):
+            return None
+        fields = [payload.get(f) for f in _SCOPE_FIELDS]
+        blob = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(blob.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "little", signed=True)
+
+    def embed_request(self, payload: dict) -> dict:
+        """The /api/embed body for a generate payload's prompt"""
+        return {"model": self.embed_model, "input": payload["prompt"]}
+
+    @staticmethod
+    def vector(response: dict) -> Optional[np.ndarray]:
+        """The unit-length embedding from an /api/embed response"""
+        embeddings = response.get("embeddings") or [response.get("embedding")]
+        if not embeddings or not embeddings[0]:
+            return None
+        vector = np.asarray(embeddings[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def bypass(self, metrics=None):
+        with self._lock:
+            self.bypassed += 1
+        if metrics is not None:
+            metrics.cache = "bypass"
+
+    def lookup(self, scope: int, vector: np.ndarray, metrics=None) -> Optional[list]:
+        """Recorded chunks of the closest past answer, if close enough"""
+        now = time.time()
+        with self._lock:
+            slot = self._nearest(scope, vector, now)
+            if slot is None:
+                self.misses += 1
+                result = None
+            else:
+                self.hits += 1
+                self.accessed[slot] = now
+                self._db.execute(
+                    "UPDATE entries SET accessed = ? WHERE slot = ?", (now, slot)
+                )
+                (chunks,) = self._db.execute(
+                    "SELECT chunks FROM entries WHERE slot = ?", (slot,)
+                ).fetchone()
+                self._db.commit()
+                result = _without_context(json.loads(chunks))
+        if metrics is not None:
+            metrics.cache = "miss" if result is None else "hit"
+        return result
+
+    def _nearest(self, scope: int, vector: np.ndarray, now: float) -> Optional[int]:
+        n = self.count
+        if not n or self.matrix is None or self.matrix.shape[1] != vector.shape[0]:
+            return None
+        similarity = self.matrix[:n] @ vector
+        usable = (
+            self.valid[:n]
+            & (self.scopes[:n] == scope)
+            & (self.created[:n] >= now - self.ttl)
+        )
+        similarity[~usable] = -np.inf
+        slot = int(np.argmax(similarity))
+        return slot if similarity[slot] >= self.threshold else None
+
+    def add(self, scope: int, prompt: str, vector: np.ndarray, chunks: list):
+        """Remember a completed answer, replacing the least recently used"""
+        now = time.time()
+        blob = json.dumps(_without_context(chunks), separators=(",", ":"))
+        with self._lock:
+            if self.matrix is None or self.matrix.shape[1] != vector.shape[0]:
+                self._reset(vector.shape[0])
+            if self.count < self.max_entries:
+                slot = self.count
+                self.count += 1
+            else:
+                # Expired or invalid slots go first, then the least recently hit
+                stale = self.created < now - self.ttl
+                slot = int(np.argmin(np.where(self.valid & ~stale, self.accessed, -1)))
+            self.matrix[slot] = vector
+            self.scopes[slot] = scope
+            self.created[slot] = now
+            self.accessed[slot] = now
+            self.valid[slot] = True
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (slot, scope, prompt, blob.encode(), now, now),
+            )
+            self._db.commit()
+
+    def stream(self, payload: dict, embed, fetch, metrics=None):
+        """Replay a close enough answer, or record `fetch()`'s chunks
+
+        `embed(body)` POSTs to /api/embed and returns the decoded reply;
+        if it raises, the request goes through uncached.
+        """
+        scope = self.scope(payload)
+        vector = None
+        if scope is not None:
+            try:
+                vector = self.vector(embed(self.embed_request(payload)))
+            except Exception:
+                vector = None
+        if vector is None:
+            self.bypass(metrics)
+            yield from fetch()
+            return
+        recorded = self.lookup(scope, vector, metrics)
+        if recorded is not None:
+            yield from recorded
+            return
+        recorded = []
+        chunks = fetch()
+        try:
+            for chunk in chunks:
+                recorded.append(chunk)
+                yield chunk
+        finally:
+            chunks.close()
+        if recorded and recorded[-1].get("done"):
+            self.add(scope, payload["prompt"], vector, recorded)
+
+    async def astream(self, payload: dict, embed, fetch, metrics=None):
+        """stream() for the asyncio client: `embed` is a coroutine function
+
+        Lookups and inserts run in a worker thread, off the event loop.
+        """
+        import asyncio
+
+        scope = self.scope(payload)
+        vector = None
+        if scope is not None:
+            try:
+                vector = self.vector(await embed(self.embed_request(payload)))
+            except Exception:
+                vector = None
+        if vector is None:
+            self.bypass(metrics)
+            async for chunk in fetch():
+                yield chunk
+            return
+        recorded = await asyncio.to_thread(self.lookup, scope, vector, metrics)
+        if recorded is not None:
+            for chunk in recorded:
+                yield chunk
+            return
+        recorded = []
+        chunks = fetch()
+        try:
+            async for chunk in chunks:
+                recorded.append(chunk)
+                yield chunk
+        finally:
+            await chunks.aclose()
+        if recorded and recorded[-1].get("done"):
+            await asyncio.to_thread(
+                self.add, scope, payload["prompt"], vector, recorded
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "entries": int(self.valid.sum()),
+        }
+
+    def close(self):
+        with self._lock:
+            if isinstance(self.matrix, np.memmap):
+                self.matrix.flush()
+            self._db.close()
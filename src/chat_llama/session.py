@@ -0,0 +1,164 @@
+import copy
+from typing import Callable, Optional
+
+from chat_llama.client import OllamaClient, get_client
+from chat_llama.config import COMPACT_AT
+from chat_llama.context import estimate_tokens
+from chat_llama.metrics import RequestMetrics
+from chat_llama.streaming import TextStream
+
+
+class Session:
+    """Multi-turn conversation carried by Ollama's returned `context` tokens
+
+    Each /api/generate call sends the context array from the previous
+    turn's final chunk, so the server resumes from its own KV state
+    instead of re-evaluating the whole transcript. compact() bounds that
+    history: it swaps the context for a short transcript of recent turns.
+    """
+
+    def __init__(self, model: str, system: Optional[str] = None):
+        self.model = model
+        self.system = system
+        self.context: Optional[list] = None
+        self.turns = []
+        self.last_stats = {}
+        self.last_metrics: Optional[RequestMetrics] = None
+        # Set by compact(): history the next prompt carries as text
+        self.carry = ""
+        self.summary = ""
+        # turns[:compacted] survive only in the summary, if at all
+        self.compacted = 0
+
+    def request_fields(self) -> dict:
+        """Extra /api/generate fields for the next turn"""
+        fields = {}
+        if self.context:
+            fields["context"] = self.context
+        if self.system:
+            fields["system"] = self.system
+        return fields
+
+    def update(self, final_chunk: dict, prompt: str, response: str = ""):
+        """Record a finished turn from its final (done) chunk"""
+        self.last_stats = {
+            k: v for k, v in final_chunk.items() if k.endswith(("_count", "_duration"))
+        }
+        self.turns.append((prompt, response))
+        if "context" in final_chunk:
+            self.context = final_chunk["context"]
+            # The returned context now covers the carried history
+            self.carry = ""
+        elif not self.context:
+            # A semantic-cache replay comes without context: keep this
+            # turn, and whatever history it was sent with, as text
+            turn = _transcript([(prompt, response)])
+            self.carry = f"{self.carry}\n\n{turn}" if self.carry else turn
+
+    @property
+    def history_tokens(self) -> int:
+        """Tokens of history the next turn starts from"""
+        if self.context:
+            return len(self.context)
+        return estimate_tokens(self.carry)
+
+    def turn_prompt(self, prompt: str) -> str:
+        """The prompt to send for this turn, after any compacted history"""
+        return f"{self.carry}\n\n{prompt}" if self.carry else prompt
+
+    def compact(
+        self,
+        window: int,
+        compact_at: float = COMPACT_AT,
+        summarize: Optional[Callable[[str], str]] = None,
+    ) -> bool:
+        """Shrink the history once it passes `compact_at` of the window
+
+        The context tokens are dropped; the next prompt instead starts
+        with the newest turns that fit in half that threshold, verbatim.
+        Older turns are dropped, or with `summarize` (transcript -> text)
+        folded into a running summary. Returns whether it compacted.
+        """
+        limit = int(window * compact_at)
+        if self.history_tokens <= limit:
+            return False
+        recent = _newest(self.turns[self.compacted :], limit // 2)
+        dropped = self.turns[self.compacted : len(self.turns) - len(recent)]
+        if dropped and summarize is not None:
+            earlier = f"Earlier summary: {self.summary}\n\n" if self.summary else ""
+            self.summary = summarize(earlier + _transcript(_newest(dropped, limit)))
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the conversation so far:\n{self.summary}")
+        if recent:
+            parts.append(f"Most recent turns:\n{_transcript(recent)}")
+        self.carry = "\n\n".join(parts)
+        self.context = None
+        self.compacted = len(self.turns) - len(recent)
+        return True
+
+    def use_model(self, model: str):
+        # Context tokens only make sense to the model that produced them
+        if model != self.model:
+            self.reset()
+            self.model = model
+
+    def reset(self):
+        self.context = None
+        self.turns = []
+        self.last_stats = {}
+        self.carry = ""
+        self.summary = ""
+        self.compacted = 0
+
+    def fork(self) -> "Session":
+        """Independent copy that continues from the same point"""
+        return copy.deepcopy(self)
+
+    def stream(
+        self,
+        prompt: str,
+        client: Optional[OllamaClient] = None,
+        metrics: Optional[RequestMetrics] = None,
+        **fields,
+    ):
+        """Send one turn, yielding response text as it arrives
+
+        The turn's RequestMetrics (passed in, e.g. to mark rendering, or
+        created here) is available as `last_metrics`.
+        """
+        client = client or get_client()
+        fields.update(self.request_fields())
+        metrics = metrics or RequestMetrics(self.model, "/api/generate")
+        self.last_metrics = metrics
+        stream = TextStream(
+            client.stream_generate(
+                self.model, self.turn_prompt(prompt), metrics=metrics, **fields
+            ),
+            metrics,
+        )
+        parts = []
+        try:
+            for text in stream:
+                parts.append(text)
+                yield text
+        finally:
+            # Closing this generator (a Stop button) aborts the request
+            stream.close()
+        if stream.final is not None:
+            self.update(stream.final, prompt, "".join(parts))
+
+
+def _transcript(turns: list) -> str:
+    return "\n\n".join(f"User: {p}\nAssistant: {r}" for p, r in turns)
+
+
+def _newest(turns: list, tokens: int) -> list:
+    """The longest run of most recent turns that fits in `tokens`"""
+    kept = 0
+    for prompt, response in reversed(turns):
+        tokens -= estimate_tokens(prompt) + estimate_tokens(response) + 4
+        if tokens < 0:
+            break
+        kept += 1
+    return turns[len(turns) - kept :]
@@ -0,0 +1,149 @@
+import contextlib
+import io
+from typing import TYPE_CHECKING, Iterable, Optional, TextIO
+
+if TYPE_CHECKING:
+    from chat_llama.client import OllamaClient
+    from chat_llama.metrics import RequestMetrics
+
+# Final-chunk fields worth keeping once a stream finishes
+STAT_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+
+def chunk_text(chunk: dict) -> str:
+    """Text carried by a /api/generate or /api/chat chunk"""
+    if "response" in chunk:
+        return chunk["response"]
+    return chunk.get("message", {}).get("content", "")
+
+
+class TextStream:
+    """Iterate response text from an NDJSON chunk stream, then read its stats
+
+    The stream is consumed once: iterate it, call text() to collect the
+    rest in one pass, or write_to() to copy it into a file without holding
+    the response in memory. After the final chunk, `final` holds it and
+    `stats` holds the server's timing and token counts.
+
+    With `metrics`, tokens are counted as they arrive and the request is
+    recorded once the stream ends, fails or is abandoned.
+
+    close() (or Ctrl-C while it is being read) stops the request: the
+    source is closed, which drops the HTTP connection so the server stops
+    generating, and the request is recorded as cancelled.
+    """
+
+    def __init__(
+        self, chunks: Iterable[dict], metrics: Optional["RequestMetrics"] = None
+    ):
+        self._chunks = iter(chunks)
+        self.final: Optional[dict] = None
+        self.metrics = metrics
+
+    def __iter__(self):
+        metrics = self.metrics
+        try:
+            # Run the source to exhaustion rather than stopping at the done
+            # chunk, so the HTTP response is fully read and its connection
+            # goes back to the pool instead of being closed.
+            for chunk in self._chunks:
+                if chunk.get("done"):
+                    self.final = chunk
+                text = chunk_text(chunk)
+                if text:
+                    if metrics is not None:
+                        metrics.mark_token()
+                    yield text
+        except (GeneratorExit, KeyboardInterrupt):
+            self.close()
+            raise
+        except Exception as e:
+            self._record(outcome="error", error=str(e))
+            raise
+        self._record()
+
+    def close(self):
+        """Stop reading; a no-op once the stream has finished"""
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        self._record(outcome="cancelled")
+
+    def _record(self, outcome: str = "", error: str = ""):
+        if self.metrics is None or self.metrics.finished:
+            return
+        from chat_llama.metrics import get_metrics
+
+        self.metrics.finish(self.final, outcome, error)
+        get_metrics().record(self.metrics)
+
+    @property
+    def stats(self) -> dict:
+        if self.final is None:
+            return {}
+        return {k: self.final[k] for k in STAT_FIELDS if k in self.final}
+
+    def text(self) -> str:
+        """Remaining text, accumulated in linear time"""
+        buffer = io.StringIO()
+        with self._reading() as texts:
+            for text in texts:
+                buffer.write(text)
+        return buffer.getvalue()
+
+    def write_to(self, out: TextIO, flush: bool = True) -> int:
+        """Copy the remaining text to `out` as it arrives; returns characters"""
+        written = 0
+        with self._reading() as texts:
+            for text in texts:
+                written += out.write(text)
+                if flush:
+                    out.flush()
+                if self.metrics is not None:
+                    self.metrics.mark_render()
+        return written
+
+    @contextlib.contextmanager
+    def _reading(self):
+        # If the consumer fails (Ctrl-C in a write, a closed pipe), close
+        # the stream now rather than whenever the traceback is released
+        texts = iter(self)
+        try:
+            yield texts
+        finally:
+            texts.close()
+
+
+def generate(
+    model: str, prompt: str, client: Optional["OllamaClient"] = None, **fields
+) -> TextStream:
+    """Stream /api/generate text, e.g. generate(m, p).write_to(sys.stdout)"""
+    from chat_llama.client import get_client
+    from chat_llama.metrics import RequestMetrics
+
+    metrics = RequestMetrics(model, "/api/generate")
+    client = client or get_client()
+    return TextStream(
+        client.stream_generate(model, prompt, metrics=metrics, **fields), metrics
+    )
+
+
+def chat(
+    model: str, messages: list, client: Optional["OllamaClient"] = None, **fields
+) -> TextStream:
+    """Stream /api/chat text, e.g. chat(m, messages).text()"""
+    from chat_llama.client import get_client
+    from chat_llama.metrics import RequestMetrics
+
+    metrics = RequestMetrics(model, "/api/chat")
+    client = client or get_client()
+    return TextStream(
+        client.stream_chat(model, messages, metrics=metrics, **fields), metrics
+    )
@@ -1,12 +1,28 @@
-import enum
-import json
+import queue
+import sys
+import time
 import tkinter as tk
 from dataclasses import dataclass
-from threading import Thread
+from pathlib import Path
 from tkinter import scrolledtext, ttk
 from typing import Optional
 
-import requests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from chat_llama.async_client import get_worker  # noqa: E402
+from chat_llama.fanout import FanOut  # noqa: E402
+from chat_llama.history import ConversationRecorder, get_history  # noqa: E402
+from chat_llama.history_window import HistoryWindow  # noqa: E402
+from chat_llama.metrics import RequestMetrics, get_metrics  # noqa: E402
+from chat_llama.render import FrameRenderer  # noqa: E402
+from chat_llama.residency import get_residency  # noqa: E402
+from chat_llama.response_view import ResponseView  # noqa: E402
+from chat_llama.session import Session  # noqa: E402
+from Models.llama_models import get_registry  # noqa: E402
+
+FRAME_INTERVAL_MS = 16
+RESIDENCY_POLL_MS = 5000
+READOUT_INTERVAL_S = 0.25
 
 
 @dataclass
@@ -64,17 +80,6 @@ class Theme:
     )
 
 
-class Models(enum.Enum):
-    """Available Llama models"""
-
-    LLAMA3_2 = "llama3.2"
-    LLAMA3_1_8B = "llama3.1:8b"
-
-    @classmethod
-    def default(cls):
-        return cls.LLAMA3_2
-
-
 class StyledText(scrolledtext.ScrolledText):
     """Custom styled text widget with modern appearance"""
 
@@ -133,14 +138,71 @@ class StatusBar(ttk.Label):
         self.configure(foreground=self.theme.foreground)
         self.configure(text=message)
 
+    def set_readout(self, message: str, metrics: RequestMetrics):
+        """Show `message` followed by the request's tokens/s and TTFT"""
+        summary = metrics.summary()
+        self.configure(text=f"{message} · {summary}" if summary else message)
+
+
+class ModelPane(ttk.Frame):
+    """One model's streamed answer when a prompt fans out to several"""
+
+    def __init__(self, master, theme: ThemeColors, model: str):
+        super().__init__(master)
+        self.model = model
+        self.header = ttk.Label(
+            self, text=model, background=theme.background, foreground=theme.accent
+        )
+        self.header.pack(fill=tk.X, padx=5)
+        self.text = StyledText(self, theme=theme, height=15, wrap=tk.WORD)
+        self.text.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.view = ResponseView(self.text)
+        self.renderer = FrameRenderer(self.view, FRAME_INTERVAL_MS)
+        self._readout_due = 0.0
+
+    def flush(self, metrics: RequestMetrics) -> int:
+        """Draw buffered text and refresh this model's live readout"""
+        delay = self.renderer.flush()
+        if self.renderer.drawn:
+            metrics.mark_render()
+        now = time.perf_counter()
+        if not metrics.finished and metrics.tokens and now >= self._readout_due:
+            self._readout_due = now + READOUT_INTERVAL_S
+            self.header.configure(text=f"{self.model} · {metrics.summary()}")
+        return delay
+
+    def destroy(self):
+        self.view.close()
+        super().destroy()
+
+    def finish(self, message: str, metrics: RequestMetrics):
+        self.flush(metrics)
+        summary = metrics.summary()
+        text = f"{self.model}: {message}" + (f" · {summary}" if summary else "")
+        self.header.configure(text=text)
+
 
 class OllamaGUI:
     def __init__(self, root, theme: Optional[ThemeColors] = None):
         self.root = root
         self.theme = theme or Theme.DARK
+        self.events = queue.Queue()
+        self.request_id = None
+        # Set while a prompt fans out to several models
+        self.fanout: Optional[FanOut] = None
+        self.fanout_panes = {}
         self.setup_window()
         self.create_widgets()
         self.apply_theme()
+        # Conversation state carried between turns via Ollama's context
+        self.session = Session(self.model_var.get())
+        self.response_parts = []
+        # Prompts and streamed answers are saved in the background
+        self.history = ConversationRecorder(get_history())
+        self.history_window = None
+        # Load the default model now rather than on the first request
+        self.on_model_selected()
+        self._poll_residency()
 
     def setup_window(self):
         """Configure the main window"""
@@ -167,7 +229,7 @@ class OllamaGUI:
         # Input area
         self.create_input_area()
 
-        # Send button
+        # Send, Stop, New Chat and History buttons
         self.create_send_button()
 
         # Response area
@@ -186,14 +248,34 @@ class OllamaGUI:
         )
         label.grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
 
-        self.model_var = tk.StringVar(value=Models.default().value)
+        self.model_var = tk.StringVar(value=get_registry().default())
         self.model_combo = ttk.Combobox(
             self.main_frame,
             textvariable=self.model_var,
             state="readonly",
-            values=[model.value for model in Models],
+            values=get_registry().names(),
         )
         self.model_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.model_combo.bind("<<ComboboxSelected>>", self.on_model_selected)
+
+        # Whether the selected model is loaded on the server
+        self.residency_var = tk.StringVar()
+        residency_label = ttk.Label(
+            self.main_frame,
+            textvariable=self.residency_var,
+            background=self.theme.background,
+            foreground=self.theme.accent,
+        )
+        residency_label.grid(row=0, column=2, sticky=tk.W, padx=5, pady=5)
+
+        # Extra models to send the same prompt to, side by side
+        self.compare_vars = None
+        self.race_var = tk.BooleanVar()
+        self.compare_button = ttk.Menubutton(self.main_frame, text="Compare")
+        self.compare_menu = tk.Menu(self.compare_button, tearoff=False)
+        self.compare_button["menu"] = self.compare_menu
+        self.compare_button.grid(row=0, column=3, sticky=tk.E, padx=5, pady=5)
+        self.update_compare_menu(get_registry().names())
 
     def create_input_area(self):
         """Create the input text area"""
@@ -213,11 +295,26 @@ class OllamaGUI:
         )
 
     def create_send_button(self):
-        """Create the send button"""
+        """Create the send, stop, new chat and history buttons"""
+        button_frame = ttk.Frame(self.main_frame)
+        button_frame.grid(row=2, column=1, sticky=tk.E, padx=5, pady=10)
         self.send_button = ModernButton(
-            self.main_frame, theme=self.theme, text="Send", command=self.send_request
+            button_frame, theme=self.theme, text="Send", command=self.send_request
+        )
+        self.send_button.pack(side=tk.RIGHT)
+        self.stop_button = ModernButton(
+            button_frame, theme=self.theme, text="Stop", command=self.stop_request
         )
-        self.send_button.grid(row=2, column=1, sticky=tk.E, padx=5, pady=10)
+        self.stop_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.stop_button.state(["disabled"])
+        self.new_chat_button = ModernButton(
+            button_frame, theme=self.theme, text="New Chat", command=self.new_chat
+        )
+        self.new_chat_button.pack(side=tk.RIGHT, padx=5)
+        self.history_button = ModernButton(
+            button_frame, theme=self.theme, text="History", command=self.show_history
+        )
+        self.history_button.pack(side=tk.RIGHT)
 
     def create_response_area(self):
         """Create the response text area"""
@@ -229,12 +326,19 @@ class OllamaGUI:
         )
         label.grid(row=3, column=0, sticky=(tk.N, tk.W), padx=5, pady=5)
 
-        self.response_text = StyledText(
-            self.main_frame, theme=self.theme, height=15, wrap=tk.WORD
-        )
-        self.response_text.grid(
+        # Holds the single response, or one ModelPane per compared model
+        self.response_panes = ttk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL)
+        self.response_panes.grid(
             row=3, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5
         )
+        self.response_text = StyledText(
+            self.response_panes, theme=self.theme, height=15, wrap=tk.WORD
+        )
+        self.response_panes.add(self.response_text, weight=1)
+        # Holds a bounded window of the response; the rest spills to a file
+        self.response_view = ResponseView(self.response_text)
+        # Streamed tokens are batched into one widget update per frame
+        self.renderer = FrameRenderer(self.response_view, FRAME_INTERVAL_MS)
 
     def create_status_bar(self):
         """Create the status bar"""
@@ -257,47 +361,232 @@ class OllamaGUI:
             foreground=self.theme.input_fg,
         )
 
+    def on_model_selected(self, event=None):
+        """Start loading the newly selected model in the background"""
+        get_residency().warm_async(self.model_var.get())
+        self.residency_var.set("loading")
+
+    def _poll_residency(self):
+        """Show whether the selected model is hot or cold on the server"""
+        residency = get_residency()
+        self.residency_var.set(residency.status(self.model_var.get()))
+        # Pick up the installed-model list once the registry has refreshed
+        names = get_registry().names()
+        self.model_combo["values"] = names
+        self.update_compare_menu(names)
+        residency.refresh_async()
+        self.root.after(RESIDENCY_POLL_MS, self._poll_residency)
+
+    def update_compare_menu(self, names: list):
+        """Offer every installed model in the Compare menu"""
+        if self.compare_vars is not None and list(self.compare_vars) == list(names):
+            return
+        old = self.compare_vars or {}
+        self.compare_vars = {name: old.get(name) or tk.BooleanVar() for name in names}
+        self.compare_menu.delete(0, tk.END)
+        for name, var in self.compare_vars.items():
+            self.compare_menu.add_checkbutton(label=name, variable=var)
+        self.compare_menu.add_separator()
+        self.compare_menu.add_checkbutton(
+            label="Race: keep the first answer", variable=self.race_var
+        )
+
+    def compare_models(self) -> list:
+        """The selected model plus any ticked in the Compare menu"""
+        models = [self.model_var.get()]
+        for name, var in self.compare_vars.items():
+            if var.get() and name not in models:
+                models.append(name)
+        return models
+
     def send_request(self):
         """Handle the send request action"""
         self.send_button.state(["disabled"])
+        self.stop_button.state(["!disabled"])
         self.status_bar.set_info("Sending request...")
-        self.response_text.delete(1.0, tk.END)
-        Thread(target=self._process_request, daemon=True).start()
+        models = self.compare_models()
+        if len(models) > 1:
+            self._show_panes(models)
+            self._process_fanout(models)
+            return
+        self._show_panes([])
+        self.response_view.clear()
+        self.renderer.reset()
+        self._process_request()
+
+    def _show_panes(self, models: list):
+        """Switch between the single response and one pane per model"""
+        for pane in self.fanout_panes.values():
+            self.response_panes.forget(pane)
+            pane.destroy()
+        self.fanout_panes = {}
+        panes = [str(pane) for pane in self.response_panes.panes()]
+        single = str(self.response_text) in panes
+        if not models:
+            if not single:
+                self.response_panes.add(self.response_text, weight=1)
+            return
+        if single:
+            self.response_panes.forget(self.response_text)
+        for model in models:
+            pane = ModelPane(self.response_panes, self.theme, model)
+            self.response_panes.add(pane, weight=1)
+            self.fanout_panes[model] = pane
+
+    def _process_fanout(self, models: list):
+        """Send the prompt to every model at once, without chat context"""
+        prompt = self.input_text.get(1.0, tk.END).strip()
+        self.fanout = FanOut(self.events, models, prompt, race=self.race_var.get())
+        self.root.after(FRAME_INTERVAL_MS, self._poll_fanout)
+
+    def _poll_fanout(self):
+        """Route worker events to each model's pane"""
+        fanout = self.fanout
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            model = fanout.handle(event)
+            if model is None:
+                continue
+            pane = self.fanout_panes[model]
+            if event.kind == "chunk":
+                pane.renderer.write(event.text)
+            elif event.kind == "done":
+                won = model == fanout.winner
+                pane.finish("winner" if won else "done", fanout.metrics[model])
+            else:
+                pane.finish(event.text or "cancelled", fanout.metrics[model])
+        delay = min(
+            pane.flush(fanout.metrics[model])
+            for model, pane in self.fanout_panes.items()
+        )
+        if not fanout.finished:
+            self.root.after(delay, self._poll_fanout)
+            return
+        if fanout.winner:
+            self.status_bar.set_success(f"{fanout.winner} answered first")
+        else:
+            self.status_bar.set_success(f"Compared {len(fanout.metrics)} models")
+        self.fanout = None
+        self.send_button.state(["!disabled"])
+        self.stop_button.state(["disabled"])
 
     def _process_request(self):
-        """Process the API request in a separate thread"""
-        base_url = "http://localhost:11434/api/generate"
+        """Submit the request to the shared streaming worker"""
         prompt = self.input_text.get(1.0, tk.END).strip()
         model = self.model_var.get()
-        data = {"model": model, "prompt": prompt}
-
-        try:
-            response = requests.post(base_url, json=data, stream=True)
-            response.raise_for_status()
-
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    chunk = json_response.get("response", "")
-                    full_response += chunk
-                    self.root.after(0, self._update_response_text, chunk)
-
-            self.root.after(
-                0, lambda: self.status_bar.set_success("Request completed successfully")
-            )
-
-        except requests.exceptions.RequestException as e:
-            error_message = f"Request failed: {str(e)}"
-            self.root.after(0, lambda: self.status_bar.set_error(error_message))
-
-        finally:
-            self.root.after(0, lambda: self.send_button.state(["!disabled"]))
+        self.session.use_model(model)
+        self.request_prompt = prompt
+        self.response_parts = []
+        self.history.prompt(model, prompt)
+        self.metrics = RequestMetrics(model, "/api/generate")
+        self._readout_due = 0.0
+        self.request_id = get_worker().submit(
+            self.events,
+            model,
+            self.session.turn_prompt(prompt),
+            metrics=self.metrics,
+            keep_alive=get_residency().keep_alive(model),
+            **self.session.request_fields(),
+        )
+        self.root.after(FRAME_INTERVAL_MS, self._poll_events)
+
+    def _poll_events(self):
+        """Drain worker events on the Tk main thread"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event.request_id != self.request_id:
+                continue
+            if event.kind == "chunk":
+                self._update_response_text(event.text)
+                continue
+            self._flush()
+            self.history.finish()
+            get_metrics().record(self.metrics)
+            if event.kind == "done":
+                self.session.update(
+                    event.data, self.request_prompt, "".join(self.response_parts)
+                )
+                self.status_bar.set_success(
+                    f"Request completed successfully (turn {len(self.session.turns)})"
+                )
+            else:
+                self.status_bar.set_error(
+                    event.text or f"Stopped after {self.metrics.tokens} tokens"
+                )
+            self.status_bar.set_readout(self.status_bar["text"], self.metrics)
+            self.send_button.state(["!disabled"])
+            self.stop_button.state(["disabled"])
+            return
+        delay = self._flush()
+        now = time.perf_counter()
+        if self.metrics.tokens and now >= self._readout_due:
+            # Live readout, redrawn a few times a second rather than per frame
+            self._readout_due = now + READOUT_INTERVAL_S
+            self.status_bar.set_readout("Receiving", self.metrics)
+        self.root.after(delay, self._poll_events)
+
+    def _flush(self) -> int:
+        """Draw buffered text, noting when the first token reached the screen"""
+        delay = self.renderer.flush()
+        if self.renderer.drawn:
+            self.metrics.mark_render()
+        return delay
+
+    def stop_request(self):
+        """Cancel the streaming request; the server stops generating too"""
+        if self.fanout is not None:
+            self.fanout.cancel()
+        else:
+            get_worker().cancel(self.request_id)
+        self.status_bar.set_info("Stopping...")
+
+    def new_chat(self):
+        """Forget the conversation context and clear the response"""
+        self.session.reset()
+        if self.fanout is None:
+            self._show_panes([])
+        self.response_view.clear()
+        self.renderer.reset()
+        self.history.new_conversation()
+        self.status_bar.set_info("Started a new chat")
+
+    def show_history(self):
+        """Open (or refresh) the searchable list of saved conversations"""
+        store = get_history()
+        if store is None:
+            self.status_bar.set_info("History is turned off (CHAT_LLAMA_HISTORY=0)")
+        elif self.history_window is None or not self.history_window.winfo_exists():
+            self.history_window = HistoryWindow(self.root, store, self._show_messages)
+            self.history_window.configure(bg=self.theme.background)
+        else:
+            self.history_window.reload()
+            self.history_window.lift()
+
+    def _show_messages(self, messages, first):
+        """Show a page of a saved conversation in the response area"""
+        if self.send_button.instate(["disabled"]):
+            self.status_bar.set_info("Wait for the answer, or stop it, to open history")
+            return
+        if first:
+            self._show_panes([])
+            self.response_view.clear()
+            self.renderer.reset()
+            self.status_bar.set_info("Showing a saved conversation")
+        for _, role, model, content in messages:
+            speaker = "You" if role == "user" else model
+            self.response_view.insert(tk.END, f"{speaker}:\n{content}\n\n")
 
     def _update_response_text(self, text):
-        """Update the response text area"""
-        self.response_text.insert(tk.END, text)
-        self.response_text.see(tk.END)
+        """Queue text for the next frame's update of the response area"""
+        self.response_parts.append(text)
+        self.history.write(text)
+        self.renderer.write(text)
 
 
 def main():
@@ -1,10 +1,27 @@
 import enum
-import json
+import queue
+import sys
 import tkinter as tk
-from threading import Thread
-from tkinter import scrolledtext, ttk
+from pathlib import Path
+from tkinter import filedialog, scrolledtext, ttk
 
-import requests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from chat_llama.async_client import get_worker  # noqa: E402
+from chat_llama.config import DOCS_DIR  # noqa: E402
+from chat_llama.context import ContextBudget, context_window  # noqa: E402
+from chat_llama.history import ConversationRecorder, get_history  # noqa: E402
+from chat_llama.history_window import HistoryWindow  # noqa: E402
+from chat_llama.metrics import RequestMetrics, get_metrics  # noqa: E402
+from chat_llama.render import FrameRenderer  # noqa: E402
+from chat_llama.residency import get_residency  # noqa: E402
+from chat_llama.response_view import ResponseView  # noqa: E402
+from chat_llama.session import Session  # noqa: E402
+from Models.llama_models import get_registry  # noqa: E402
+
+FRAME_INTERVAL_MS = 16
+RESIDENCY_POLL_MS = 5000
+INDEX_POLL_MS = 500
 
 
 class SystemPrompts(enum.Enum):
@@ -30,15 +47,6 @@ class StaticSystemPrompts(enum.Enum):
     RESEARCH = "Research this topic."
 
 
-class Models(enum.Enum):
-    LLAMA3_2 = "llama3.2"
-    LLAMA3_1_8B = "llama3.1:8b"
-
-    @classmethod
-    def default(cls):
-        return cls.LLAMA3_1_8B
-
-
 class OllamaGUI:
     def __init__(self, root):
         self.root = root
@@ -61,12 +69,18 @@ class OllamaGUI:
         ttk.Label(main_frame, text="Model:").grid(
             row=0, column=0, sticky=tk.W, padx=5, pady=5
         )
-        self.model_var = tk.StringVar(value=Models.default().value)
-        model_combo = ttk.Combobox(
+        self.model_var = tk.StringVar(value=get_registry().default())
+        self.model_combo = model_combo = ttk.Combobox(
             main_frame, textvariable=self.model_var, state="readonly"
         )
-        model_combo["values"] = [model.value for model in Models]
+        model_combo["values"] = get_registry().names()
         model_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        model_combo.bind("<<ComboboxSelected>>", self.on_model_selected)
+        # Whether the selected model is loaded on the server
+        self.residency_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.residency_var).grid(
+            row=0, column=2, sticky=tk.W, padx=5, pady=5
+        )
 
         # System Prompt Label
         ttk.Label(main_frame, text="System Prompt:").grid(
@@ -132,11 +146,35 @@ class OllamaGUI:
             row=5, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5
         )
 
-        # Send button
+        # Send, Stop, New Chat and History buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=6, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
         self.send_button = ttk.Button(
-            main_frame, text="Send", command=self.send_request
+            button_frame, text="Send", command=self.send_request
         )
-        self.send_button.grid(row=6, column=1, sticky=tk.E, padx=5, pady=5)
+        self.send_button.pack(side=tk.RIGHT)
+        self.stop_button = ttk.Button(
+            button_frame, text="Stop", command=self.stop_request
+        )
+        self.stop_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.stop_button.state(["disabled"])
+        ttk.Button(button_frame, text="New Chat", command=self.new_chat).pack(
+            side=tk.RIGHT, padx=5
+        )
+        ttk.Button(button_frame, text="History", command=self.show_history).pack(
+            side=tk.RIGHT
+        )
+        # Estimated size of the next request against the context window
+        self.budget_var = tk.StringVar()
+        ttk.Label(button_frame, textvariable=self.budget_var).pack(side=tk.LEFT)
+        # Retrieval from a local folder, prepended to the prompt on send
+        self.docs_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame, text="Use documents", variable=self.docs_var
+        ).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(
+            button_frame, text="Documents...", command=self.choose_documents
+        ).pack(side=tk.LEFT, padx=5)
 
         # Response text area Label
         ttk.Label(main_frame, text="Response:").grid(
@@ -157,6 +195,40 @@ class OllamaGUI:
             row=8, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=5, pady=5
         )
 
+        # Streamed responses arrive here from the background worker
+        self.events = queue.Queue()
+        self.request_id = None
+        # Holds a bounded window of the response; the rest spills to a file
+        self.response_view = ResponseView(self.response_text)
+        # Streamed tokens are batched into one widget update per frame
+        self.renderer = FrameRenderer(self.response_view, FRAME_INTERVAL_MS)
+        # Conversation state carried between turns via Ollama's context
+        self.session = Session(self.model_var.get())
+        self.response_parts = []
+        # Prompts and streamed answers are saved in the background
+        self.history = ConversationRecorder(get_history())
+        self.history_window = None
+        # Re-estimated (per changed paragraph) whenever a prompt box changes
+        self.budget = ContextBudget(context_window(self.model_var.get()))
+        self._budget_pending = False
+        for widget in (
+            self.system_prompt_text,
+            self.static_prompt_text,
+            self.input_text,
+        ):
+            widget.bind("<<Modified>>", self._on_text_modified)
+        self._update_budget()
+        # The DocumentIndex of the chosen folder, and its running update
+        self.documents = None
+        self.indexing = None
+        self.searching = None
+        if DOCS_DIR:
+            self.open_documents(DOCS_DIR)
+
+        # Load the default model now rather than on the first request
+        self.on_model_selected()
+        self._poll_residency()
+
     def on_system_prompt_selected(self, event):
         selected_prompt_name = self.system_prompt_var.get()
         selected_prompt = SystemPrompts[selected_prompt_name].value
@@ -169,18 +241,77 @@ class OllamaGUI:
         self.static_prompt_text.delete(1.0, tk.END)
         self.static_prompt_text.insert(tk.END, selected_prompt)
 
+    def on_model_selected(self, event=None):
+        get_residency().warm_async(self.model_var.get())
+        self.residency_var.set("loading")
+        self._update_budget()
+
+    def _on_text_modified(self, event):
+        # Tk only reports the first change until the flag is cleared
+        event.widget.edit_modified(False)
+        if not self._budget_pending:
+            self._budget_pending = True
+            self.root.after_idle(self._update_budget)
+
+    def _update_budget(self):
+        self._budget_pending = False
+        self.budget.window = context_window(self.model_var.get())
+        self.budget.set_tokens("history", self.session.history_tokens)
+        self.budget.set("prompt", self._build_prompt())
+        self.budget_var.set(self.budget.describe())
+
+    def _poll_residency(self):
+        residency = get_residency()
+        self.residency_var.set(residency.status(self.model_var.get()))
+        # Pick up the installed-model list once the registry has refreshed
+        self.model_combo["values"] = get_registry().names()
+        residency.refresh_async()
+        self.root.after(RESIDENCY_POLL_MS, self._poll_residency)
+
+    def choose_documents(self):
+        folder = filedialog.askdirectory(title="Folder to search", parent=self.root)
+        if folder:
+            self.open_documents(folder)
+
+    def open_documents(self, folder):
+        try:
+            from chat_llama.documents import get_index
+        except ImportError:
+            self.status_var.set("Documents need numpy: pip install chat-llama[docs]")
+            return
+        self.documents = get_index(folder)
+        self.docs_var.set(True)
+        # Only files added or changed since the last run are embedded
+        self.indexing = self.documents.update_async()
+        self._poll_indexing()
+
+    def _poll_indexing(self):
+        if not self.indexing.done():
+            done, total = self.documents.progress
+            self.status_var.set(f"Indexing documents: {done} of {total} files")
+            self.root.after(INDEX_POLL_MS, self._poll_indexing)
+            return
+        try:
+            changed = self.indexing.result()
+        except Exception as e:
+            self.status_var.set(f"Indexing failed: {e}")
+            return
+        self.status_var.set(
+            f"Indexed {self.documents.root}: {changed['changed']} files updated,"
+            f" {changed['removed']} removed"
+        )
+
     def send_request(self):
         # Disable send button and update status
         self.send_button.state(["disabled"])
+        self.stop_button.state(["!disabled"])
         self.status_var.set("Sending request...")
-        self.response_text.delete(1.0, tk.END)
+        self.response_view.clear()
+        self.renderer.reset()
 
-        # Create and start thread for API request
-        Thread(target=self._process_request, daemon=True).start()
+        self._process_request()
 
-    def _process_request(self):
-        base_url = "http://localhost:11434/api/generate"
-        model = self.model_var.get()
+    def _build_prompt(self) -> str:
         sys_p = self.system_prompt_text.get(1.0, tk.END).strip()
         usr_p_static = self.static_prompt_text.get(1.0, tk.END).strip()
         usr_p = self.input_text.get(1.0, tk.END).strip()
@@ -212,36 +343,168 @@ class OllamaGUI:
                 prompt = (
                     f"{sys_p_prefix}{sys_p}\n{usr_p_prefix}{usr_p_static}\n\n{usr_p}"
                 )
+        return prompt
 
-        data = {"model": model, "prompt": prompt}
-
+    def _process_request(self):
+        if self.documents is None or not self.docs_var.get():
+            self._send([])
+            return
+        # Retrieval embeds the question on a background thread
+        query = self.input_text.get(1.0, tk.END).strip() or self._build_prompt()
+        self.status_var.set("Searching documents...")
+        self.searching = self.documents.search_async(query)
+        self._await_passages(self.searching)
+
+    def _await_passages(self, future):
+        if future is not self.searching:
+            return  # stopped
+        if not future.done():
+            self.root.after(FRAME_INTERVAL_MS, self._await_passages, future)
+            return
         try:
-            response = requests.post(base_url, json=data, stream=True)
-            response.raise_for_status()
-
-            # Process streaming response
-            for line in response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    chunk = json_response.get("response", "")
-                    # Update response text in main thread
-                    self.root.after(0, self._update_response_text, chunk)
-
-            self.root.after(
-                0, self._request_completed, "Request completed successfully"
+            passages = future.result()
+        except Exception as e:
+            # Answer without the documents rather than not at all
+            self.status_var.set(f"Document search failed: {e}")
+            passages = []
+        self.searching = None
+        self._send(passages)
+
+    def _send(self, passages):
+        model = self.model_var.get()
+        typed = self._build_prompt()
+        self.session.use_model(model)
+        # Past the threshold, older turns are dropped to bound prefill
+        window = context_window(model)
+        compacted = self.session.compact(window)
+        self._update_budget()
+        prompt = typed
+        if passages:
+            from chat_llama.documents import with_passages
+
+            # The weakest passages go first if they would overflow the window
+            while True:
+                prompt = with_passages(typed, passages)
+                self.budget.set("documents", prompt[: len(prompt) - len(typed)])
+                if self.budget.used <= window or not passages:
+                    break
+                passages = passages[:-1]
+        from_docs = sorted({p.path for p in passages})
+        if self.budget.used > window:
+            # Ollama would silently cut the front of the prompt
+            self._request_completed(
+                f"Prompt is ~{self.budget.used:,} tokens, more than the"
+                f" {window:,}-token context window; shorten it"
             )
-
-        except requests.exceptions.RequestException as e:
-            error_message = f"Request failed: {str(e)}"
-            self.root.after(0, self._request_completed, error_message)
+            return
+        if compacted:
+            self.status_var.set("Sending request (older turns dropped)...")
+        elif from_docs:
+            self.status_var.set(f"Sending request with {', '.join(from_docs)}...")
+
+        # Stream on the shared worker loop; events come back through self.events
+        self.request_prompt = prompt
+        self.response_parts = []
+        self.history.prompt(model, typed)
+        self.metrics = RequestMetrics(model, "/api/generate")
+        self.request_id = get_worker().submit(
+            self.events,
+            model,
+            self.session.turn_prompt(prompt),
+            metrics=self.metrics,
+            keep_alive=get_residency().keep_alive(model),
+            **self.session.request_fields(),
+        )
+        self.root.after(FRAME_INTERVAL_MS, self._poll_events)
+
+    def _poll_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event.request_id != self.request_id:
+                continue
+            if event.kind == "chunk":
+                self._update_response_text(event.text)
+                continue
+            self._flush()
+            self.history.finish()
+            if event.kind == "done":
+                self.session.update(
+                    event.data, self.request_prompt, "".join(self.response_parts)
+                )
+                self._request_completed(
+                    f"Request completed successfully (turn {len(self.session.turns)})"
+                    + self._record_metrics()
+                )
+            else:
+                message = event.text or f"Stopped after {self.metrics.tokens} tokens"
+                self._request_completed(message + self._record_metrics())
+            return
+        self.root.after(self._flush(), self._poll_events)
+
+    def _flush(self) -> int:
+        delay = self.renderer.flush()
+        if self.renderer.drawn:
+            self.metrics.mark_render()
+        return delay
+
+    def _record_metrics(self) -> str:
+        get_metrics().record(self.metrics)
+        summary = self.metrics.summary()
+        return f" · {summary}" if summary else ""
+
+    def stop_request(self):
+        if self.searching is not None:
+            self.searching = None
+            self._request_completed("Stopped")
+            return
+        # Cancelling drops the connection, so Ollama stops generating too
+        get_worker().cancel(self.request_id)
+        self.status_var.set("Stopping...")
+
+    def new_chat(self):
+        self.session.reset()
+        self.response_view.clear()
+        self.renderer.reset()
+        self.history.new_conversation()
+        self.status_var.set("Started a new chat")
+        self._update_budget()
+
+    def show_history(self):
+        store = get_history()
+        if store is None:
+            self.status_var.set("History is turned off (CHAT_LLAMA_HISTORY=0)")
+        elif self.history_window is None or not self.history_window.winfo_exists():
+            self.history_window = HistoryWindow(self.root, store, self._show_messages)
+        else:
+            self.history_window.reload()
+            self.history_window.lift()
+
+    def _show_messages(self, messages, first):
+        if self.send_button.instate(["disabled"]):
+            self.status_var.set("Wait for the answer, or stop it, to open history")
+            return
+        if first:
+            self.response_view.clear()
+            self.renderer.reset()
+            self.status_var.set("Showing a saved conversation")
+        for _, role, model, content in messages:
+            speaker = "You" if role == "user" else model
+            self.response_view.insert(tk.END, f"{speaker}:\n{content}\n\n")
 
     def _update_response_text(self, text):
-        self.response_text.insert(tk.END, text)
-        self.response_text.see(tk.END)
+        self.history.write(text)
+        self.response_parts.append(text)
+        self.renderer.write(text)
 
     def _request_completed(self, status_message):
         self.send_button.state(["!disabled"])
+        self.stop_button.state(["disabled"])
         self.status_var.set(status_message)
+        self.budget.set("documents", "")
+        self._update_budget()
 
 
 if __name__ == "__main__":
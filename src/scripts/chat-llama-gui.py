@@ -1,19 +1,23 @@
-import enum
-import json
+import queue
+import sys
 import tkinter as tk
-from threading import Thread
+from pathlib import Path
 from tkinter import scrolledtext, ttk
 
-import requests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from chat_llama.async_client import get_worker  # noqa: E402
+from chat_llama.history import ConversationRecorder, get_history  # noqa: E402
+from chat_llama.history_window import HistoryWindow  # noqa: E402
+from chat_llama.metrics import RequestMetrics, get_metrics  # noqa: E402
+from chat_llama.render import FrameRenderer  # noqa: E402
+from chat_llama.residency import get_residency  # noqa: E402
+from chat_llama.response_view import ResponseView  # noqa: E402
+from chat_llama.session import Session  # noqa: E402
+from Models.llama_models import get_registry  # noqa: E402
 
-class Models(enum.Enum):
-    LLAMA3_2 = "llama3.2"
-    LLAMA3_1_8B = "llama3.1:8b"
-
-    @classmethod
-    def default(cls):
-        return cls.LLAMA3_2
+FRAME_INTERVAL_MS = 16
+RESIDENCY_POLL_MS = 5000
 
 
 class OllamaGUI:
@@ -36,12 +40,18 @@ class OllamaGUI:
         ttk.Label(main_frame, text="Model:").grid(
             row=0, column=0, sticky=tk.W, padx=5, pady=5
         )
-        self.model_var = tk.StringVar(value=Models.default().value)
-        model_combo = ttk.Combobox(
+        self.model_var = tk.StringVar(value=get_registry().default())
+        self.model_combo = model_combo = ttk.Combobox(
             main_frame, textvariable=self.model_var, state="readonly"
         )
-        model_combo["values"] = [model.value for model in Models]
+        model_combo["values"] = get_registry().names()
         model_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        model_combo.bind("<<ComboboxSelected>>", self.on_model_selected)
+        # Whether the selected model is loaded on the server
+        self.residency_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.residency_var).grid(
+            row=0, column=2, sticky=tk.W, padx=5, pady=5
+        )
 
         # Input text area
         ttk.Label(main_frame, text="Prompt:").grid(
@@ -52,11 +62,24 @@ class OllamaGUI:
             row=1, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5
         )
 
-        # Send button
+        # Send, Stop, New Chat and History buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=2, column=1, sticky=tk.E, padx=5, pady=5)
         self.send_button = ttk.Button(
-            main_frame, text="Send", command=self.send_request
+            button_frame, text="Send", command=self.send_request
+        )
+        self.send_button.pack(side=tk.RIGHT)
+        self.stop_button = ttk.Button(
+            button_frame, text="Stop", command=self.stop_request
+        )
+        self.stop_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.stop_button.state(["disabled"])
+        ttk.Button(button_frame, text="New Chat", command=self.new_chat).pack(
+            side=tk.RIGHT, padx=5
+        )
+        ttk.Button(button_frame, text="History", command=self.show_history).pack(
+            side=tk.RIGHT
         )
-        self.send_button.grid(row=2, column=1, sticky=tk.E, padx=5, pady=5)
 
         # Response text area
         ttk.Label(main_frame, text="Response:").grid(
@@ -76,49 +99,146 @@ class OllamaGUI:
             row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=5, pady=5
         )
 
+        # Streamed responses arrive here from the background worker
+        self.events = queue.Queue()
+        self.request_id = None
+        # Holds a bounded window of the response; the rest spills to a file
+        self.response_view = ResponseView(self.response_text)
+        # Streamed tokens are batched into one widget update per frame
+        self.renderer = FrameRenderer(self.response_view, FRAME_INTERVAL_MS)
+        # Conversation state carried between turns via Ollama's context
+        self.session = Session(self.model_var.get())
+        self.response_parts = []
+        # Prompts and streamed answers are saved in the background
+        self.history = ConversationRecorder(get_history())
+        self.history_window = None
+
+        # Load the default model now rather than on the first request
+        self.on_model_selected()
+        self._poll_residency()
+
+    def on_model_selected(self, event=None):
+        get_residency().warm_async(self.model_var.get())
+        self.residency_var.set("loading")
+
+    def _poll_residency(self):
+        residency = get_residency()
+        self.residency_var.set(residency.status(self.model_var.get()))
+        # Pick up the installed-model list once the registry has refreshed
+        self.model_combo["values"] = get_registry().names()
+        residency.refresh_async()
+        self.root.after(RESIDENCY_POLL_MS, self._poll_residency)
+
     def send_request(self):
         # Disable send button and update status
         self.send_button.state(["disabled"])
+        self.stop_button.state(["!disabled"])
         self.status_var.set("Sending request...")
-        self.response_text.delete(1.0, tk.END)
+        self.response_view.clear()
+        self.renderer.reset()
 
-        # Create and start thread for API request
-        Thread(target=self._process_request, daemon=True).start()
+        self._process_request()
 
     def _process_request(self):
-        base_url = "http://localhost:11434/api/generate"
         prompt = self.input_text.get(1.0, tk.END).strip()
         model = self.model_var.get()
-        data = {"model": model, "prompt": prompt}
-
-        try:
-            response = requests.post(base_url, json=data, stream=True)
-            response.raise_for_status()
-
-            # Process streaming response
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    chunk = json_response.get("response", "")
-                    full_response += chunk
-                    # Update response text in main thread
-                    self.root.after(0, self._update_response_text, chunk)
-
-            self.root.after(
-                0, self._request_completed, "Request completed successfully"
-            )
-
-        except requests.exceptions.RequestException as e:
-            error_message = f"Request failed: {str(e)}"
-            self.root.after(0, self._request_completed, error_message)
+
+        # Stream on the shared worker loop; events come back through self.events
+        self.session.use_model(model)
+        self.request_prompt = prompt
+        self.response_parts = []
+        self.history.prompt(model, prompt)
+        self.metrics = RequestMetrics(model, "/api/generate")
+        self.request_id = get_worker().submit(
+            self.events,
+            model,
+            self.session.turn_prompt(prompt),
+            metrics=self.metrics,
+            keep_alive=get_residency().keep_alive(model),
+            **self.session.request_fields(),
+        )
+        self.root.after(FRAME_INTERVAL_MS, self._poll_events)
+
+    def _poll_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event.request_id != self.request_id:
+                continue
+            if event.kind == "chunk":
+                self._update_response_text(event.text)
+                continue
+            self._flush()
+            self.history.finish()
+            if event.kind == "done":
+                self.session.update(
+                    event.data, self.request_prompt, "".join(self.response_parts)
+                )
+                self._request_completed(
+                    f"Request completed successfully (turn {len(self.session.turns)})"
+                    + self._record_metrics()
+                )
+            else:
+                message = event.text or f"Stopped after {self.metrics.tokens} tokens"
+                self._request_completed(message + self._record_metrics())
+            return
+        self.root.after(self._flush(), self._poll_events)
+
+    def _flush(self) -> int:
+        delay = self.renderer.flush()
+        if self.renderer.drawn:
+            self.metrics.mark_render()
+        return delay
+
+    def _record_metrics(self) -> str:
+        get_metrics().record(self.metrics)
+        summary = self.metrics.summary()
+        return f" · {summary}" if summary else ""
+
+    def stop_request(self):
+        # Cancelling drops the connection, so Ollama stops generating too
+        get_worker().cancel(self.request_id)
+        self.status_var.set("Stopping...")
+
+    def new_chat(self):
+        self.session.reset()
+        self.response_view.clear()
+        self.renderer.reset()
+        self.history.new_conversation()
+        self.status_var.set("Started a new chat")
+
+    def show_history(self):
+        store = get_history()
+        if store is None:
+            self.status_var.set("History is turned off (CHAT_LLAMA_HISTORY=0)")
+        elif self.history_window is None or not self.history_window.winfo_exists():
+            self.history_window = HistoryWindow(self.root, store, self._show_messages)
+        else:
+            self.history_window.reload()
+            self.history_window.lift()
+
+    def _show_messages(self, messages, first):
+        if self.send_button.instate(["disabled"]):
+            self.status_var.set("Wait for the answer, or stop it, to open history")
+            return
+        if first:
+            self.response_view.clear()
+            self.renderer.reset()
+            self.status_var.set("Showing a saved conversation")
+        for _, role, model, content in messages:
+            speaker = "You" if role == "user" else model
+            self.response_view.insert(tk.END, f"{speaker}:\n{content}\n\n")
 
     def _update_response_text(self, text):
-        self.response_text.insert(tk.END, text)
-        self.response_text.see(tk.END)
+        self.response_parts.append(text)
+        self.history.write(text)
+        self.renderer.write(text)
 
     def _request_completed(self, status_message):
         self.send_button.state(["!disabled"])
+        self.stop_button.state(["disabled"])
         self.status_var.set(status_message)
 
 
@@ -1,56 +1,72 @@
-import enum
-import json
 import sys
+from pathlib import Path
 
-import requests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from chat_llama import lite  # noqa: E402
+from chat_llama.cache import default_cache  # noqa: E402
+from chat_llama.config import keep_alive  # noqa: E402
+from chat_llama.metrics import RequestMetrics  # noqa: E402
+from chat_llama.streaming import TextStream  # noqa: E402
+from Models.llama_models import Models, get_registry  # noqa: E402
 
 your_prompt = """test"""
 
 
-class Models(enum.Enum):
-    LLAMA3_2 = "llama3.2"
-    LLAMA3_1_8B = "llama3.1:8b"
-    LLAMAS = (LLAMA3_2, LLAMA3_1_8B)
-
-    @classmethod
-    def default(cls):
-        return cls.LLAMA3_2.value
-
-
 def get_llama(i):
-    if i in range(0, 2):
-        return Models.LLAMAS.value[i]
+    names = Models.numbered()
+    if i in range(0, len(names)):
+        return names[i]
     else:
-        return Models.default()
+        return get_registry().default()
 
 
 def make_request(prompt, model):
     global res
-    url = "http://localhost:11434/api/generate"
-    data = {"model": model, "prompt": prompt}
-
     try:
-        response = requests.post(url, json=data, stream=True)
-        response.raise_for_status()
+        # Ollama streams responses; join them once instead of growing a string
+        metrics = RequestMetrics(model, "/api/generate")
+        chunks = lite.stream_generate(
+            model,
+            prompt,
+            cache=default_cache(),
+            metrics=metrics,
+            keep_alive=keep_alive(model),
+        )
+        return TextStream(chunks, metrics).text()
+
+    except OSError as e:
+        print(f"Request failed: {e}")
+        return None
+    except KeyboardInterrupt:
+        # The stream is already closed, so the server has stopped generating
+        print("Request cancelled.")
+        return None
 
-        # Ollama streams responses, so we need to process them accordingly
-        full_response = ""
-        for line in response.iter_lines():
-            if line:
-                json_response = json.loads(line)
-                full_response += json_response.get("response", "")
 
-        return full_response
+def repl(model):
+    from chat_llama.repl import repl
 
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
-        return None
+    repl(model)
+
+
+def batch(args):
+    from chat_llama.cli import main as cli_main
+
+    cli_main(["batch", *args])
 
 
 def main(args=None):
     prompt = None
 
+    if len(args) > 1 and args[1] == "--batch":
+        batch(args[2:])
+        return
+
+    if len(args) > 1 and args[1] == "--repl":
+        repl(get_llama(int(args[2])) if len(args) > 2 else get_registry().default())
+        return
+
     if len(args) == 2 and args[1] in ("0", "1"):
         model = get_llama(int(args[1]))
         print(f"using {model}")
@@ -67,7 +83,7 @@ def main(args=None):
             return
 
     prompt = args[1] if prompt is None else prompt
-    model = get_llama(int(args[2])) if len(args) == 3 else Models.default()
+    model = get_llama(int(args[2])) if len(args) == 3 else get_registry().default()
 
     res = make_request(prompt, model)
     if res:
@@ -1,61 +1,145 @@
-import enum
-import json
+import sys
+import time
+import uuid
+from pathlib import Path
 
 import requests
 import streamlit as st
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-class Models(enum.Enum):
-    LLAMA3_2 = "llama3.2"
-    LLAMA3_1_8B = "llama3.1:8b"
+from chat_llama.client import get_client  # noqa: E402
+from chat_llama.metrics import RequestMetrics  # noqa: E402
+from chat_llama.scheduler import QueueFullError  # noqa: E402
+from chat_llama.session import Session  # noqa: E402
+from Models.llama_models import get_registry  # noqa: E402
 
-    @classmethod
-    def default(cls):
-        return cls.LLAMA3_2
+# Seconds between visible updates while a response streams in
+STREAM_UPDATE_INTERVAL = 0.05
+
+
+@st.cache_resource
+def http_client():
+    return get_client()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def list_models():
+    return get_registry().names()
+
+
+def render_stream(chunks, metrics=None):
+    """Render streamed text with throttled updates; returns the full text
+
+    Finished paragraphs are frozen into their own element, so each update
+    only resends the paragraph still being written rather than the whole
+    response. `metrics` is marked when the first text is drawn.
+
+    If the script is interrupted mid-stream (the Stop button reruns it),
+    `chunks` is closed straight away, which aborts the request.
+    """
+    try:
+        return _render_stream(chunks, metrics)
+    finally:
+        chunks.close()
+
+
+def _render_stream(chunks, metrics):
+    parts = []
+    tail = []
+    placeholder = st.empty()
+    last_update = 0.0
+    for text in chunks:
+        parts.append(text)
+        tail.append(text)
+        now = time.monotonic()
+        if now - last_update < STREAM_UPDATE_INTERVAL:
+            continue
+        last_update = now
+        current = "".join(tail)
+        head, sep, rest = current.rpartition("\n\n")
+        # Never split inside a fenced code block
+        if sep and head.count("```") % 2 == 0:
+            placeholder.markdown(head)
+            placeholder = st.empty()
+            tail = [rest]
+            current = rest
+        placeholder.markdown(current + "▌")
+        if metrics is not None:
+            metrics.mark_render()
+    placeholder.markdown("".join(tail))
+    return "".join(parts)
+
+
+def _stopped():
+    st.session_state.stopped = True
 
 
 def send_request(model, prompt):
-    base_url = "http://localhost:11434/api/generate"
-    data = {"model": model, "prompt": prompt}
-    response_text = ""
+    session = st.session_state.session
+    session.use_model(model)
     try:
-        response = requests.post(base_url, json=data, stream=True)
-        response.raise_for_status()
-
-        # Display a spinner while processing
-        with st.spinner("Sending request..."):
-            # Placeholder for response
-            response_placeholder = st.empty()
-            # Process streaming response
-            for line in response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    chunk = json_response.get("response", "")
-                    response_text += chunk
-                    # Update the response text area
-                    response_placeholder.text_area(
-                        "Response:", value=response_text, height=300
-                    )
-        st.success("Request completed successfully")
-
-    except requests.exceptions.RequestException as e:
+        metrics = RequestMetrics(model, "/api/generate")
+        with st.chat_message("assistant"):
+            # Any widget event reruns the script, which interrupts the stream
+            stop = st.empty()
+            stop.button("Stop", on_click=_stopped)
+            # Each browser session queues as its own caller, so one user's
+            # requests cannot crowd out everyone else's
+            chunks = session.stream(
+                prompt, http_client(), metrics, caller=st.session_state.caller
+            )
+            response_text = render_stream(chunks, metrics)
+            stop.empty()
+            st.caption(metrics.summary())
+        st.session_state.history.append(
+            {"prompt": prompt, "response": response_text, "model": model}
+        )
+
+    except (requests.exceptions.RequestException, QueueFullError) as e:
         st.error(f"Request failed: {str(e)}")
 
 
 def main():
     st.title("Ollama Chat Interface")
 
+    # Per-browser-session state survives reruns, so history is never re-requested
+    if "history" not in st.session_state:
+        st.session_state.history = []
+        st.session_state.session = Session(get_registry().default())
+        st.session_state.caller = uuid.uuid4().hex
+
     # Model selection
-    model = st.selectbox("Model:", options=[model.value for model in Models], index=0)
+    models = list_models()
+    default = get_registry().default()
+    model = st.selectbox(
+        "Model:",
+        options=models,
+        index=models.index(default) if default in models else 0,
+    )
+
+    with st.sidebar:
+        if st.button("New Chat"):
+            st.session_state.history = []
+            st.session_state.session.reset()
+
+    for turn in st.session_state.history:
+        with st.chat_message("user"):
+            st.markdown(turn["prompt"])
+        with st.chat_message("assistant"):
+            st.markdown(turn["response"])
 
-    # Input text area
-    prompt = st.text_area("Prompt:", height=150)
+    if st.session_state.pop("stopped", None):
+        st.info("Response stopped; the request was cancelled.")
 
-    # Send button
-    if st.button("Send"):
+    # Input box
+    prompt = st.chat_input("Prompt:")
+    if prompt is not None:
         if prompt.strip() == "":
             st.warning("Please enter a prompt.")
         else:
+            with st.chat_message("user"):
+                st.markdown(prompt)
             send_request(model, prompt)
 
 
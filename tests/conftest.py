@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from mock_ollama import MockConfig, MockOllama  # noqa: E402
+
+# chat_llama reads its settings at import time, so they are fixed here,
+# before any test imports it: caches, logs and the model list go to a
+# scratch HOME, and the default host is a mock shared by the session
+SERVER = MockOllama(MockConfig(tokens=16)).start()
+os.environ["HOME"] = tempfile.mkdtemp(prefix="chat-llama-tests-")
+os.environ["OLLAMA_HOST"] = SERVER.url
+os.environ["CHAT_LLAMA_METRICS_LOG"] = "0"
+for name in (
+    "CHAT_LLAMA_BACKENDS",
+    "CHAT_LLAMA_CACHE",
+    "CHAT_LLAMA_SEMANTIC_CACHE",
+    "CHAT_LLAMA_OPTIONS",
+    "CHAT_LLAMA_MODEL",
+):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture
+def server() -> MockOllama:
+    """The session's default-host mock; compare its stats() before and after"""
+    return SERVER
+
+
+@pytest.fixture
+def dead_url() -> str:
+    """A host nothing listens on, so connecting fails at once"""
+    return "http://127.0.0.1:9"
+
+
+@pytest.fixture
+def pool():
+    """BackendPool over the given urls, with no background probing"""
+    from chat_llama.backends import BackendPool
+
+    return lambda *urls: BackendPool(urls, probe_interval=3600)
+
+
+@pytest.fixture
+def make_mock():
+    """Start a mock with its own MockConfig fields, closed after the test"""
+    started = []
+
+    def make(**config) -> MockOllama:
+        mock = MockOllama(MockConfig(**config)).start()
+        started.append(mock)
+        return mock
+
+    yield make
+    for mock in started:
+        mock.close()
+
+
+@pytest.fixture
+def write_jsonl():
+    """Write `count` JSONL records with ids prefix0, prefix1, ... and a text field"""
+
+    def write(path, count, field="prompt", prefix="r"):
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(count):
+                record = {"id": f"{prefix}{i}", field: f"passage number {i}"}
+                f.write(json.dumps(record) + "\n")
+
+    return write
@@ -0,0 +1,75 @@
+import asyncio
+import queue
+import threading
+
+from chat_llama.async_client import AsyncOllamaClient, StreamWorker
+from chat_llama.cache import ResponseCache, SQLiteStore
+
+
+def run_worker(client, **fields) -> list:
+    """Events the worker sends for one request, through done or error"""
+    worker = StreamWorker(client)
+    events = queue.Queue()
+    received = []
+    try:
+        worker.submit(events, "llama3.2", "hi", **fields)
+        while not received or received[-1].kind not in ("done", "error"):
+            received.append(events.get(timeout=5))
+    finally:
+        worker.shutdown()
+    return received
+
+
+def test_worker_reports_done_for_a_stream(make_mock):
+    mock = make_mock(tokens=8)
+    kinds = [event.kind for event in run_worker(AsyncOllamaClient(mock.url))]
+    assert kinds[-1] == "done" and "chunk" in kinds
+
+
+def test_worker_reports_unexpected_errors(make_mock):
+    class Broken(AsyncOllamaClient):
+        def stream_generate(self, *args, **fields):
+            async def chunks():
+                raise KeyError("boom")
+                yield
+
+            return chunks()
+
+    [event] = run_worker(Broken(make_mock().url))
+    assert event.kind == "error" and "boom" in event.text
+
+
+def test_cached_streams_keep_sqlite_off_the_event_loop(make_mock, tmp_path):
+    mock = make_mock(tokens=8)
+    threads = []
+
+    class Store(SQLiteStore):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def put(self, key, value):
+            threads.append(threading.get_ident())
+            super().put(key, value)
+
+    async def main():
+        store = Store(tmp_path / "responses.sqlite3")
+        client = AsyncOllamaClient(mock.url)
+        answers = []
+        try:
+            for _ in range(2):
+                # A fresh memory tier, so the second request reads SQLite
+                client.cache = ResponseCache(store)
+                chunks = client.stream_generate(
+                    "llama3.2", "hi", options={"temperature": 0}
+                )
+                answers.append([c async for c in chunks])
+        finally:
+            await client.close()
+            store.close()
+        return answers, threading.get_ident()
+
+    (first, second), loop_thread = asyncio.run(main())
+    assert first == second
+    assert mock.stats()["requests"] == 1
+    assert len(threads) == 3 and loop_thread not in threads
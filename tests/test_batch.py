@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from chat_llama.batch import batch_main, finished_ids, trim_partial_line
+
+
+@pytest.mark.parametrize(
+    "data, kept",
+    [
+        (b"", b""),
+        (b'{"id": 1}\n', b'{"id": 1}\n'),
+        (b'{"id": 1}\n{"id": 2, "resp', b'{"id": 1}\n'),
+        (b'{"id": 1', b""),
+        (b'{"id": 1}\n' + b"x" * 200_000, b'{"id": 1}\n'),
+    ],
+)
+def test_trim_partial_line(tmp_path, data, kept):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(data)
+    trim_partial_line(str(path))
+    assert path.read_bytes() == kept
+
+
+def test_finished_ids_skips_errors_and_partial_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(
+        '{"id": "a", "response": "x"}\n'
+        '{"id": "b", "error": "boom"}\n'
+        '{"id": "c", "resp'
+    )
+    assert finished_ids(str(path)) == {"a"}
+    assert finished_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_batch_writes_one_result_per_record(tmp_path, server, write_jsonl):
+    prompts, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(prompts, 5)
+    stats = batch_main(str(prompts), str(out), "llama3.2", concurrency=3)
+    results = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(r["id"] for r in results) == [f"r{i}" for i in range(5)]
+    assert all(r["response"] and "error" not in r for r in results)
+    assert stats.completed == 5
+
+
+def test_resume_after_a_killed_run(tmp_path, server, write_jsonl):
+    prompts, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(prompts, 6)
+    # Two finished results, then the fragment a kill mid-write leaves
+    out.write_text(
+        '{"id": "r0", "response": "x"}\n'
+        '{"id": "r1", "response": "y"}\n'
+        '{"id": "r2", "model": "llama3.2", "resp'
+    )
+    before = server.stats()["requests"]
+    stats = batch_main(str(prompts), str(out), "llama3.2", concurrency=2, resume=True)
+    lines = out.read_text().splitlines()
+    results = [json.loads(line) for line in lines]  # every line is valid JSON
+    assert sorted(r["id"] for r in results) == [f"r{i}" for i in range(6)]
+    assert stats.skipped == 2 and stats.completed == 4
+    assert server.stats()["requests"] - before == 4
+    # Nothing is left to do on another resume
+    stats = batch_main(str(prompts), str(out), "llama3.2", resume=True)
+    assert stats.skipped == 6 and stats.completed == 0
+
+
+def test_malformed_lines_become_error_results(tmp_path, server):
+    prompts, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    prompts.write_text(
+        '{"id": "a", "prompt": "hi"}\n'
+        '{"id": "b", "prompt": \n'
+        "\n"
+        "[1, 2]\n"
+        '{"id": "c", "prompt": "hello"}\n'
+    )
+    stats = batch_main(str(prompts), str(out), "llama3.2")
+    results = {r["id"]: r for r in map(json.loads, out.read_text().splitlines())}
+    assert sorted(results) == ["1", "3", "a", "c"]
+    assert results["1"]["error"].startswith("line 2: invalid JSON")
+    assert results["3"]["error"] == "line 4: not a JSON object"
+    assert "error" not in results["a"] and "error" not in results["c"]
+    assert (stats.completed, stats.failed) == (2, 2)
@@ -0,0 +1,36 @@
+import pytest
+
+from chat_llama import cli, client, config, lite
+
+
+@pytest.fixture
+def one_shot(monkeypatch):
+    """Which transport `chat-llama ask` used; the pooled client is reset"""
+    used = []
+    stream_generate = lite.stream_generate
+
+    def recording(*args, **kwargs):
+        used.append("lite")
+        return stream_generate(*args, **kwargs)
+
+    monkeypatch.setattr(lite, "stream_generate", recording)
+    monkeypatch.setattr(client, "_client", None)
+    return used
+
+
+def test_ask_on_one_host_uses_the_stdlib_transport(one_shot, capsys):
+    assert cli.main(["ask", "-m", "llama3.2", "hi"]) == 0
+    assert one_shot == ["lite"]
+    assert capsys.readouterr().out.strip()
+
+
+def test_ask_is_routed_across_several_backends(
+    one_shot, make_mock, pool, dead_url, monkeypatch, capsys
+):
+    mock = make_mock(tokens=8)
+    monkeypatch.setattr(config, "BACKENDS", [dead_url, mock.url])
+    client.set_client(client.OllamaClient(backends=pool(dead_url, mock.url)))
+    assert cli.main(["ask", "-m", "llama3.2", "hi"]) == 0
+    assert one_shot == []
+    assert mock.stats()["completed"] == 1
+    assert capsys.readouterr().out.strip()
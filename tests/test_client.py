@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+import requests
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama import lite
+from chat_llama.client import OllamaClient
+from chat_llama.config import normalize_url
+from chat_llama.residency import ResidencyManager
+
+
+def text(chunks) -> str:
+    return "".join(c.get("response", "") for c in chunks)
+
+
+def test_streams_reuse_one_pooled_connection(server):
+    client = OllamaClient(server.url)
+    for _ in range(3):
+        assert text(client.stream_generate("llama3.2", "hi"))
+    stats = client.connection_stats()
+    assert stats["requests"] == 3
+    assert stats["connects"] == 1 and stats["reused"] == 2
+    client.close()
+
+
+@pytest.mark.parametrize(
+    "host, url",
+    [
+        ("127.0.0.1:11434", "http://127.0.0.1:11434"),
+        ("localhost", "http://localhost:11434"),
+        ("[::1]", "http://[::1]:11434"),
+        ("http://ollama.lan:8080/", "http://ollama.lan:8080"),
+        ("https://ollama.example.com", "https://ollama.example.com"),
+    ],
+)
+def test_normalize_url(host, url):
+    assert normalize_url(host) == url
+
+
+def test_hosts_without_a_scheme_work_everywhere(server):
+    host = server.url.split("://", 1)[1]
+    assert text(OllamaClient(host).stream_generate("llama3.2", "hi"))
+    body = {"model": "llama3.2", "prompt": "hi"}
+    assert text(lite.stream("/api/generate", body, base_url=host))
+
+
+def test_stream_fails_over_to_the_next_backend(make_mock, pool, dead_url):
+    mock = make_mock(tokens=8)
+    backends = pool(dead_url, mock.url)
+    client = OllamaClient(backends=backends)
+    assert text(client.stream_generate("llama3.2", "hi"))
+    assert not backends.backends[0].healthy
+    assert mock.stats()["completed"] == 1
+
+
+def test_async_stream_fails_over_to_the_next_backend(make_mock, pool, dead_url):
+    mock = make_mock(tokens=8)
+    backends = pool(dead_url, mock.url)
+
+    async def main():
+        client = AsyncOllamaClient(backends=backends)
+        try:
+            return [c async for c in client.stream_generate("llama3.2", "hi")]
+        finally:
+            await client.close()
+
+    assert text(asyncio.run(main()))
+    assert mock.stats()["completed"] == 1
+
+
+def test_a_stream_cut_midway_is_not_retried(make_mock, pool):
+    broken = make_mock(tokens=64, drop_rate=1.0)
+    spare = make_mock(tokens=64)
+    client = OllamaClient(backends=pool(broken.url, spare.url))
+    with pytest.raises(requests.exceptions.RequestException):
+        list(client.stream_generate("llama3.2", "hi"))
+    assert spare.stats()["requests"] == 0
+
+
+def test_warm_loads_the_model_where_it_will_be_routed(make_mock, pool, dead_url):
+    mock = make_mock()
+    backends = pool(dead_url, mock.url)
+    residency = ResidencyManager(OllamaClient(backends=backends))
+    assert residency.warm("llama3.2")
+    assert mock.stats()["loaded"] == ["llama3.2:latest"]
+    assert residency.is_hot("llama3.2")
+    assert backends.choose("llama3.2") is backends.backends[1]
@@ -0,0 +1,160 @@
+import hashlib
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+from chat_llama import documents  # noqa: E402
+from chat_llama.documents import DocumentIndex, chunk_text, with_passages  # noqa: E402
+
+
+def vector(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.md5(text.encode()).digest()[:4], "little")
+    v = np.random.default_rng(seed).standard_normal(32).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class FakeEmbedder:
+    """Stands in for OllamaClient.embed: a fixed random vector per text"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail_on = None
+
+    def embed(self, model, texts):
+        self.calls += 1
+        if self.fail_on is not None and any(self.fail_on in t for t in texts):
+            raise ConnectionError("embedding server went away")
+        return [vector(t) for t in texts]
+
+
+def write_files(root, count, prefix="note"):
+    root.mkdir(exist_ok=True)
+    for i in range(count):
+        (root / f"{prefix}{i}.txt").write_text(f"{prefix} {i} says something")
+
+
+@pytest.fixture
+def open_index(tmp_path):
+    """DocumentIndex over tmp_path/docs with `count` files; closed afterwards"""
+    opened = []
+
+    def open_(count=0, embedder=None, **options) -> DocumentIndex:
+        if count:
+            write_files(tmp_path / "docs", count)
+        index = DocumentIndex(
+            tmp_path / "docs", tmp_path / "index", embedder or FakeEmbedder(), **options
+        )
+        opened.append(index)
+        return index
+
+    yield open_
+    for index in opened:
+        index.close()
+
+
+@pytest.fixture
+def index(open_index):
+    return open_index(20)
+
+
+def test_chunk_text_packs_paragraphs():
+    text = "\n\n".join(["a" * 40] * 10)
+    chunks = chunk_text(text, size=100)
+    assert all(len(c) <= 100 for c in chunks)
+    assert "".join(chunks).replace("\n", "") == "a" * 400
+
+
+def test_search_finds_the_file(index):
+    assert index.update()["changed"] == 20
+    [best] = index.search("note 7 says something", k=1)
+    assert best.path == "note7.txt" and best.score == pytest.approx(1.0)
+    assert with_passages("why?", [best]).endswith("why?")
+
+
+def test_updates_are_incremental(index, tmp_path):
+    index.update()
+    calls = index.client.calls
+    assert index.update() == {"changed": 0, "removed": 0, "chunks": 0}
+    assert index.client.calls == calls
+
+    (tmp_path / "docs" / "note3.txt").write_text("entirely new words")
+    (tmp_path / "docs" / "note4.txt").unlink()
+    assert index.update() == {"changed": 1, "removed": 1, "chunks": 1}
+    assert index.search("entirely new words", k=1)[0].path == "note3.txt"
+    paths = {p.path for p in index.search("note 4 says something", k=20, min_score=0)}
+    assert "note4.txt" not in paths
+
+
+def test_a_failed_embedding_leaves_the_file_for_the_next_update(index, tmp_path):
+    index.update()
+    (tmp_path / "docs" / "note4.txt").write_text("words the server chokes on")
+    (tmp_path / "docs" / "extra.txt").write_text("a brand new file")
+    index.client.fail_on = "chokes"
+    with pytest.raises(ConnectionError):
+        index.update()
+    # The file keeps its old passage until it can be re-embedded
+    assert index.search("note 4 says something", k=1)[0].path == "note4.txt"
+
+    index.client.fail_on = None
+    index.update()
+    assert index.search("words the server chokes on", k=1)[0].path == "note4.txt"
+    assert index.search("a brand new file", k=1)[0].path == "extra.txt"
+    paths = [p.path for p in index.search("note 4 says something", k=20, min_score=0)]
+    assert paths.count("note4.txt") <= 1
+    assert index.update()["changed"] == 0
+
+
+def test_reopened_index_searches_without_reembedding(index, open_index):
+    index.update()
+    index.close()
+    reopened = open_index()
+    assert reopened.update()["changed"] == 0
+    assert reopened.search("note 5 says something", k=1)[0].path == "note5.txt"
+
+
+def test_another_embed_model_reindexes(index, open_index):
+    index.update()
+    index.close()
+    assert open_index(embed_model="other").update()["changed"] == 20
+
+
+def test_clustered_search_finds_each_file(open_index, monkeypatch):
+    monkeypatch.setattr(documents, "IVF_MIN_CHUNKS", 64)
+    index = open_index(300)
+    index.update()
+    assert index.centroids is not None
+    for i in range(0, 300, 15):
+        [best] = index.search(f"note {i} says something", k=1)
+        assert best.path == f"note{i}.txt"
+
+
+def test_concurrent_searches_pair_scores_with_their_text(open_index, tmp_path):
+    docs = tmp_path / "docs"
+    index = open_index(40)
+    index.update()
+    queries = [f"note {i} says something" for i in range(40)]
+    mismatches = []
+    stop = threading.Event()
+
+    def search_forever():
+        while not stop.is_set():
+            for query in queries[::7]:
+                q = vector(query)
+                for passage in index.search(query, k=4, min_score=-1):
+                    expected = float(vector(passage.text) @ q)
+                    if abs(expected - passage.score) > 1e-4:
+                        mismatches.append(passage)
+
+    searcher = threading.Thread(target=search_forever)
+    searcher.start()
+    try:
+        # Rewrite files so their rows are freed and refilled over and over
+        for round in range(15):
+            for i in range(0, 40, 3):
+                (docs / f"note{i}.txt").write_text(f"round {round} text {i}")
+            index.update()
+    finally:
+        stop.set()
+        searcher.join()
+    assert not mismatches
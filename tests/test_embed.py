@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from chat_llama import cli, embed
+from chat_llama.embed import Progress, embed_main
+
+np = pytest.importorskip("numpy")
+
+
+class Killed(Exception):
+    pass
+
+
+@pytest.fixture
+def write_corpus(write_jsonl):
+    return lambda path, count: write_jsonl(path, count, field="text", prefix="doc")
+
+
+def test_embeds_every_record_in_order(tmp_path, server, write_corpus):
+    corpus, out = tmp_path / "corpus.jsonl", tmp_path / "vectors.npy"
+    write_corpus(corpus, 50)
+    stats = embed_main(str(corpus), str(out), "nomic-embed-text", batch_size=8)
+    vectors = np.load(out, mmap_mode="r")
+    assert vectors.shape[0] == 50 and stats.vectors == 50
+    ids = [json.loads(line) for line in open(tmp_path / "vectors.ids.jsonl")]
+    assert ids == [f"doc{i}" for i in range(50)]
+    assert not os.path.exists(f"{out}.progress")
+
+
+def test_resumed_run_matches_an_uninterrupted_one(
+    tmp_path, server, write_corpus, monkeypatch
+):
+    corpus = tmp_path / "corpus.jsonl"
+    write_corpus(corpus, 70)
+    whole, resumed = tmp_path / "whole.npy", tmp_path / "resumed.npy"
+    embed_main(str(corpus), str(whole), "nomic-embed-text", batch_size=8)
+
+    read_texts = embed.read_texts
+
+    def dies_midway(lines, field="text"):
+        for i, record in enumerate(read_texts(lines, field)):
+            if i == 45:
+                raise Killed()
+            yield record
+
+    monkeypatch.setattr(embed, "read_texts", dies_midway)
+    with pytest.raises(Killed):
+        # One batch at a time: reading batch k waits for batch k - 1, so
+        # batches 0-3 are done when record 45 kills the run
+        embed_main(
+            str(corpus), str(resumed), "nomic-embed-text", batch_size=8, concurrency=1
+        )
+    progress = open(f"{resumed}.progress").read().splitlines()
+    assert {"0", "1", "2", "3"} <= set(progress[1:])
+
+    monkeypatch.setattr(embed, "read_texts", read_texts)
+    stats = embed_main(
+        str(corpus), str(resumed), "nomic-embed-text", batch_size=8, resume=True
+    )
+    assert stats.skipped >= 32
+    assert stats.skipped + stats.vectors == 70
+    assert resumed.read_bytes() == whole.read_bytes()
+    assert not os.path.exists(f"{resumed}.progress")
+
+
+def test_resume_refuses_other_settings(tmp_path):
+    path = str(tmp_path / "vectors.npy.progress")
+    Progress(path, {"model": "a", "batch_size": 8}).close(complete=False)
+    with pytest.raises(ValueError):
+        Progress(path, {"model": "a", "batch_size": 16}, resume=True)
+
+
+def test_empty_input_is_refused_without_leaving_files(tmp_path):
+    corpus, out = tmp_path / "corpus.jsonl", tmp_path / "vectors.npy"
+    corpus.write_text("\n\n")
+    with pytest.raises(ValueError, match="no records"):
+        embed_main(str(corpus), str(out))
+    assert sorted(os.listdir(tmp_path)) == ["corpus.jsonl"]
+
+
+@pytest.mark.parametrize("content", ["", None])
+def test_cli_reports_failures_in_one_line(tmp_path, capsys, content):
+    corpus = tmp_path / "corpus.txt"
+    if content is not None:
+        corpus.write_text(content)
+    out = str(tmp_path / "vectors.npy")
+    assert cli.main(["embed", str(corpus), "-o", out]) == 1
+    error = capsys.readouterr().err.strip().splitlines()
+    assert len(error) == 1 and error[0].startswith("chat-llama: embed failed: ")
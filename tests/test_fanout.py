@@ -0,0 +1,87 @@
+import asyncio
+import itertools
+import queue
+
+from chat_llama import fanout
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.cache import ResponseCache
+from chat_llama.fanout import FanOut, fan_out
+
+
+class SlowModelClient(AsyncOllamaClient):
+    """Streams "slow" forever and records how each stream was asked for"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = []
+        self.caches = []
+
+    def stream_generate(self, model, prompt, metrics=None, cache=True, **fields):
+        self.caches.append(cache)
+        if model != "slow":
+            return super().stream_generate(
+                model, prompt, metrics, cache=cache, **fields
+            )
+
+        async def hang():
+            try:
+                await asyncio.sleep(60)
+                yield {}
+            finally:
+                self.events.append("slow stopped")
+
+        return hang()
+
+
+def test_closing_fan_out_stops_the_streams_first(make_mock):
+    mock = make_mock(tokens=8)
+
+    async def main():
+        client = SlowModelClient(mock.url)
+        try:
+            results = fan_out(["llama3.2", "slow"], "hi", client=client)
+            first = await results.__anext__()
+            await results.aclose()
+            return first, list(client.events)
+        finally:
+            await client.close()
+
+    first, events = asyncio.run(main())
+    assert (first["model"], first["outcome"]) == ("llama3.2", "ok")
+    assert events == ["slow stopped"]
+
+
+def test_fan_out_skips_the_response_cache(make_mock):
+    mock = make_mock(tokens=8)
+    models = ["llama3.2", "llama3.1:8b"]
+
+    async def main():
+        client = SlowModelClient(mock.url, cache=ResponseCache())
+        try:
+            for _ in range(2):
+                async for _ in fan_out(
+                    models, "hi", client=client, options={"temperature": 0}
+                ):
+                    pass
+            return client.caches
+        finally:
+            await client.close()
+
+    assert asyncio.run(main()) == [False] * 4
+    assert mock.stats()["requests"] == 4
+
+
+def test_compare_panes_skip_the_response_cache(monkeypatch):
+    class Worker:
+        def __init__(self):
+            self.ids = itertools.count(1)
+            self.fields = []
+
+        def submit(self, out, model, prompt, metrics=None, **fields):
+            self.fields.append(fields)
+            return next(self.ids)
+
+    worker = Worker()
+    monkeypatch.setattr(fanout, "get_worker", lambda: worker)
+    FanOut(queue.Queue(), ["llama3.2", "llama3.1:8b"], "hi")
+    assert [fields["cache"] for fields in worker.fields] == [False, False]
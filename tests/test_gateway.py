@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.gateway import Gateway, build_app
+
+
+def run(mock, scenario):
+    """Serve a Gateway for `mock` and run `scenario(gateway, session)`"""
+
+    async def main():
+        gateway = Gateway(AsyncOllamaClient(mock.url))
+        runner = web.AppRunner(build_app(gateway))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession(f"http://127.0.0.1:{port}") as session:
+                return await scenario(gateway, session)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def chat_body(content="why is the sky blue?", **fields) -> dict:
+    return {
+        "model": "llama3.2",
+        "messages": [{"role": "user", "content": content}],
+        "stream": True,
+        **fields,
+    }
+
+
+async def read_stream(response) -> tuple:
+    """(text, finish_reason, error) from a server-sent event stream"""
+    parts, finish, error = [], None, None
+    async for line in response.content:
+        if not line.startswith(b"data: "):
+            continue
+        data = line[6:].strip()
+        if data == b"[DONE]":
+            break
+        event = json.loads(data)
+        if "error" in event:
+            error = event["error"]
+            break
+        for choice in event["choices"]:
+            parts.append(choice["delta"].get("content", ""))
+            finish = choice["finish_reason"] or finish
+    return "".join(parts), finish, error
+
+
+async def chat(session, body, headers=None) -> tuple:
+    async with session.post("/v1/chat/completions", json=body, headers=headers) as r:
+        if r.status != 200:
+            return r.status, await r.json()
+        return r.status, await read_stream(r)
+
+
+async def wait_for(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+def test_identical_deterministic_requests_share_one_generation(make_mock):
+    mock = make_mock(tokens=40, token_rate=400)
+
+    async def scenario(gateway, session):
+        body = chat_body(temperature=0)
+        return await asyncio.gather(*(chat(session, body) for _ in range(8)))
+
+    results = run(mock, scenario)
+    texts = {text for status, (text, finish, error) in results}
+    assert all(status == 200 for status, _ in results)
+    assert len(texts) == 1 and texts.pop()
+    assert mock.stats()["requests"] == 1
+
+
+def test_coalescing_counters(make_mock):
+    mock = make_mock(tokens=40, token_rate=400)
+
+    async def scenario(gateway, session):
+        body = chat_body(seed=7)
+        await asyncio.gather(*(chat(session, body) for _ in range(5)))
+        async with session.get("/gateway/stats") as r:
+            return await r.json()
+
+    stats = run(mock, scenario)
+    assert stats == {"requests": 5, "coalesced": 4, "in_flight": 0}
+
+
+def test_sampled_requests_are_not_coalesced(make_mock):
+    mock = make_mock(tokens=20, token_rate=400)
+
+    async def scenario(gateway, session):
+        return await asyncio.gather(*(chat(session, chat_body()) for _ in range(4)))
+
+    run(mock, scenario)
+    assert mock.stats()["requests"] == 4
+
+
+def test_no_cache_header_skips_coalescing(make_mock):
+    mock = make_mock(tokens=20, token_rate=400)
+
+    async def scenario(gateway, session):
+        body = chat_body(temperature=0)
+        headers = {"Cache-Control": "no-cache"}
+        await asyncio.gather(*(chat(session, body, headers) for _ in range(3)))
+        return gateway.coalesced
+
+    assert run(mock, scenario) == 0
+    assert mock.stats()["requests"] == 3
+
+
+def test_upstream_is_cancelled_when_every_follower_leaves(make_mock):
+    mock = make_mock(tokens=400, token_rate=100)
+
+    async def scenario(gateway, session):
+        async def leave_early():
+            r = await session.post("/v1/chat/completions", json=chat_body(seed=1))
+            await r.content.readline()
+            r.close()
+
+        await asyncio.gather(leave_early(), leave_early())
+        aborted = await wait_for(lambda: mock.stats()["aborted"] == 1)
+        return aborted, gateway.coalesced, len(gateway.flights)
+
+    assert run(mock, scenario) == (True, 1, 0)
+
+
+def test_a_leaving_follower_keeps_the_stream_for_the_rest(make_mock):
+    mock = make_mock(tokens=60, token_rate=300)
+
+    async def scenario(gateway, session):
+        body = chat_body(seed=2)
+
+        async def leave_early():
+            r = await session.post("/v1/chat/completions", json=body)
+            await r.content.readline()
+            r.close()
+
+        _, (status, result) = await asyncio.gather(leave_early(), chat(session, body))
+        return status, result
+
+    status, (text, finish, error) = run(mock, scenario)
+    assert status == 200 and finish == "stop" and error is None
+    assert mock.stats()["completed"] == 1
+    assert mock.stats()["aborted"] == 0
+
+
+def test_upstream_errors_reach_every_follower(make_mock):
+    mock = make_mock(error_rate=1.0)
+
+    async def scenario(gateway, session):
+        body = chat_body(temperature=0)
+        return await asyncio.gather(*(chat(session, body) for _ in range(3)))
+
+    results = run(mock, scenario)
+    assert [status for status, _ in results] == [502, 502, 502]
+    assert all(body["error"]["type"] == "server_error" for _, body in results)
+
+
+def test_completion_without_streaming(make_mock):
+    mock = make_mock(tokens=16)
+
+    async def scenario(gateway, session):
+        body = {"model": "llama3.2", "prompt": "hi", "max_tokens": 5}
+        async with session.post("/v1/completions", json=body) as r:
+            return r.status, await r.json()
+
+    status, body = run(mock, scenario)
+    assert status == 200
+    assert body["object"] == "text_completion"
+    assert body["choices"][0]["text"]
+    assert body["usage"]["completion_tokens"] == 5
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"messages": [{"role": "user", "content": "hi"}]},
+        {"model": "llama3.2", "messages": []},
+        {"model": "llama3.2", "messages": ["hi"]},
+        {"model": "llama3.2", "messages": [{"role": "user", "content": ["x"]}]},
+        {"model": "llama3.2", "messages": [{"role": "user", "content": 5}]},
+        {"model": "llama3.2", "messages": [{"content": "hi"}], "n": 2},
+    ],
+)
+def test_malformed_requests_are_rejected(make_mock, body):
+    mock = make_mock()
+
+    async def scenario(gateway, session):
+        async with session.post("/v1/chat/completions", json=body) as r:
+            return r.status, await r.json()
+
+    status, reply = run(mock, scenario)
+    assert status == 400
+    assert reply["error"]["type"] == "invalid_request_error"
+    assert mock.stats()["requests"] == 0
@@ -0,0 +1,60 @@
+import threading
+
+from chat_llama.cli import resolve_model
+from chat_llama.client import OllamaClient
+from Models.llama_models import ModelRegistry, Models
+
+
+def refresh_threads() -> list:
+    return [t for t in threading.enumerate() if t.name == "chat-llama-models"]
+
+
+def test_refresh_runs_on_a_daemon_thread(server, tmp_path):
+    registry = ModelRegistry(OllamaClient(server.url), path=tmp_path / "models.json")
+    future = registry.refresh_async()
+    assert all(t.daemon for t in refresh_threads())
+    future.result(timeout=10)
+    assert registry.names(refresh=False) == ["llama3.2:latest", "llama3.1:8b"]
+    assert (tmp_path / "models.json").exists()
+
+
+def test_cold_registry_without_refresh_stays_offline(dead_url, tmp_path):
+    registry = ModelRegistry(OllamaClient(dead_url), path=tmp_path / "models.json")
+    assert registry.default(refresh=False) == Models.default().value
+    assert registry._refreshing is None
+
+
+def test_ask_resolves_the_default_without_a_refresh(monkeypatch):
+    import Models.llama_models as llama_models
+
+    started = []
+    monkeypatch.setattr(
+        llama_models.ModelRegistry, "refresh_async", lambda self: started.append(1)
+    )
+    monkeypatch.setattr(llama_models, "_registry", None)
+    assert resolve_model(None, refresh=False)
+    assert resolve_model("1", refresh=False)
+    assert not started
+    assert resolve_model("mistral", refresh=False) == "mistral"
+
+
+def test_registry_lists_models_from_every_backend(make_mock, pool, dead_url, tmp_path):
+    first = make_mock(models=["llama3.2:latest"])
+    second = make_mock(models=["llama3.2:latest", "qwen2.5:7b"])
+    client = OllamaClient(backends=pool(dead_url, first.url, second.url))
+    registry = ModelRegistry(client, path=tmp_path / "models.json")
+    assert [m.name for m in registry.refresh()] == ["llama3.2:latest", "qwen2.5:7b"]
+
+
+def test_model_indices_do_not_follow_the_server(make_mock, tmp_path, monkeypatch):
+    import Models.llama_models as llama_models
+
+    mock = make_mock(
+        models=["nomic-embed-text:latest", "qwen2.5:7b", "llama3.2:latest"]
+    )
+    registry = ModelRegistry(OllamaClient(mock.url), path=tmp_path / "models.json")
+    registry.refresh()
+    monkeypatch.setattr(llama_models, "_registry", registry)
+    assert [resolve_model(str(i)) for i in range(4)] == Models.numbered()
+    assert Models.numbered()[:2] == ["llama3.2", "llama3.1:8b"]
+    assert resolve_model("9") == "llama3.2:latest"
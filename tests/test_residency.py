@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from chat_llama.client import OllamaClient
+from chat_llama.config import keep_alive, keep_alive_value
+from chat_llama.residency import ResidencyManager
+
+
+@pytest.mark.parametrize(
+    "value, sent", [("-1", -1), ("300", 300), (-1, -1), ("30m", "30m"), ("2h", "2h")]
+)
+def test_unitless_keep_alive_is_sent_as_seconds(value, sent):
+    assert keep_alive_value(value) == sent
+
+
+def test_default_policies_are_valid_keep_alives():
+    assert keep_alive("llama3.1:405b") == -1
+    assert keep_alive("llama3.1:70b") == "2h"
+
+
+def test_warm_sends_the_policy_ollama_accepts(make_mock, monkeypatch):
+    mock = make_mock(models=["llama3.1:405b"])
+    client = OllamaClient(mock.url)
+    sent = []
+    post = client.session.post
+
+    def recording_post(url, json=None, **kwargs):
+        sent.append(json)
+        return post(url, json=json, **kwargs)
+
+    monkeypatch.setattr(client.session, "post", recording_post)
+    residency = ResidencyManager(client, policies={"llama3.2": "600"})
+    assert residency.warm("llama3.1:405b")
+    assert residency.warm("llama3.2")
+    assert [body["keep_alive"] for body in sent] == [-1, 600]
+    assert mock.stats()["loaded"] == ["llama3.1:405b", "llama3.2:latest"]
+
+
+def test_mock_rejects_a_unitless_keep_alive_string(server):
+    client = OllamaClient(server.url)
+    response = client.session.post(
+        client.url("/api/generate"),
+        data=json.dumps({"model": "llama3.2", "keep_alive": "-1"}),
+    )
+    assert response.status_code == 400
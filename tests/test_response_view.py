@@ -0,0 +1,29 @@
+import pytest
+
+tk = pytest.importorskip("tkinter")
+from chat_llama.response_view import ResponseView  # noqa: E402
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    yield root
+    root.destroy()
+
+
+def test_widget_is_read_only_between_the_views_own_edits(root):
+    widget = tk.Text(root)
+    view = ResponseView(widget, max_lines=50)
+    for i in range(400):
+        view.insert(tk.END, f"line {i}\n")
+    assert widget.cget("state") == "disabled"
+    widget.insert("1.0", "typed ")  # ignored, as a keypress would be
+    view.show(10)
+    assert widget.cget("state") == "disabled"
+    assert widget.get("1.0", "1.end") == view.read(view.first, view.first + 1)[:-1]
+    view.clear()
+    assert widget.get("1.0", "end-1c") == "" and widget.cget("state") == "disabled"
+    view.close()
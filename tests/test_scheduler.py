@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import pytest
+
+from chat_llama.metrics import RequestMetrics
+from chat_llama.scheduler import BATCH, INTERACTIVE, QueueFullError, Scheduler
+
+
+def test_admits_up_to_the_limit_then_queues():
+    scheduler = Scheduler(max_in_flight=2, max_queue=4)
+    with scheduler.slot(), scheduler.slot():
+        assert scheduler.stats()["in_flight"] == 2
+        granted = threading.Event()
+
+        def third():
+            with scheduler.slot():
+                granted.set()
+
+        thread = threading.Thread(target=third)
+        thread.start()
+        assert not granted.wait(0.1)
+        assert scheduler.queued == 1
+    thread.join(2)
+    assert granted.is_set()
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.admitted == 3
+
+
+def test_full_queue_fails_fast():
+    scheduler = Scheduler(max_in_flight=1, max_queue=0)
+    metrics = RequestMetrics("llama3.2", "/api/generate")
+    with scheduler.slot():
+        with pytest.raises(QueueFullError):
+            with scheduler.slot(metrics=metrics):
+                pass
+    assert scheduler.rejected == 1
+    assert metrics.to_dict()["outcome"] == "rejected"
+
+
+def test_interactive_first_then_round_robin_across_callers():
+    scheduler = Scheduler(max_in_flight=1, max_queue=16)
+    order = []
+
+    async def request(priority, caller, name):
+        async with scheduler.aslot(priority, caller):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def main():
+        holder = scheduler.aslot(INTERACTIVE, "holder")
+        await holder.__aenter__()
+        tasks = []
+        for priority, caller, name in [
+            (BATCH, "a", "a1"),
+            (BATCH, "a", "a2"),
+            (BATCH, "b", "b1"),
+            (INTERACTIVE, "c", "c1"),
+        ]:
+            tasks.append(asyncio.create_task(request(priority, caller, name)))
+            await asyncio.sleep(0)
+        await holder.__aexit__(None, None, None)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["c1", "a1", "b1", "a2"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = Scheduler(max_in_flight=1, max_queue=4)
+
+    async def main():
+        async with scheduler.aslot():
+            waiter = asyncio.create_task(scheduler.aslot().__aenter__())
+            await asyncio.sleep(0.01)
+            assert scheduler.queued == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.queued == 0
+        # The cancelled ticket must not hold on to the freed slot
+        async with scheduler.aslot():
+            pass
+
+    asyncio.run(main())
+    assert scheduler.stats()["in_flight"] == 0
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from chat_llama.async_client import AsyncOllamaClient
+from chat_llama.client import OllamaClient
+from chat_llama.metrics import RequestMetrics
+from chat_llama.session import Session
+
+np = pytest.importorskip("numpy")
+from chat_llama.semantic_cache import SemanticCache  # noqa: E402
+
+QUESTION = "how do I reverse a python list"
+REPHRASED = "how do I reverse a python list please"
+DETERMINISTIC = {"options": {"temperature": 0}}
+
+
+def unit(*values) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def answer(client, prompt, model="llama3.2", **fields) -> tuple:
+    metrics = RequestMetrics(model, "/api/generate")
+    chunks = list(client.stream_generate(model, prompt, metrics=metrics, **fields))
+    return "".join(c.get("response", "") for c in chunks), metrics.cache
+
+
+@pytest.fixture
+def client(make_mock):
+    mock = make_mock(tokens=8)
+    client = OllamaClient(mock.url, semantic_cache=SemanticCache(threshold=0.8))
+    client.mock = mock
+    return client
+
+
+def test_rephrased_prompt_replays_the_answer(client):
+    first, first_cache = answer(client, QUESTION, **DETERMINISTIC)
+    again, again_cache = answer(client, REPHRASED, **DETERMINISTIC)
+    assert (first_cache, again_cache) == ("miss", "hit")
+    assert again == first
+    assert client.mock.stats()["requests"] == 1
+
+
+def test_other_model_or_system_prompt_misses(client):
+    answer(client, QUESTION, **DETERMINISTIC)
+    assert answer(client, REPHRASED, model="llama3.1:8b", **DETERMINISTIC)[1] == "miss"
+    assert answer(client, REPHRASED, system="be terse", **DETERMINISTIC)[1] == "miss"
+
+
+def test_conversation_context_bypasses(client):
+    answer(client, QUESTION, **DETERMINISTIC)
+    _, cache = answer(client, REPHRASED, context=[1, 2, 3], **DETERMINISTIC)
+    assert cache == "bypass"
+
+
+def test_replay_has_no_context_and_the_session_keeps_the_turn(client):
+    first = Session("llama3.2")
+    list(first.stream(QUESTION, client=client, **DETERMINISTIC))
+    assert first.context
+
+    second = Session("llama3.2")
+    list(second.stream(REPHRASED, client=client, **DETERMINISTIC))
+    assert second.last_metrics.cache == "hit"
+    assert second.context is None
+    assert REPHRASED in second.turn_prompt("and sort it?")
+
+
+def test_embeddings_are_routed_past_a_dead_primary(make_mock, pool, dead_url):
+    mock = make_mock(tokens=8)
+    client = OllamaClient(
+        backends=pool(dead_url, mock.url), semantic_cache=SemanticCache(threshold=0.8)
+    )
+    assert answer(client, QUESTION, **DETERMINISTIC)[1] == "miss"
+    assert answer(client, REPHRASED, **DETERMINISTIC)[1] == "hit"
+    assert mock.stats()["embeds"] == 2
+
+
+def test_async_embeddings_are_routed_past_a_dead_primary(make_mock, pool, dead_url):
+    mock = make_mock(tokens=8)
+
+    async def main():
+        client = AsyncOllamaClient(
+            backends=pool(dead_url, mock.url),
+            semantic_cache=SemanticCache(threshold=0.8),
+        )
+        caches = []
+        try:
+            for prompt in (QUESTION, REPHRASED):
+                metrics = RequestMetrics("llama3.2", "/api/generate")
+                chunks = client.stream_generate(
+                    "llama3.2", prompt, metrics, **DETERMINISTIC
+                )
+                assert [c async for c in chunks]
+                caches.append(metrics.cache)
+        finally:
+            await client.close()
+        return caches
+
+    assert asyncio.run(main()) == ["miss", "hit"]
+    assert mock.stats()["requests"] == 1
+
+
+def test_least_recently_used_entry_is_replaced():
+    cache = SemanticCache(max_entries=2, threshold=0.99)
+    a, b, c = unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)
+    cache.add(1, "a", a, [{"response": "A", "done": True}])
+    cache.add(1, "b", b, [{"response": "B", "done": True}])
+    assert cache.lookup(1, a) is not None  # a is now more recent than b
+    cache.add(1, "c", c, [{"response": "C", "done": True}])
+    assert cache.lookup(1, b) is None
+    assert cache.lookup(1, a)[0]["response"] == "A"
+    assert cache.lookup(1, c)[0]["response"] == "C"
+
+
+def test_expired_entries_stop_matching():
+    cache = SemanticCache(ttl=60)
+    vector = unit(1, 2, 3)
+    cache.add(1, "q", vector, [{"done": True}])
+    cache.created[:] = time.time() - 120
+    assert cache.lookup(1, vector) is None
+
+
+def test_stored_answers_survive_a_restart(tmp_path):
+    vector = unit(1, 2, 3)
+    cache = SemanticCache(tmp_path, max_entries=8)
+    cache.add(1, "q", vector, [{"response": "A", "done": True, "context": [9]}])
+    cache.close()
+    cache = SemanticCache(tmp_path, max_entries=8)
+    assert cache.lookup(1, vector) == [{"response": "A", "done": True}]
+
+
+def test_missing_vector_file_starts_over(tmp_path):
+    vector = unit(1, 2, 3)
+    cache = SemanticCache(tmp_path, max_entries=8)
+    cache.add(1, "q", vector, [{"done": True}])
+    cache.close()
+    os.remove(tmp_path / "vectors.f32")
+    cache = SemanticCache(tmp_path, max_entries=8)
+    assert cache.stats()["entries"] == 0
+    assert cache.lookup(1, vector) is None
+    cache.add(1, "q", vector, [{"done": True}])
+    assert cache.lookup(1, vector) is not None